@@ -0,0 +1,25 @@
+'''
+This file is part of libsoundannotator. The library libsoundannotator is
+designed for processing sound using time-frequency representations.
+
+Copyright 2011-2014 Sensory Cognition Group, University of Groningen
+Copyright 2014-2017 SoundAppraisal BV
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+'''
+Benchmarks of libsoundannotator.
+
+    pipeline    real time factor, CPU, memory and latency of whole pipelines
+    kernels     timings of the computational kernels on their own, outside multiprocessing
+'''
@@ -0,0 +1,429 @@
+'''
+This file is part of libsoundannotator. The library libsoundannotator is
+designed for processing sound using time-frequency representations.
+
+Copyright 2011-2014 Sensory Cognition Group, University of Groningen
+Copyright 2014-2017 SoundAppraisal BV
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+'''
+Kernel benchmarks.
+
+Times the computational kernels of the pipeline on their own, in the main
+process and without a Board, over a grid of input sizes:
+
+    oafilterbank.process1D      overlap and add with a single filter, numpy and fftw
+    oafilterbank.process2D      overlap and add with a gammachirp filterbank, numpy and fftw
+    gcfilterbank.recalculate    calculation of the gammachirp filterbank
+    structure.calc_tract        tract and pattern values, per texture type
+    patch.calcPatches           connected component labelling of the quantized levels
+    patch.newPatches            labelling plus descriptor extraction into Patch objects
+    patch.joinpatches           joining patches over a chunk boundary
+    ptn.calcPTNFeatures         pulse, tone, noise and energy of a single block
+    compositor.inject           injecting the chunks of a composite until it is processed
+    compositor.alignIncomingChunks  the alignment part of processing a composite
+
+Every measurement repeats the kernel on fresh input prepared outside the
+timed section and reports the min, median, mean and max seconds per call
+and the number of units (samples, frames or composites) per second. The
+fftw variants are reported as skipped where fftw3 is not installed.
+
+Results are written as JSON together with a description of the machine,
+compare lists the ratios of the medians of two result files.
+
+Usage:
+    python -m libsoundannotator.benchmarks.kernels --output new.json
+    python -m libsoundannotator.benchmarks.kernels --kernel structure.calc_tract patch.newPatches --repeat 50
+    python -m libsoundannotator.benchmarks.kernels --compare old.json new.json
+'''
+import argparse, contextlib, json, logging, os, shutil, sys, tempfile, time, timeit
+import numpy as np
+from scipy.ndimage import uniform_filter
+
+from libsoundannotator.streamboard              import processor
+from libsoundannotator.streamboard.continuity   import Continuity, chunkAlignment, processorAlignment
+from libsoundannotator.streamboard.compositor   import DataChunk, compositeManager
+from libsoundannotator.cpsp                     import oafilterbank_numpy, structureExtractor
+from libsoundannotator.cpsp.tfprocessor         import GCFilterBank
+from libsoundannotator.cpsp.patchProcessor      import patchProcessorCore, textureQuantizer
+from libsoundannotator.cpsp.PTN_Processor       import PTN_Processor
+from libsoundannotator.benchmarks.pipeline      import machine
+
+logger = logging.getLogger('libsoundannotator')
+
+timer = timeit.default_timer
+
+# The filterbank runs on the resampled signal, the later stages on its frames
+samplerate = 8820
+framerate = 1764
+noofscales = 100
+maxdelay = 20
+resamplerFilterLength = 60
+
+
+def field(scales, frames, seed=0, mean=60., spread=30., smoothing=(3, 9)):
+    """ A smooth random time scale representation, in the range of the
+        EdB values of a GCFBProcessor by default.
+    """
+    rng = np.random.RandomState(seed)
+    smooth = uniform_filter(rng.randn(scales, frames), smoothing)
+    return mean + spread*smooth/np.std(smooth)
+
+def inProcess(processorClass, name, logdir, **parameters):
+    """ A processor without board connection, run in this process by calling
+        its methods directly.
+    """
+    instance = processorClass(None, name, logdir=logdir, loglevel=logging.WARNING, **parameters)
+    instance.prerun()
+    return instance
+
+
+class KernelFilterbank(object):
+    """ Mixin giving an OAFilterbank the filter to benchmark
+    """
+    def __init__(self, boardConn, name, filter_t, *args, **kwargs):
+        super(KernelFilterbank, self).__init__(boardConn, name, *args, **kwargs)
+        self.filter_t = filter_t
+
+    def setProcessorAlignments(self):
+        self.processorAlignments = dict()
+
+class NumpyFilterbank(KernelFilterbank, oafilterbank_numpy.OAFilterbank):
+    pass
+
+def filterbankClass(variant):
+    if variant == 'numpy':
+        return NumpyFilterbank
+    # Importing the fftw variant does not need fftw3, creating one does
+    from libsoundannotator.cpsp import oafilterbank
+    class FftwFilterbank(KernelFilterbank, oafilterbank.OAFilterbank):
+        pass
+    return FftwFilterbank
+
+
+class Skipped(Exception):
+    pass
+
+
+class Context(object):
+    """ Shared by the kernels of a run: a log directory for the processors
+        and calibrated extractors.
+    """
+    def __init__(self, logdir):
+        self.logdir = logdir
+        self.extractors = dict()
+
+    def structureExtractor(self, scales):
+        if not scales in self.extractors:
+            extractor = structureExtractor.structureExtractor(False)
+            extractor.initialize(field(scales, 3000, seed=1), maxdelay)
+            self.extractors[scales] = extractor
+        return self.extractors[scales]
+
+
+def filterbank(context, variant, samples, nseg=None):
+    """ process1D on a resampler sized filter, or process2D on a gammachirp
+        filterbank with nseg segments.
+    """
+    if nseg is None:
+        filter_t = np.hanning(resamplerFilterLength).astype(np.float32)
+        types = {'dTypeIn': np.float32, 'dTypeOut': np.complex64}
+    else:
+        filter_t = GCFilterBank({'nseg': nseg, 'SampleRate': samplerate, 'fmax': 0.45*samplerate}).getFilterBank()
+        types = {'dTypeIn': np.complex64, 'dTypeOut': np.complex64}
+    try:
+        instance = inProcess(filterbankClass(variant), 'filterbank', context.logdir, filter_t=filter_t, SampleRate=samplerate, **types)
+    except ImportError as e:
+        raise Skipped('fftw3 is not available: {0}'.format(e))
+    instance.reset()
+
+    signal = np.random.RandomState(0).randn(samples).astype(types['dTypeIn'])
+    process = instance.process1D if nseg is None else instance.process2D
+    return lambda: (lambda: process(signal, Continuity.withprevious))
+
+def process1D(context, variant, samples):
+    return filterbank(context, variant, samples)
+
+def process2D(context, variant, samples, nseg):
+    return filterbank(context, variant, samples, nseg)
+
+def recalculate(context, variant, nseg, samplerate):
+    factory = GCFilterBank({'nseg': nseg, 'SampleRate': samplerate, 'fmax': 0.45*samplerate})
+    return lambda: factory.recalculate
+
+def calc_tract(context, variant, frames):
+    extractor = context.structureExtractor(noofscales)
+    data = field(noofscales, frames)
+    def prepare():
+        texture = np.zeros(np.shape(data), dtype='double')
+        pattern = np.zeros(np.shape(data), dtype='double')
+        return lambda: extractor.calc_tract(data, texture, pattern, variant)
+    return prepare
+
+def tract(frames):
+    """ Tract values smooth enough in time to give patches spanning many frames
+    """
+    return field(noofscales, frames, mean=40., smoothing=(9, 200))
+
+def patchCore(context):
+    core = patchProcessorCore(quantizer=textureQuantizer(), noofscales=noofscales, logger=logger,
+        SampleRate=framerate, PatchType='benchmark')
+    core.prerun()
+    return core
+
+def tractChunk(data, number, continuity):
+    return DataChunk(data, 0.0, framerate, 'structure', set(['structure']), continuity=continuity,
+        number=number, initialSampleTime=0)
+
+def calcPatches(context, variant, frames):
+    core = patchCore(context)
+    levels = core.quantizer.levels(tract(frames))
+    def prepare():
+        patchMatrix = np.zeros(np.shape(levels), 'int32')
+        return lambda: core.extractor.cpp_calcPatches(levels, patchMatrix)
+    return prepare
+
+def newPatches(context, variant, frames):
+    core = patchCore(context)
+    data = tract(frames)
+    return lambda: (lambda: core.newPatches(data, 0.0, 1, 'benchmark'))
+
+def joinpatches(context, variant, frames):
+    data = tract(2*frames)
+    def prepare():
+        core = patchCore(context)
+        core.processData(tractChunk(data[:, :frames], 1, Continuity.newfile))
+        core.newPatches(data[:, frames:], 0.0, 2, 'benchmark')
+        return core.joinpatches
+    return prepare
+
+def calcPTNFeatures(context, variant, frames):
+    ptn = inProcess(PTN_Processor, 'ptn', context.logdir, SampleRate=framerate, noofscales=noofscales,
+        split=list(np.linspace(0, noofscales, 5).astype(int)), blockwidth=frames/float(framerate))
+    currentdata = {
+        'E': 10**(field(noofscales, frames)/10.),
+        'f_tract': field(noofscales, frames, seed=1, mean=40.),
+        's_tract': field(noofscales, frames, seed=2, mean=40.),
+    }
+    return lambda: (lambda: ptn.calcPTNFeatures(currentdata, 1, 0))
+
+
+class CompositeSink(processor.Processor):
+    """ Processor with trivial processData, what remains is the work of its
+        compositeManager.
+    """
+    def __init__(self, boardConn, name, *args, **kwargs):
+        super(CompositeSink, self).__init__(boardConn, name, *args, **kwargs)
+        self.requiredParameters('requiredKeys')
+        self.requiredKeys = self.config['requiredKeys']
+
+    def prerun(self):
+        super(CompositeSink, self).prerun()
+        self.processorAlignments = dict([(key, processorAlignment(fsampling=framerate)) for key in self.requiredKeys])
+
+    def processData(self, compositeChunk):
+        return {'frames': compositeChunk.received[self.requiredKeys[0]].data}
+
+
+class AlignmentTimer(compositeManager):
+    """ compositeManager adding up the time spent in alignIncomingChunks
+    """
+    def __init__(self, *args, **kwargs):
+        super(AlignmentTimer, self).__init__(*args, **kwargs)
+        self.alignSeconds = 0.
+
+    def alignIncomingChunks(self, *args, **kwargs):
+        start = timer()
+        result = super(AlignmentTimer, self).alignIncomingChunks(*args, **kwargs)
+        self.alignSeconds += timer() - start
+        return result
+
+compositesPerCall = 10
+
+def compositor(context, keys, frames, alignment=False):
+    """ Inject compositesPerCall composites of keys chunks each, with alignment
+        return the time spent aligning them.
+    """
+    requiredKeys = ['key{0}'.format(key) for key in range(keys)]
+    sink = inProcess(CompositeSink, 'compositor', context.logdir, requiredKeys=requiredKeys)
+    data = field(noofscales, frames)
+    def prepare():
+        manager = AlignmentTimer(requiredKeys, sink)
+        chunks = list()
+        for number in range(1, compositesPerCall+1):
+            continuity = Continuity.newfile if number == 1 else Continuity.withprevious
+            for key in requiredKeys:
+                chunk = DataChunk(data, number*frames/float(framerate), framerate, 'source', set(['source']),
+                    continuity=continuity, number=number, alignment=chunkAlignment(fsampling=framerate),
+                    dataGenerationTime={'source': time.time()}, initialSampleTime=(number-1)*frames)
+                chunks.append((key, chunk))
+        def inject():
+            for (key, chunk) in chunks:
+                manager.inject(key, chunk)
+            if alignment:
+                return manager.alignSeconds
+        return inject
+    return prepare
+
+def inject(context, variant, keys, frames):
+    return compositor(context, keys, frames)
+
+def alignIncomingChunks(context, variant, keys, frames):
+    return compositor(context, keys, frames, alignment=True)
+
+
+def grid(**parameters):
+    """ All combinations of the parameter values, as dicts
+    """
+    combinations = [dict()]
+    for (name, values) in sorted(parameters.items()):
+        combinations = [dict(combination, **{name: value}) for combination in combinations for value in values]
+    return combinations
+
+# Name, function, variants, parameter grid and the parameter, or the number, giving the units per call
+kernels = [
+    ('oafilterbank.process1D', process1D, ['numpy', 'fftw'], grid(samples=[1024, 4096, 16384, 65536]), 'samples'),
+    ('oafilterbank.process2D', process2D, ['numpy', 'fftw'], grid(samples=[4096, 16384], nseg=[50, 100, 200]), 'samples'),
+    ('gcfilterbank.recalculate', recalculate, [None], grid(nseg=[50, 100, 200], samplerate=[8820, 16000]), 1),
+    ('structure.calc_tract', calc_tract, ['f', 'u', 's', 'd'], grid(frames=[200, 800, 3200]), 'frames'),
+    ('patch.calcPatches', calcPatches, [None], grid(frames=[200, 800, 3200]), 'frames'),
+    ('patch.newPatches', newPatches, [None], grid(frames=[200, 800, 3200]), 'frames'),
+    ('patch.joinpatches', joinpatches, [None], grid(frames=[200, 800, 3200]), 'frames'),
+    ('ptn.calcPTNFeatures', calcPTNFeatures, [None], grid(frames=[50, 200, 800]), 'frames'),
+    ('compositor.inject', inject, [None], grid(keys=[1, 2, 4], frames=[100, 1000]), compositesPerCall),
+    ('compositor.alignIncomingChunks', alignIncomingChunks, [None], grid(keys=[1, 2, 4], frames=[100, 1000]), compositesPerCall),
+]
+
+@contextlib.contextmanager
+def silenced():
+    """ Some kernels print progress, keep it out of the report
+    """
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        yield
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+def timeKernel(prepare, repeat):
+    """ Seconds per call of the kernels returned by prepare, which is called
+        before every call and not timed. A kernel timing part of its work
+        itself returns the seconds spent on that part. The first call warms
+        up caches and is left out.
+    """
+    times = list()
+    for iteration in range(repeat+1):
+        kernel = prepare()
+        start = timer()
+        seconds = kernel()
+        end = timer()
+        times.append(seconds if isinstance(seconds, float) else end - start)
+    times = np.array(times[1:])
+    return {'min': float(np.min(times)), 'median': float(np.median(times)), 'mean': float(np.mean(times)),
+        'max': float(np.max(times))}
+
+def runKernels(selected=None, repeat=20, logdir=None):
+    """ Run the selected kernels, all by default, over their parameter grids,
+        returns the results as a dict ready to be saved as JSON.
+    """
+    cleanup = logdir is None
+    logdir = logdir or tempfile.mkdtemp(prefix='libsoundannotator-kernels-')
+    context = Context(logdir)
+    results = {'started': time.strftime('%Y-%m-%dT%H:%M:%S'), 'machine': machine(), 'repeat': repeat, 'kernels': list()}
+    try:
+        for (name, function, variants, parameterGrid, units) in kernels:
+            if selected and not name in selected:
+                continue
+            for variant in variants:
+                for parameters in parameterGrid:
+                    measurement = {'kernel': name, 'variant': variant, 'parameters': parameters}
+                    logger.info('Timing {0} {1} {2}'.format(name, variant or '', parameters))
+                    try:
+                        with silenced():
+                            seconds = timeKernel(function(context, variant, **parameters), repeat)
+                    except Skipped as e:
+                        measurement['skipped'] = str(e)
+                    else:
+                        measurement['seconds'] = seconds
+                        count = parameters[units] if isinstance(units, str) else units
+                        measurement['unitsPerSecond'] = count/seconds['median']
+                    results['kernels'].append(measurement)
+    finally:
+        if cleanup:
+            shutil.rmtree(logdir, ignore_errors=True)
+    return results
+
+
+def measurementKey(measurement):
+    return (measurement['kernel'], measurement['variant'], tuple(sorted(measurement['parameters'].items())))
+
+def describe(measurement):
+    description = measurement['kernel']
+    if measurement['variant'] is not None:
+        description += ' ' + measurement['variant']
+    return description + ' ' + ' '.join(['{0}={1}'.format(name, value) for (name, value) in sorted(measurement['parameters'].items())])
+
+def compare(baseline, results):
+    """ Lines comparing the medians of the measurements found in both result
+        dicts, ratios above 1 mean the new results are slower.
+    """
+    old = dict([(measurementKey(measurement), measurement) for measurement in baseline['kernels'] if 'seconds' in measurement])
+    lines = ['{0:<56} {1:>12} {2:>8}'.format('kernel', 'median ms', 'ratio')]
+    for measurement in results['kernels']:
+        key = measurementKey(measurement)
+        if not 'seconds' in measurement or not key in old:
+            continue
+        lines.append('{0:<56} {1:>12.3f} {2:>8.2f}'.format(describe(measurement)[:56], 1e3*measurement['seconds']['median'],
+            measurement['seconds']['median']/old[key]['seconds']['median']))
+    return lines
+
+def report(results):
+    lines = list()
+    for measurement in results['kernels']:
+        if 'skipped' in measurement:
+            lines.append('{0}: skipped, {1}'.format(describe(measurement), measurement['skipped']))
+            continue
+        lines.append('{0}: median {1:.3f} ms, min {2:.3f} ms, {3:.4g} per second'.format(describe(measurement),
+            1e3*measurement['seconds']['median'], 1e3*measurement['seconds']['min'], measurement['unitsPerSecond']))
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the kernels of libsoundannotator')
+    parser.add_argument('--kernel', nargs='+', choices=[kernel[0] for kernel in kernels], help='kernels to time, all by default')
+    parser.add_argument('--repeat', type=int, default=20, help='timed calls per measurement')
+    parser.add_argument('--output', help='file to save the results to as JSON')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'RESULTS'), help='compare two result files and exit')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            baseline = json.load(f)
+        with open(args.compare[1]) as f:
+            results = json.load(f)
+        print '\n'.join(compare(baseline, results))
+        return 0
+
+    logging.basicConfig(level=logging.INFO)
+    results = runKernels(args.kernel, args.repeat)
+    print '\n'.join(report(results))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
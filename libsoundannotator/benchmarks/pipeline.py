@@ -0,0 +1,483 @@
+'''
+This file is part of libsoundannotator. The library libsoundannotator is
+designed for processing sound using time-frequency representations.
+
+Copyright 2011-2014 Sensory Cognition Group, University of Groningen
+Copyright 2014-2017 SoundAppraisal BV
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+'''
+Pipeline benchmarks.
+
+Runs the canonical pipeline
+
+    WavProcessor -> Resampler -> GCFBProcessor -> structureProcessor -> PTN_Processor
+                                              \\-> PTN_Processor      \\-> patchProcessor
+
+on a synthetic recording, or on given wav files, for every combination of
+chunk size, number of filterbank segments (nseg) and number of streams,
+pipelines running side by side on one Board, and reports per combination:
+
+    realTimeFactor      wall clock time over the duration of the audio, below 1 is faster than real time
+    throughput          seconds of audio processed per second, over all streams
+    stages              CPU seconds per second of audio and peak resident set size in MB of every stage
+    latencyMs           time from the wav reader publishing a chunk until the output of PTN_Processor
+                        or patchProcessor based on it reaches the main process: mean, p50, p95 and max
+
+By default the wav readers run offline, as fast as the pipelines take the
+chunks, which measures throughput. With paced=True they publish in real time
+and the latency no longer includes waiting behind a backlog.
+
+structureProcessor needs calibration, which is done once per sample rate and
+nseg on a chunk of noise and cached in the work directory.
+
+Results are written as JSON together with the version of libsoundannotator
+and a description of the machine, compare lists the changes between two
+result files.
+
+Usage:
+    python -m libsoundannotator.benchmarks.pipeline --chunksize 8192 16384 --nseg 50 100 --streams 1 2 --output new.json
+    python -m libsoundannotator.benchmarks.pipeline --compare old.json new.json
+'''
+import argparse, json, logging, os, platform, select, socket, sys, tempfile, time, wave
+import numpy as np
+import psutil
+
+from libsoundannotator.streamboard.board        import Board
+from libsoundannotator.streamboard.graph        import PipelineGraph
+from libsoundannotator.streamboard.subscription import SubscriptionOrder
+from libsoundannotator.streamboard.continuity   import Continuity
+from libsoundannotator.streamboard.messages     import ProcessorMessage
+from libsoundannotator.streamboard.processors.input.noise import NoiseChunkGenerator
+from libsoundannotator.cpsp.oafilterbank_numpy  import Resampler
+from libsoundannotator.cpsp.tfprocessor         import GCFBProcessor, GCFilterBank
+from libsoundannotator.cpsp.structureProcessor  import structureProcessorCalibrator
+from libsoundannotator.cpsp.patchProcessor      import textureQuantizer
+from libsoundannotator.io.annotations           import FileAnnotation
+from _multiprocessing import Connection
+
+logger = logging.getLogger('libsoundannotator')
+
+stages = ['wav', 'resampler', 'gcfb', 'structure', 'ptn', 'patch']
+
+# Keys of the last stages the main process listens to. PTN_Processor numbers its blocks
+# itself and does not pass on the last chunk, the end of a stream shows at patchProcessor.
+sinks = {'ptn': 'energy', 'patch': 'levels'}
+endOfStream = 'patch'
+
+decimation = 5
+resamplerFilterLength = 60
+samplesPerFrame = 5
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+def synthesize(filename, samplerate=44100, duration=10.0, seed=0):
+    """ Write a recording with the pulses, tones and noise the PTN features
+        distinguish: a click every 250 ms, a sweep, a tone switched on and
+        off every second and background noise.
+    """
+    rng = np.random.RandomState(seed)
+    t = np.arange(int(duration*samplerate))/float(samplerate)
+    signal = 0.05*rng.randn(len(t))
+    signal += 0.3*np.sin(2*np.pi*(200. + 100.*t/duration)*t)
+    signal += 0.2*np.sin(2*np.pi*1000.*t)*(np.sin(np.pi*t) > 0)
+    signal[(np.arange(len(t)) % int(0.25*samplerate)) < int(0.002*samplerate)] += 0.8
+
+    writer = wave.open(filename, 'wb')
+    writer.setnchannels(1)
+    writer.setsampwidth(2)
+    writer.setframerate(samplerate)
+    writer.writeframes((32767*signal/np.max(np.abs(signal))).astype(np.int16).tostring())
+    writer.close()
+
+def soundfileInfo(filename):
+    """ Sample rate and duration in seconds of a wav file
+    """
+    reader = wave.open(filename)
+    try:
+        return reader.getframerate(), reader.getnframes()/float(reader.getframerate())
+    finally:
+        reader.close()
+
+def processorName(stage, stream):
+    return '{0}-{1}'.format(stage, stream)
+
+# getMetaData of the numpy filterbanks reports these types
+filterbankTypes = {'dTypeIn': np.float32, 'dTypeOut': np.complex64}
+
+def resamplerParameters(samplerate):
+    return dict(filterbankTypes, SampleRate=samplerate, DecimateFactor=decimation, FilterLength=resamplerFilterLength)
+
+def gcfbParameters(samplerate, nseg):
+    rate = samplerate/float(decimation)
+    return dict(filterbankTypes, SampleRate=rate, nseg=nseg, fmax=min(4000, 0.45*rate), samplesPerFrame=samplesPerFrame)
+
+def pipelineSpec(soundfile, samplerate, chunksize, nseg, cachename, stream=0, paced=False):
+    """ PipelineGraph spec of the canonical pipeline for a single stream,
+        the names of the processors end in the number of the stream.
+    """
+    name = lambda stage: processorName(stage, stream)
+    framerate = samplerate/float(decimation*samplesPerFrame)
+
+    def subscription(stage, senderKey, receiverKey):
+        return {'from': name(stage), 'senderKey': senderKey, 'receiverKey': receiverKey}
+
+    return {'processors': [
+        {'name': name('wav'), 'class': 'libsoundannotator.streamboard.processors.input.wav.WavProcessor',
+         'parameters': {'SoundFiles': [FileAnnotation(soundfile, os.path.basename(soundfile))], 'SampleRate': samplerate,
+            'ChunkSize': chunksize, 'timestep': chunksize/float(samplerate) if paced else 0.0,
+            'offline': not paced, 'startLatency': 0.5}},
+        {'name': name('resampler'), 'class': 'libsoundannotator.cpsp.oafilterbank_numpy.Resampler',
+         'inputs': [subscription('wav', 'sound', 'timeseries')],
+         'parameters': resamplerParameters(samplerate)},
+        {'name': name('gcfb'), 'class': 'libsoundannotator.cpsp.tfprocessor.GCFBProcessor',
+         'inputs': [subscription('resampler', 'timeseries', 'timeseries')],
+         'parameters': gcfbParameters(samplerate, nseg)},
+        {'name': name('structure'), 'class': 'libsoundannotator.cpsp.structureProcessor.structureProcessor',
+         'inputs': [subscription('gcfb', 'EdB', 'TSRep')],
+         'parameters': {'SampleRate': framerate, 'noofscales': nseg, 'cachename': cachename}},
+        {'name': name('ptn'), 'class': 'libsoundannotator.cpsp.PTN_Processor.PTN_Processor',
+         'inputs': [subscription('gcfb', 'E', 'E'), subscription('structure', 'f_tract', 'f_tract'),
+            subscription('structure', 's_tract', 's_tract')],
+         'parameters': {'SampleRate': framerate, 'noofscales': nseg, 'blockwidth': 0.5,
+            'split': [int(split) for split in np.linspace(0, nseg, 5)]}},
+        {'name': name('patch'), 'class': 'libsoundannotator.cpsp.patchProcessor.patchProcessor',
+         'inputs': [subscription('structure', 'f_tract', 'TSRep')],
+         'parameters': {'SampleRate': framerate, 'noofscales': nseg, 'TS_Rep': 'f_tract', 'quantizer': textureQuantizer()}},
+    ]}
+
+
+def checkBoard(board):
+    """ Raise a BenchmarkError when a processor reported an error or died
+    """
+    for (name, (instance, connection)) in board.processors.items():
+        if not type(connection) == Connection:
+            continue
+        while connection.poll(0):
+            message = connection.recv()
+            if isinstance(message, ProcessorMessage) and message.getType() == ProcessorMessage.error:
+                raise BenchmarkError('Processor {0} failed: {1}'.format(name, message.getContents()))
+        if not instance.is_alive() and instance.exitcode not in (0, None):
+            raise BenchmarkError('Processor {0} died with exit code {1}'.format(name, instance.exitcode))
+
+def stopBoard(board):
+    board.stopallprocessors()
+    for (instance, connection) in board.processors.values():
+        if type(connection) == Connection:
+            instance.join(10)
+            if instance.is_alive():
+                instance.terminate()
+    board.logger.removeHandler(board.handler)
+    board.handler.close()
+
+def calibrate(workdir, samplerate, nseg, duration=3.0, timeout=120.0):
+    """ Calibrate structureProcessor for the pipeline on a chunk of noise,
+        returns the cachename to pass to it.
+    """
+    cachename = os.path.join(workdir, 'structure-{0}-{1}'.format(samplerate, nseg))
+    if os.path.exists(cachename + '.cache'):
+        return cachename
+
+    gcfb = gcfbParameters(samplerate, nseg)
+    board = Board(loglevel=logging.WARNING, logdir=workdir, logfile='calibration')
+    try:
+        board.startProcessor('noise', NoiseChunkGenerator, SampleRate=samplerate, ChunkSize=int(duration*samplerate),
+            noofchunks=1, calibration=True)
+        board.startProcessor('resampler', Resampler, SubscriptionOrder('noise', 'resampler', 'sound', 'timeseries'),
+            **resamplerParameters(samplerate))
+        board.startProcessor('gcfb', GCFBProcessor, SubscriptionOrder('resampler', 'gcfb', 'timeseries', 'timeseries'), **gcfb)
+        board.startProcessor('calibrator', structureProcessorCalibrator, SubscriptionOrder('gcfb', 'calibrator', 'EdB', 'TSRep'),
+            SampleRate=gcfb['SampleRate']/samplesPerFrame, noofscales=nseg, cachename=cachename)
+        subscription = board.getConnectionToProcessor(SubscriptionOrder('calibrator', 'benchmark', 'cacheCreated', 'cacheCreated'))
+        subscription.riseConnection(board.logger)
+
+        deadline = time.time() + timeout
+        while not subscription.connection.poll(0.1):
+            checkBoard(board)
+            if time.time() > deadline:
+                raise BenchmarkError('Calibration for nseg {0} took more than {1} seconds'.format(nseg, timeout))
+    finally:
+        # The cache is complete once the calibrator has exited
+        stopBoard(board)
+
+    return cachename
+
+
+def cpuSeconds(process):
+    times = process.cpu_times()
+    return times.user + times.system
+
+def sampleUsage(processes, usage):
+    """ Update usage with the CPU seconds and peak RSS of every process.
+        Readers exit after their last chunk, their last sample is kept.
+    """
+    for (key, process) in processes.items():
+        try:
+            if process.status() == psutil.STATUS_ZOMBIE:
+                continue
+            usage[key] = (cpuSeconds(process), peakRSS(process))
+        except psutil.NoSuchProcess:
+            continue
+
+def peakRSS(process):
+    """ Peak resident set size of a process in bytes, the current one where
+        the peak is not available.
+    """
+    try:
+        with open('/proc/{0}/status'.format(process.pid)) as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])*1024
+    except IOError:
+        pass
+    return process.memory_info().rss
+
+def latencySummary(latencies):
+    if len(latencies) == 0:
+        return {'count': 0}
+    latencies = 1e3*np.array(latencies)
+    return {'count': len(latencies), 'mean': float(np.mean(latencies)), 'p50': float(np.percentile(latencies, 50)),
+        'p95': float(np.percentile(latencies, 95)), 'max': float(np.max(latencies))}
+
+def runConfiguration(soundfile, chunksize, nseg, streams, workdir, paced=False, timeout=600.0):
+    """ Run streams pipelines on soundfile side by side until all have
+        published their last chunk, returns the measurements as a dict.
+    """
+    (samplerate, duration) = soundfileInfo(soundfile)
+
+    # The filters need the first chunk of a file to be longer than their impulse responses
+    minimum = (GCFilterBank(gcfbParameters(samplerate, nseg)).getChirpLength() + 1)*decimation + resamplerFilterLength
+    if chunksize <= minimum:
+        raise BenchmarkError('Chunks of {0} samples are too short for the filters, use more than {1}'.format(chunksize, minimum))
+
+    cachename = calibrate(workdir, samplerate, nseg)
+
+    spec = {'processors': list()}
+    for stream in range(streams):
+        spec['processors'].extend(pipelineSpec(soundfile, samplerate, chunksize, nseg, cachename, stream, paced)['processors'])
+    graph = PipelineGraph(spec)
+
+    board = Board(loglevel=logging.WARNING, logdir=workdir, logfile='benchmark')
+    try:
+        # Pipelines are left to the scheduler, as they would be without a placement in the graph
+        graph.start(board, place=False)
+
+        subscriptions = dict()
+        for stream in range(streams):
+            for (stage, key) in sinks.items():
+                subscription = board.getConnectionToProcessor(SubscriptionOrder(processorName(stage, stream), 'benchmark', key, key))
+                subscription.riseConnection(board.logger)
+                subscriptions[subscription.connection.fileno()] = (subscription, stream, stage)
+
+        processes = dict()
+        for stream in range(streams):
+            for stage in stages:
+                processes[(stage, stream)] = psutil.Process(board.processors[processorName(stage, stream)][0].pid)
+        usage = dict()
+        sampleUsage(processes, usage)
+        cpuBefore = dict([(key, cpu) for (key, (cpu, rss)) in usage.items()])
+
+        # Paced readers start by themselves after their startLatency, in real time by design
+        started = time.time()
+        if not paced:
+            for stream in range(streams):
+                board.startStreaming(processorName('wav', stream))
+
+        latencies = list()
+        pending = set([fd for fd in subscriptions if subscriptions[fd][2] == endOfStream])
+        deadline = time.time() + timeout
+        checked = time.time()
+        while len(pending) > 0:
+            (ready, _, _) = select.select(subscriptions.keys(), [], [], 0.1)
+            for fd in ready:
+                (subscription, stream, stage) = subscriptions[fd]
+                while subscription.connection.poll(0):
+                    chunk = subscription.connection.recv()
+                    received = time.time()
+                    if chunk.continuity == Continuity.last:
+                        pending.discard(fd)
+                        break
+                    generated = chunk.dataGenerationTime.get(processorName('wav', stream), min(chunk.dataGenerationTime.values()))
+                    latencies.append(received - generated)
+
+            sampleUsage(processes, usage)
+
+            if time.time() - checked > 0.5:
+                checkBoard(board)
+                checked = time.time()
+            if time.time() > deadline:
+                raise BenchmarkError('Pipelines took more than {0} seconds'.format(timeout))
+
+        finished = time.time()
+        sampleUsage(processes, usage)
+        cpu = dict([(key, usage[key][0] - cpuBefore[key]) for key in processes])
+        rss = dict([(key, usage[key][1]) for key in processes])
+    finally:
+        stopBoard(board)
+
+    if len(latencies) == 0:
+        raise BenchmarkError('The pipelines published no output')
+
+    wall = finished - started
+    measurements = {
+        'soundfile': os.path.basename(soundfile),
+        'samplerate': samplerate,
+        'chunksize': chunksize,
+        'nseg': nseg,
+        'streams': streams,
+        'paced': paced,
+        'audioSeconds': duration*streams,
+        'wallSeconds': wall,
+        'realTimeFactor': wall/duration,
+        'throughput': duration*streams/wall,
+        'latencyMs': latencySummary(latencies),
+        'stages': dict(),
+    }
+    for stage in stages:
+        stagecpu = sum([cpu[(stage, stream)] for stream in range(streams)])
+        measurements['stages'][stage] = {
+            'cpuSeconds': stagecpu,
+            'cpuPerAudioSecond': stagecpu/(duration*streams),
+            'peakRSSMB': max([rss[(stage, stream)] for stream in range(streams)])/2.0**20,
+        }
+    return measurements
+
+
+def machine():
+    """ Description of the machine and the software the benchmarks ran with
+    """
+    description = {
+        'hostname': socket.gethostname(),
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpus': psutil.cpu_count(),
+        'memoryMB': psutil.virtual_memory().total/2**20,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+    }
+    try:
+        from libsoundannotator.config import runtimeMetaData
+        description['libsoundannotator'] = runtimeMetaData.version
+        description['outputPathModifier'] = runtimeMetaData.outputPathModifier
+    except (ImportError, AttributeError):
+        description['libsoundannotator'] = 'unknown'
+    return description
+
+def runGrid(soundfiles, chunksizes, nsegs, streamcounts, paced=False, workdir=None, timeout=600.0):
+    """ Run every combination of soundfile, chunk size, nseg and number of
+        streams, returns the results as a dict ready to be saved as JSON.
+    """
+    workdir = workdir or tempfile.mkdtemp(prefix='libsoundannotator-benchmark-')
+    results = {'started': time.strftime('%Y-%m-%dT%H:%M:%S'), 'machine': machine(), 'configurations': list()}
+    for soundfile in soundfiles:
+        for nseg in nsegs:
+            for chunksize in chunksizes:
+                for streams in streamcounts:
+                    logger.info('Benchmarking {0} chunksize {1} nseg {2} streams {3}'.format(soundfile, chunksize, nseg, streams))
+                    try:
+                        measurements = runConfiguration(soundfile, chunksize, nseg, streams, workdir, paced, timeout)
+                    except BenchmarkError as e:
+                        logger.error('Benchmark failed: {0}'.format(e))
+                        measurements = {'soundfile': os.path.basename(soundfile), 'chunksize': chunksize, 'nseg': nseg,
+                            'streams': streams, 'paced': paced, 'error': str(e)}
+                    results['configurations'].append(measurements)
+    return results
+
+
+def configurationKey(configuration):
+    return (configuration['soundfile'], configuration['chunksize'], configuration['nseg'], configuration['streams'], configuration['paced'])
+
+def totalCPU(configuration):
+    return sum([stage['cpuPerAudioSecond'] for stage in configuration['stages'].values()])
+
+def compare(baseline, results):
+    """ Lines comparing the configurations found in both result dicts,
+        ratios above 1 mean the new results are slower or larger.
+    """
+    old = dict([(configurationKey(configuration), configuration) for configuration in baseline['configurations']
+        if not 'error' in configuration])
+    lines = ['{0:<24} {1:>9} {2:>5} {3:>7} {4:>10} {5:>10} {6:>10} {7:>10}'.format(
+        'soundfile', 'chunksize', 'nseg', 'streams', 'RTF', 'ratio', 'cpu ratio', 'p95 ratio')]
+    for configuration in results['configurations']:
+        key = configurationKey(configuration)
+        if 'error' in configuration or not key in old:
+            continue
+        before = old[key]
+        p95 = lambda c: c['latencyMs'].get('p95', float('nan'))
+        lines.append('{0:<24} {1:>9} {2:>5} {3:>7} {4:>10.3f} {5:>10.2f} {6:>10.2f} {7:>10.2f}'.format(
+            key[0][:24], key[1], key[2], key[3], configuration['realTimeFactor'],
+            configuration['realTimeFactor']/before['realTimeFactor'], totalCPU(configuration)/totalCPU(before),
+            p95(configuration)/p95(before) if p95(before) > 0 else float('nan')))
+    return lines
+
+def report(results):
+    lines = list()
+    for configuration in results['configurations']:
+        if 'error' in configuration:
+            lines.append('{soundfile} chunksize {chunksize} nseg {nseg} streams {streams}: {error}'.format(**configuration))
+            continue
+        lines.append('{soundfile} chunksize {chunksize} nseg {nseg} streams {streams}: RTF {realTimeFactor:.3f}, '
+            '{throughput:.1f}x real time'.format(**configuration) +
+            ', latency p50 {0:.1f} ms p95 {1:.1f} ms'.format(configuration['latencyMs'].get('p50', float('nan')),
+                configuration['latencyMs'].get('p95', float('nan'))))
+        for stage in stages:
+            lines.append('    {0:<10} cpu {1:.3f} s/s  peak rss {2:.0f} MB'.format(stage,
+                configuration['stages'][stage]['cpuPerAudioSecond'], configuration['stages'][stage]['peakRSSMB']))
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the canonical libsoundannotator pipeline')
+    parser.add_argument('--wav', nargs='+', default=[], help='wav files to process, a synthetic recording by default')
+    parser.add_argument('--duration', type=float, default=30.0, help='duration in seconds of the synthetic recording')
+    parser.add_argument('--samplerate', type=int, default=44100, help='sample rate of the synthetic recording')
+    parser.add_argument('--chunksize', type=int, nargs='+', default=[8192, 16384])
+    parser.add_argument('--nseg', type=int, nargs='+', default=[100])
+    parser.add_argument('--streams', type=int, nargs='+', default=[1])
+    parser.add_argument('--paced', action='store_true', help='read the audio in real time, to measure latency')
+    parser.add_argument('--timeout', type=float, default=600.0, help='seconds allowed per configuration')
+    parser.add_argument('--workdir', help='directory for logs and calibration caches')
+    parser.add_argument('--output', help='file to save the results to as JSON')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'RESULTS'), help='compare two result files and exit')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            baseline = json.load(f)
+        with open(args.compare[1]) as f:
+            results = json.load(f)
+        print '\n'.join(compare(baseline, results))
+        return 0
+
+    logging.basicConfig(level=logging.INFO)
+    workdir = args.workdir or tempfile.mkdtemp(prefix='libsoundannotator-benchmark-')
+    soundfiles = args.wav
+    if len(soundfiles) == 0:
+        synthetic = os.path.join(workdir, 'synthetic-{0}s.wav'.format(int(args.duration)))
+        synthesize(synthetic, args.samplerate, args.duration)
+        soundfiles = [synthetic]
+
+    results = runGrid(soundfiles, args.chunksize, args.nseg, args.streams, args.paced, workdir, args.timeout)
+    print '\n'.join(report(results))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -326,7 +326,7 @@ class Resampler(OAFilterbank):
                     .format(soundData.fs, self.config['SampleRate']))
                 lowpassFiltered = self.oafilter(soundData.data, soundData.continuity)
                 data['timeseries']=self.decimate(lowpassFiltered,self.config['DecimateFactor'])
-                self.logger.info('Publish resampled data, number: {0}'.format(soundData.number))
+                self.chunklogger.info('Publish resampled data, number: %s', soundData.number)
                 return data
         return None
     
@@ -41,6 +41,10 @@ class OAFilterbank(processor.Processor):
     """ Overlap and add filter implementation. Can be used for arbitrary
         filters.
     """
+    
+    # Elements of the blocks of segments transformed together by process2D, a block of all 
+    # segments at once no longer fits the cache and is slower than a loop over segments
+    segmentBlockElements=2**16
    
 
     
@@ -81,16 +85,27 @@ class OAFilterbank(processor.Processor):
         self.nfft = int(2**n)
         self.nBlock = self.nfft - self.nOverlap
         
+        # Real signals are transformed to half spectra, with a real kernel they stay real throughout
+        self.realKernel = np.isrealobj(filter_t)
+        self.realType = np.empty(0, dtype=self.config['DataType']).real.dtype
+        
         if len(np.shape(filter_t))==1:
             self.nseg = 1
             self.kernelZ = fft.fft(filter_t,self.nfft)
+            if self.realKernel:
+                self.kernelRZ = fft.rfft(filter_t,self.nfft)
             self.overlap = np.zeros([self.nOverlap, ], dtype=self.config['DataType'])
             self.oafilter = self.process1D
             
         elif len(np.shape(filter_t)) == 2:
             self.nseg = np.shape(filter_t)[1]
-            self.kernelZ = fft.fft(filter_t,self.nfft,0)
-            self.overlap = np.zeros([self.nOverlap, self.nseg], dtype=self.config['DataType'])
+            # Segments along the rows, like the result of process2D, so all segments are convolved at once
+            self.kernelZ = np.ascontiguousarray(fft.fft(filter_t,self.nfft,0).T)
+            if self.realKernel:
+                self.kernelRZ = np.ascontiguousarray(fft.rfft(filter_t,self.nfft,0).T)
+            self.overlap = np.zeros([self.nseg, self.nOverlap], dtype=self.config['DataType'])
+            blocksize = max(1, self.segmentBlockElements//self.nfft)
+            self.segmentBlocks = [slice(seg, seg+blocksize) for seg in range(0, self.nseg, blocksize)]
             self.oafilter = self.process2D
         else: # len(np.shape(filter_t)) > 2:
             raise ValueError('Input filter should be a 1D or 2D vector')
@@ -103,11 +118,36 @@ class OAFilterbank(processor.Processor):
         if len(np.shape(self.filter_t))==1:
             self.overlap = np.zeros([self.nOverlap, ], dtype=self.config['DataType'])
         elif len(np.shape(self.filter_t)) == 2:
-            self.overlap = np.zeros([self.nOverlap, self.nseg], dtype=self.config['DataType'])
+            self.overlap = np.zeros([self.nseg, self.nOverlap], dtype=self.config['DataType'])
         else: # len(np.shape(filter_t)) > 2:
             raise ValueError('Input filter should be a 1D or 2D vector')
         self.firstBlock = True
 
+    def outputType(self, signal):
+        """ Whether the output is real and its type: real for a real signal
+            and a real kernel, complex otherwise. The overlap is converted to
+            the same type.
+        """
+        realOutput = self.realKernel and np.isrealobj(signal)
+        if realOutput:
+            outType = self.realType
+        else:
+            outType = self.config['DataType']
+        if realOutput and np.iscomplexobj(self.overlap):
+            self.overlap = self.overlap.real.astype(outType)
+        elif not realOutput and not np.iscomplexobj(self.overlap):
+            self.overlap = self.overlap.astype(outType)
+        return realOutput, outType
+
+    def fullSpectrum(self, X):
+        """ The spectrum of length nfft of a real signal from its half spectrum
+            X, for multiplication with a complex kernel
+        """
+        Z = np.empty([self.nfft,], dtype=X.dtype)
+        Z[:len(X)] = X
+        Z[len(X):] = np.conj(X[self.nfft-len(X):0:-1])
+        return Z
+
     def process1D(self,signal,continuity):
         """ This is the overlap-and-add implementation for 2D filters
         """
@@ -119,9 +159,12 @@ class OAFilterbank(processor.Processor):
         # Length of valid convolution is len(signal) - (len(response) - 1)
         if discardFirstBlock:
             self.reset()
-            result = np.empty([len(signal)-self.nOverlap,], dtype=self.config['DataType'])
+        realOutput, outType = self.outputType(signal)
+        realSignal = np.isrealobj(signal)
+        if discardFirstBlock:
+            result = np.empty([len(signal)-self.nOverlap,], dtype=outType)
         else:
-            result = np.empty([len(signal),], dtype=self.config['DataType'])
+            result = np.empty([len(signal),], dtype=outType)
         
 
         
@@ -130,18 +173,20 @@ class OAFilterbank(processor.Processor):
 
             currentBlockLength = stopReadingBefore-startReadingAt
                
-            self.logger.info('currentBlockLength: {0}, nfft: {1}, overlap: {2}, padding: {3}, fs: {4}'.format(currentBlockLength, 
-                                                                                    self.nfft, 
-                                                                                    self.nOverlap,
-                                                                                    self.nfft-self.nOverlap-currentBlockLength,
-                                                                                    self.fs))
+            self.chunklogger.info('currentBlockLength: %s, nfft: %s, overlap: %s, padding: %s, fs: %s', currentBlockLength,
+                self.nfft, self.nOverlap, self.nfft-self.nOverlap-currentBlockLength, self.fs)
             
-            # Read new samples and bring them to Z-domain
-            x = np.array(signal[startReadingAt:stopReadingBefore], dtype=self.config['DataType'])
-            X = fft.fft(x,self.nfft)
-
-            # Convolve with kernelZ
-            y = fft.ifft(X*self.kernelZ)
+            # Read new samples, bring them to Z-domain and convolve with kernelZ
+            if realOutput:
+                X = fft.rfft(signal[startReadingAt:stopReadingBefore],self.nfft)
+                y = fft.irfft(X*self.kernelRZ,self.nfft)
+            elif realSignal:
+                X = self.fullSpectrum(fft.rfft(signal[startReadingAt:stopReadingBefore],self.nfft))
+                y = fft.ifft(X*self.kernelZ)
+            else:
+                x = np.array(signal[startReadingAt:stopReadingBefore], dtype=self.config['DataType'])
+                X = fft.fft(x,self.nfft)
+                y = fft.ifft(X*self.kernelZ)
             y[0:self.nOverlap]+=self.overlap
             
 
@@ -184,31 +229,39 @@ class OAFilterbank(processor.Processor):
         # Length of valid convolution is len(signal) - (len(response) - 1)
         if discardFirstBlock:
             self.reset()
-            result = np.empty([self.nseg,len(signal)-self.nOverlap], dtype=self.config['DataType'])
+        realOutput, outType = self.outputType(signal)
+        realSignal = np.isrealobj(signal)
+        if discardFirstBlock:
+            result = np.empty([self.nseg,len(signal)-self.nOverlap], dtype=outType)
         else:
-            result = np.empty([self.nseg,len(signal)], dtype=self.config['DataType'])
+            result = np.empty([self.nseg,len(signal)], dtype=outType)
 
         while startReadingAt < len(signal):
             stopReadingBefore = min(startReadingAt+self.nBlock, len(signal))
 
             currentBlockLength = stopReadingBefore-startReadingAt
               
-            self.logger.info('currentBlockLength: {0}, nfft: {1}, overlap: {2}, padding: {3}, fs: {4}'.format(currentBlockLength, 
-                                                                                    self.nfft, 
-                                                                                    self.nOverlap,
-                                                                                    self.nfft-self.nOverlap-currentBlockLength,
-                                                                                    self.fs))
+            self.chunklogger.info('currentBlockLength: %s, nfft: %s, overlap: %s, padding: %s, fs: %s', currentBlockLength,
+                self.nfft, self.nOverlap, self.nfft-self.nOverlap-currentBlockLength, self.fs)
             
             # Read new samples and bring them to Z-domain
-            x = np.array(signal[startReadingAt:stopReadingBefore], dtype=self.config['DataType'])
-            X = fft.fft(x,self.nfft,axis=0)
+            if realOutput:
+                X = fft.rfft(signal[startReadingAt:stopReadingBefore],self.nfft)
+            elif realSignal:
+                X = self.fullSpectrum(fft.rfft(signal[startReadingAt:stopReadingBefore],self.nfft))
+            else:
+                x = np.array(signal[startReadingAt:stopReadingBefore], dtype=self.config['DataType'])
+                X = fft.fft(x,self.nfft)
 
-            # Convolve with kernelZ
-            for seg in range(self.nseg):
-                y = fft.ifft(X*self.kernelZ[:,seg])
+            # Convolve with kernelZ, a single inverse transform for each block of segments
+            for segs in self.segmentBlocks:
+                if realOutput:
+                    y = fft.irfft(X*self.kernelRZ[segs],self.nfft)
+                else:
+                    y = fft.ifft(X*self.kernelZ[segs])
                 
                 # Add overlap to initial part
-                y[0:self.nOverlap]+=self.overlap[:,seg]
+                y[:,0:self.nOverlap]+=self.overlap[segs]
 
                 """ In the first block we discard the startOverlap, write the
                     validProcessed to result. Every next block add the saved
@@ -217,11 +270,11 @@ class OAFilterbank(processor.Processor):
                 """
 
                 if discardFirstBlock:
-                    result[seg,startWrite:startWrite+currentBlockLength-self.nOverlap] = y[self.nOverlap:currentBlockLength]
+                    result[segs,startWrite:startWrite+currentBlockLength-self.nOverlap] = y[:,self.nOverlap:currentBlockLength]
                 else:
-                    result[seg, startWrite:startWrite+currentBlockLength] = y[0:currentBlockLength]
+                    result[segs,startWrite:startWrite+currentBlockLength] = y[:,0:currentBlockLength]
                         
-                self.overlap[:,seg] = y[currentBlockLength:currentBlockLength+self.nOverlap]
+                self.overlap[segs] = y[:,currentBlockLength:currentBlockLength+self.nOverlap]
                   
             startWrite += currentBlockLength
             startReadingAt = stopReadingBefore
@@ -284,7 +337,7 @@ class Resampler(OAFilterbank):
                     .format(soundData.fs, self.config['SampleRate']))
                 lowpassFiltered = self.oafilter(soundData.data,soundData.continuity)
                 data['timeseries']=self.decimate(lowpassFiltered,self.config['DecimateFactor'])
-                self.logger.info('Publish resampled data, number: {0}'.format(soundData.number))
+                self.chunklogger.info('Publish resampled data, number: %s', soundData.number)
                 return data
         return None
     
@@ -18,11 +18,14 @@ See the License for the specific language governing permissions and
 limitations under the License.
 '''
 class FileAnnotation(object):
-    def __init__(self, filehandle, file_id, storagetype='wav'):
+    def __init__(self, filehandle, file_id, storagetype='wav', startframe=0, stopframe=None):
         self.filehandle=filehandle
         self.file_id=file_id
         self.storagetype=storagetype
         self.extra_args = dict()
+        # Part of the file to read, the whole file by default
+        self.startframe=startframe
+        self.stopframe=stopframe
 
     def __str__(self):
         return 'FileAnnotation filehandle: {0}  file_id: {1} storagetype: {2}'.format(self.filehandle,self.file_id, self.storagetype)
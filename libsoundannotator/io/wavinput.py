@@ -24,19 +24,27 @@ import time
 
 class WavChunkReader(object):
 
-    def __init__(self, soundfile, *args, **kwargs):
-        self.openfile(soundfile)
+    def __init__(self, soundfile, startframe=0, stopframe=None, *args, **kwargs):
+        self.openfile(soundfile, startframe, stopframe)
 
-    def openfile(self, soundfile):
+    def openfile(self, soundfile, startframe=0, stopframe=None):
+        '''
+            Frames from startframe up to stopframe are read, times stay relative to the start of the file.
+        '''
         self.wavereader = wave.open(soundfile)
         self.fs=self.wavereader.getframerate()
         self.nframes=self.wavereader.getnframes()
         self.nchannels=self.wavereader.getnchannels()
         self.duration = float(self.nframes) / float(self.fs)
+        if stopframe is not None:
+            self.nframes=min(self.nframes, stopframe)
         samplewidth=self.wavereader.getsampwidth()
         self.dtype='int{0}'.format(2**(samplewidth-1)*8)
 
-        self.framepointer = 0
+        self.framepointer = startframe
+        self.initialframepointer = startframe
+        if startframe > 0:
+            self.wavereader.setpos(startframe)
 
     def __repr__(self):
         if not hasattr(self, 'wavereader'):
@@ -0,0 +1,494 @@
+'''
+This file is part of libsoundannotator. The library libsoundannotator is
+designed for processing sound using time-frequency representations.
+
+Copyright 2011-2014 Sensory Cognition Group, University of Groningen
+Copyright 2014-2017 SoundAppraisal BV
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+'''
+Batch processing of a corpus of sound files.
+
+A CorpusRunner runs a pipeline, given as a PipelineGraph spec, once for
+every file of a manifest. A number of worker processes each take a file,
+start a Board with the pipeline for that file alone, stream it with the
+input processor in offline mode and stop the Board when the sink
+processors have published their last chunk. Independent pipelines run
+side by side, one per worker.
+
+route is called with the FileAnnotation of every file and returns
+parameters overriding those of the spec, a dict from processor name to a
+dict of parameters, to send the results of every file to a place of its
+own. Files whose pipeline fails, dies or times out are retried up to
+retries times. Progress and throughput are logged after every file.
+
+A ShardedRunner processes a single long recording in the same way. It
+splits the recording into segments, one per worker by default. Every
+segment starts early by a pre-roll long enough for the output of the
+pipeline to have settled at the start of the segment, and ends late by the
+same amount. The pre-roll follows from the chunkAlignment accumulated along
+the graph up to the sink, droppedAfterDiscontinuity plus includedPast
+samples of the sink rounded up to whole chunks. The output of the sink for
+every segment is trimmed to the part belonging to that segment and the
+parts are joined into one .npy file.
+
+A manifest file has one file per line, either a path or a JSON object
+with 'file', 'id' and optionally 'storagetype', other keys end up in the
+extra_args of the FileAnnotation.
+
+Usage:
+    runner = CorpusRunner('pipeline.json', 'wav', readManifest('corpus.txt'),
+        workers=8, route=lambda annotation: {'out': {'outdir': os.path.join('results', annotation.file_id)}})
+    results = runner.run()
+    print runner.summary(results)
+
+    runner = ShardedRunner('pipeline.json', 'wav', FileAnnotation('day.wav', 'day'), 'gcfb', 'E', 'day.npy', workers=8)
+    runner.run()
+'''
+import copy, fractions, json, logging, multiprocessing, os, tempfile, time
+from collections import deque
+from multiprocessing.queues import SimpleQueue
+import numpy as np
+
+from board          import Board
+from graph          import PipelineGraph
+from subscription   import SubscriptionOrder
+from continuity     import Continuity
+from messages       import ProcessorMessage
+from processor      import OutputProcessor
+from _multiprocessing import Connection
+
+from libsoundannotator.io.annotations   import FileAnnotation
+from libsoundannotator.io.wavinput      import WavChunkReader
+
+logger = logging.getLogger('libsoundannotator')
+
+
+class CorpusError(Exception):
+    pass
+
+
+def readManifest(filename):
+    """ Read a manifest file into a list of FileAnnotations
+    """
+    annotations = list()
+    with open(filename) as f:
+        for line in f:
+            line = line.strip()
+            if len(line) == 0 or line.startswith('#'):
+                continue
+            if line.startswith('{'):
+                entry = json.loads(line)
+                filehandle = entry.pop('file')
+                file_id = entry.pop('id', os.path.splitext(os.path.basename(filehandle))[0])
+                annotation = FileAnnotation(filehandle, file_id, entry.pop('storagetype', 'wav'))
+                annotation.setExtraArgs(entry.keys(), entry)
+            else:
+                annotation = FileAnnotation(line, os.path.splitext(os.path.basename(line))[0])
+            annotations.append(annotation)
+    return annotations
+
+
+class FileResult(object):
+    """ Outcome of processing a single file of the corpus
+    """
+    def __init__(self, index, annotation, status, attempts, elapsed, duration=None, error=None):
+        self.index      = index
+        self.annotation = annotation
+        self.status     = status
+        self.attempts   = attempts
+        self.elapsed    = elapsed
+        self.duration   = duration
+        self.error      = error
+
+    def asDict(self):
+        return {
+            'file': self.annotation.filehandle,
+            'id': self.annotation.file_id,
+            'status': self.status,
+            'attempts': self.attempts,
+            'elapsed': self.elapsed,
+            'duration': self.duration,
+            'error': self.error,
+        }
+
+
+def _work(runner, tasks, results):
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        (index, annotation, attempt) = task
+        results.put(('started', os.getpid(), task))
+        start = time.time()
+        try:
+            duration = runner.runFile(annotation)
+            results.put(('done', os.getpid(), FileResult(index, annotation, 'done', attempt, time.time() - start, duration)))
+        except Exception as e:
+            results.put(('done', os.getpid(), FileResult(index, annotation, 'failed', attempt, time.time() - start,
+                error='{0}: {1}'.format(e.__class__.__name__, e))))
+
+
+class CorpusRunner(object):
+
+    def __init__(self, spec, inputProcessor, manifest, workers=None, sinks=None, route=None,
+            retries=2, timeout=None, settleTime=0.5, resultsFile=None,
+            logdir=os.path.expanduser('~'), logfile='corpusrunner', loglevel=logging.INFO):
+        """ spec            PipelineGraph spec, a dict or the name of a JSON file
+            inputProcessor  name of the processor in the spec reading the files, a WavProcessor
+            manifest        list of FileAnnotations
+            workers         number of pipelines running in parallel, the number of CPUs by default
+            sinks           processors whose last chunk ends the processing of a file, by default
+                            the leaves of the graph, or the processors feeding them if those are
+                            OutputProcessors
+            route           callable giving the parameter overrides for a FileAnnotation
+            retries         number of times a failed file is tried again
+            timeout         seconds after which the processing of a single file fails
+            settleTime      seconds given to OutputProcessors to finish after the sinks are done
+            resultsFile     file to which a JSON line is appended for every file finished
+        """
+        if not isinstance(spec, dict):
+            spec = PipelineGraph.fromFile(spec).spec
+        self.spec = spec
+        self.graph = PipelineGraph(copy.deepcopy(spec))
+        if not inputProcessor in self.graph.byName:
+            raise CorpusError('Input processor {0} is not part of the pipeline'.format(inputProcessor))
+
+        self.inputProcessor = inputProcessor
+        self.manifest = list(manifest)
+        self.workers = workers if workers is not None else multiprocessing.cpu_count()
+        self.sinks = sinks if sinks is not None else self.findSinks()
+        self.route = route
+        self.retries = retries
+        self.timeout = timeout
+        self.settleTime = settleTime
+        self.resultsFile = resultsFile
+        self.logdir = logdir
+        self.logfile = logfile
+        self.loglevel = loglevel
+        self.startTime = None
+
+    def findSinks(self):
+        subscribed = set()
+        for node in self.graph.nodes:
+            for subscription in node['inputs']:
+                subscribed.add(subscription['from'])
+
+        sinks = list()
+        for node in self.graph.nodes:
+            if node['name'] in subscribed:
+                continue
+            if issubclass(self.graph.processorClass(node), OutputProcessor):
+                sinks.extend([subscription['from'] for subscription in node['inputs']])
+            else:
+                sinks.append(node['name'])
+
+        return sorted(set(sinks))
+
+    def pipeline(self, annotation):
+        """ The PipelineGraph processing a single file
+        """
+        graph = PipelineGraph(copy.deepcopy(self.spec))
+        parameters = graph.byName[self.inputProcessor]['parameters']
+        parameters['SoundFiles'] = [annotation]
+        parameters['offline'] = True
+
+        if self.route is not None:
+            for (name, overrides) in self.route(annotation).items():
+                if not name in graph.byName:
+                    raise CorpusError('Route for {0} names unknown processor {1}'.format(annotation.file_id, name))
+                graph.byName[name]['parameters'].update(overrides)
+
+        return graph
+
+    def runFile(self, annotation):
+        """ Process a single file in a Board of its own, returns the duration
+            of the sound in seconds when it is known.
+        """
+        duration = None
+        if annotation.storagetype == 'wav':
+            reader = WavChunkReader(annotation.filehandle)
+            duration = reader.getDuration()
+            reader.closefile()
+
+        self.runPipeline(annotation, dict([(name, '*') for name in self.sinks]))
+        return duration
+
+    def runPipeline(self, annotation, outputs):
+        """ Run the pipeline for annotation in a Board of its own until the
+            processors in outputs, a dict from processor name to senderKey,
+            have published their last chunk. Returns a dict from processor
+            name to the data of the chunks published with that key, in order.
+        """
+        board = Board(loglevel=self.loglevel, logdir=self.logdir, logfile='{0}-{1}'.format(self.logfile, os.getpid()))
+        try:
+            # Placing the processes of parallel pipelines on the same cores would only make them compete
+            self.pipeline(annotation).start(board, place=False)
+
+            subscriptions = dict()
+            chunks = dict()
+            for (name, key) in outputs.items():
+                subscriptions[name] = list()
+                chunks[name] = list()
+                for instance in board.replicas.get(name, [name]):
+                    subscription = board.getConnectionToProcessor(SubscriptionOrder(instance, 'corpusrunner', key, key))
+                    subscription.riseConnection(board.logger)
+                    subscriptions[name].append(subscription)
+
+            board.startStreaming(self.inputProcessor)
+
+            # Only one of the replicas of a sink publishes the last chunk
+            pending = set(outputs)
+            deadline = None if self.timeout is None else time.time() + self.timeout
+            while len(pending) > 0:
+                for name in list(pending):
+                    for subscription in subscriptions[name]:
+                        while subscription.connection.poll(0):
+                            chunk = subscription.connection.recv()
+                            if chunk.continuity == Continuity.last:
+                                pending.discard(name)
+                            elif outputs[name] != '*':
+                                chunks[name].append((chunk.number, chunk.data))
+
+                self.checkBoard(board)
+                if deadline is not None and time.time() > deadline:
+                    raise CorpusError('Processing {0} took more than {1} seconds'.format(annotation.file_id, self.timeout))
+
+            time.sleep(self.settleTime)
+        finally:
+            board.stopallprocessors()
+            for (instance, connection) in board.processors.values():
+                if type(connection) == Connection:
+                    instance.join(10)
+                    if instance.is_alive():
+                        instance.terminate()
+            board.logger.removeHandler(board.handler)
+            board.handler.close()
+
+        return dict([(name, [data for (number, data) in sorted(chunks[name], key=lambda item: item[0])]) for name in chunks])
+
+    def checkBoard(self, board):
+        """ Raise a CorpusError when a processor of the board reported an error or died
+        """
+        for (name, (instance, connection)) in board.processors.items():
+            if not type(connection) == Connection:
+                continue
+            message = board.checkForProcessorData(name, connection)
+            if isinstance(message, ProcessorMessage) and message.getType() == ProcessorMessage.error:
+                raise CorpusError('Processor {0} failed: {1}'.format(name, message.getContents()))
+            # The input processor leaves its run loop when the file is done
+            if not instance.is_alive() and instance.exitcode not in (0, None):
+                raise CorpusError('Processor {0} died with exit code {1}'.format(name, instance.exitcode))
+
+    def run(self):
+        """ Process every file of the manifest, returns a list of FileResults
+            in the order of the manifest.
+        """
+        # Queues with a feeder thread could hold a lock while a worker, or a
+        # processor in a worker, is forked. Tasks are handed out one per idle worker.
+        tasks = SimpleQueue()
+        results = SimpleQueue()
+        pending = deque([(index, annotation, 1) for (index, annotation) in enumerate(self.manifest)])
+
+        workers = dict()
+        state = {'idle': 0}
+        def startWorker():
+            worker = multiprocessing.Process(target=_work, args=(self, tasks, results), name='corpusworker')
+            worker.start()
+            workers[worker.pid] = [worker, None]
+            state['idle'] += 1
+
+        def dispatch():
+            while state['idle'] > 0 and len(pending) > 0:
+                tasks.put(pending.popleft())
+                state['idle'] -= 1
+
+        for i in range(min(self.workers, len(self.manifest))):
+            startWorker()
+
+        finished = dict()
+        self.startTime = time.time()
+        try:
+            while len(finished) < len(self.manifest):
+                dispatch()
+                if results.empty():
+                    time.sleep(0.05)
+                    for (pid, (worker, task)) in workers.items():
+                        if not worker.is_alive():
+                            del workers[pid]
+                            if task is not None:
+                                (index, annotation, attempt) = task
+                                self.finish(FileResult(index, annotation, 'failed', attempt, 0.0,
+                                    error='Worker died with exit code {0}'.format(worker.exitcode)), pending, finished)
+                            else:
+                                state['idle'] -= 1
+                            startWorker()
+                    continue
+
+                (kind, pid, contents) = results.get()
+                if kind == 'started':
+                    workers[pid][1] = contents
+                else:
+                    workers[pid][1] = None
+                    state['idle'] += 1
+                    self.finish(contents, pending, finished)
+        finally:
+            for worker in workers.values():
+                tasks.put(None)
+            for (worker, task) in workers.values():
+                worker.join(10)
+                if worker.is_alive():
+                    worker.terminate()
+
+        return [finished[index] for index in sorted(finished)]
+
+    def finish(self, result, pending, finished):
+        if result.status == 'failed' and result.attempts <= self.retries:
+            logger.warning('Processing {0} failed, attempt {1}: {2}'.format(result.annotation.file_id, result.attempts, result.error))
+            pending.append((result.index, result.annotation, result.attempts + 1))
+            return
+
+        finished[result.index] = result
+        if self.resultsFile is not None:
+            with open(self.resultsFile, 'a') as f:
+                f.write(json.dumps(result.asDict()) + '\n')
+
+        logger.info('{0} {1} in {2:.1f}s. {3}'.format(result.annotation.file_id, result.status, result.elapsed,
+            self.summary(finished.values())))
+
+    def summary(self, results):
+        """ Progress and throughput over the results obtained so far
+        """
+        elapsed = time.time() - self.startTime if self.startTime is not None else 0.0
+        done = [result for result in results if result.status == 'done']
+        failed = len(results) - len(done)
+        audio = sum([result.duration for result in done if result.duration is not None])
+        return '{0}/{1} files done, {2} failed, {3:.2f} files/s, {4:.1f}x real time'.format(
+            len(done), len(self.manifest), failed, len(results)/elapsed if elapsed > 0 else 0.0,
+            audio/elapsed if elapsed > 0 else 0.0)
+
+
+class ShardedRunner(CorpusRunner):
+
+    def __init__(self, spec, inputProcessor, annotation, sink, key, outfile, shards=None, preroll=None, workdir=None, **kwargs):
+        """ spec            PipelineGraph spec, a dict or the name of a JSON file
+            inputProcessor  name of the processor in the spec reading the recording, a WavProcessor
+            annotation      FileAnnotation of the recording
+            sink, key       processor and key of the output to compute
+            outfile         .npy file receiving the output
+            shards          number of segments, the number of workers by default
+            preroll         frames of pre-roll, calculated from the alignment of the output by default
+            workdir         directory for the output of the segments, a temporary directory by default
+
+            Other keyword arguments are those of CorpusRunner.
+        """
+        super(ShardedRunner, self).__init__(spec, inputProcessor, [], sinks=[sink], **kwargs)
+        self.annotation = annotation
+        self.sink = sink
+        self.key = key
+        self.outfile = outfile
+        self.workdir = workdir if workdir is not None else tempfile.mkdtemp()
+
+        alignments = self.pipeline(annotation).alignments()
+        if not key in alignments[sink]:
+            raise CorpusError('Processor {0} has no output {1}'.format(sink, key))
+        self.alignment = alignments[sink][key]
+        self.samplerate = alignments[inputProcessor].values()[0].fsampling
+        if self.samplerate % self.alignment.fsampling != 0:
+            raise CorpusError('Sample rate {0} of {1} is not an integer fraction of the input sample rate {2}'
+                .format(self.alignment.fsampling, sink, self.samplerate))
+        self.decimation = int(self.samplerate/self.alignment.fsampling)
+
+        # Segments start on the chunk boundaries of the whole recording and on an output sample
+        chunksize = self.graph.byName[inputProcessor]['parameters']['ChunkSize']
+        self.grid = chunksize*self.decimation/fractions.gcd(chunksize, self.decimation)
+        if preroll is None:
+            preroll = (self.alignment.droppedAfterDiscontinuity + self.alignment.includedPast)*self.decimation
+        self.preroll = -(-preroll//self.grid)*self.grid
+
+        reader = WavChunkReader(annotation.filehandle)
+        self.nframes = reader.nframes
+        reader.closefile()
+
+        self.manifest = self.segments(shards if shards is not None else self.workers)
+
+    def segments(self, shards):
+        """ FileAnnotations of the segments, each with the frames it has to
+            produce output for in its segment attribute.
+        """
+        boundaries = [int(round(float(self.nframes)*k/shards/self.grid))*self.grid for k in range(shards)] + [self.nframes]
+        segments = list()
+        for k in range(shards):
+            (begin, end) = (boundaries[k], boundaries[k+1])
+            if begin >= end:
+                continue
+            last = end == self.nframes
+            segment = FileAnnotation(self.annotation.filehandle, '{0}-{1}'.format(self.annotation.file_id, k),
+                self.annotation.storagetype, startframe=max(0, begin - self.preroll),
+                stopframe=None if last else min(self.nframes, end + self.preroll))
+            segment.extra_args = dict(self.annotation.extra_args)
+            segment.segment = (len(segments), begin, end, last)
+            segments.append(segment)
+
+        logger.info('Split {0} frames of {1} into {2} segments with {3} frames of pre-roll'
+            .format(self.nframes, self.annotation.file_id, len(segments), self.preroll))
+        return segments
+
+    def segmentFile(self, index):
+        return os.path.join(self.workdir, 'segment-{0:05d}.npy'.format(index))
+
+    def runFile(self, annotation):
+        (index, begin, end, last) = annotation.segment
+        outputs = self.runPipeline(annotation, {self.sink: self.key})[self.sink]
+        if len(outputs) == 0:
+            raise CorpusError('Segment {0} produced no output'.format(annotation.file_id))
+
+        # Output sample i of a segment is output sample startframe/decimation + i of the whole recording
+        data = np.concatenate(outputs, axis=-1)
+        first = (begin - annotation.startframe)//self.decimation
+        if last:
+            data = data[..., first:]
+        else:
+            count = (end - begin)//self.decimation
+            if data.shape[-1] < first + count:
+                raise CorpusError('Segment {0} produced {1} samples, {2} needed'.format(annotation.file_id, data.shape[-1], first + count))
+            data = data[..., first:first + count]
+
+        np.save(self.segmentFile(index), data)
+        return float(end - begin)/self.samplerate
+
+    def run(self):
+        """ Process all segments and join their output in outfile, returns
+            the FileResults of the segments.
+        """
+        results = super(ShardedRunner, self).run()
+        if all([result.status == 'done' for result in results]):
+            self.stitch(len(results))
+        else:
+            logger.error('Not all segments of {0} were processed, leaving their output in {1}'.format(self.annotation.file_id, self.workdir))
+        return results
+
+    def stitch(self, count):
+        parts = [np.load(self.segmentFile(index), mmap_mode='r') for index in range(count)]
+        shape = parts[0].shape[:-1] + (sum([part.shape[-1] for part in parts]),)
+        out = np.lib.format.open_memmap(self.outfile, mode='w+', dtype=parts[0].dtype, shape=shape)
+        position = 0
+        for part in parts:
+            out[..., position:position + part.shape[-1]] = part
+            position += part.shape[-1]
+        out.flush()
+        del out
+
+        for index in range(count):
+            os.remove(self.segmentFile(index))
@@ -67,35 +67,102 @@ Example usage pattern:
 from continuity     import Continuity
 from subscription   import Subscription, SubscriptionOrder, NetworkSubscriptionOrder
 from messages       import BoardMessage, NetworkMessage
+from sharedmemory   import SharedMemoryRing
+from inprocess      import openLocalConnection, openDirectConnection, HostedProcessorOrder, HostedProcessor
 
 import logger
-import multiprocessing, time, sys, os, logging, logging.config, logging.handlers
+import metrics
+import tracing
+from messages       import ProcessorMessage
+
+import multiprocessing, time, sys, os, logging, logging.config, logging.handlers, tempfile, math
 from _multiprocessing import Connection
-import threading
+import threading, itertools, copy, functools
+
+
+def synchronized(method):
+    """ Methods talking to processors take the lock of the board, the
+        watchdog thread restarts processors from behind it.
+    """
+    @functools.wraps(method)
+    def locked(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return locked
 
 class Board(object):
     """ General managing class. Starts and stops streams. Handles
         communication between processors. Contains logging.
     """
 
-    def __init__(self,loglevel=logging.INFO, logdir=os.path.expanduser('~'), logfile='libsoundannotator'):
+    def __init__(self,loglevel=logging.INFO, logdir=os.path.expanduser('~'), logfile='libsoundannotator', fuseLinearChains=False,
+            asyncLogging=False, logQueueSize=10000, metricsDir=None, metricsPort=None, traceDir=None,
+            heartbeatInterval=None, heartbeatTimeout=None):
         self.loglevel=loglevel
+        self.asyncLogging = asyncLogging
+        self.logQueueSize = logQueueSize
+        self.logqueue = None
+        self.logwriter = None
+        self.fuseLinearChains = fuseLinearChains
         self.logdir = logdir
         self.logfile = logfile
 
         self.processors = dict()
         self.testprocessors=dict()
         self.connections = list()
+        self.sharedMemoryRings = list()
         self.heartbeats = dict()
+        self.hosts = dict()
+        self.fused = set()
+        self.replicas = dict()
+        self.localConnectionCounter = itertools.count()
+
+        # What is needed to start a processor again: its class, subscription orders and
+        # parameters, and the type, connection, order and options of the board messages
+        # wiring it to other processors
+        self.orders = dict()
+        self.wiring = dict()
+        self.stopping = set()
+        self.restarts = dict()
+        self.failed = set()
+        self.lock = threading.RLock()
 
         #for internal use
         self._BoardConnectionTimeOut = 0.01
-        self._heartBeatTimeout = 0.1
+        self._heartBeatTimeout = heartbeatTimeout
+        if heartbeatInterval is not None and heartbeatTimeout is None:
+            self._heartBeatTimeout = 5*heartbeatInterval
         self._firstTimeMonitor = True
 
         self.addLogger()
 
+        # Processors write snapshots of their metrics to metricsDir, see metrics.py
+        self.metricsDir = metricsDir
+        self.metricsServer = None
+        if metricsDir is None and metricsPort is not None:
+            self.metricsDir = tempfile.mkdtemp(prefix='libsoundannotator-metrics-')
+        if metricsPort is not None:
+            self.metricsServer = metrics.startMetricsServer(self.metricsDir, metricsPort)
+            self.logger.info('Serving metrics on http://127.0.0.1:{0}/metrics'.format(self.metricsServer.server_port))
+
+        # Processors write trace events of sampled chunks to traceDir, see tracing.py
+        self.traceDir = traceDir
+
+        # Processors send a heartbeat every heartbeatInterval seconds, the watchdog
+        # restarts those silent for more than heartbeatTimeout seconds
+        self.heartbeatInterval = heartbeatInterval
+        self.watchdogThread = None
+        if heartbeatInterval is not None:
+            self.startWatchdog()
+
     def addLogger(self):
+        if self.asyncLogging:
+            # Processors inherit the queue, the writer does the formatting and file writes for all of them.
+            # The board keeps writing itself, a queue feeder thread could hold a lock while it forks processors.
+            self.logqueue = multiprocessing.Queue(self.logQueueSize)
+            self.logwriter = logger.LogWriter(self.logqueue, self.logdir)
+            self.logwriter.start()
+
         filepath = os.path.join(self.logdir, '{0}.log'.format(self.logfile))
         formatter = logging.Formatter('%(asctime)s %(name)-15s %(levelname)-8s %(processName)-10s %(message)s')
         self.handler = logging.handlers.RotatingFileHandler(filepath,
@@ -128,7 +195,10 @@ class Board(object):
                 'type': 'server'
             }
 
-            fromBoard.send(BoardMessage(BoardMessage.networksubscription, Subscription(serverconfig, subscriptionorder)))
+            message = BoardMessage(BoardMessage.networksubscription, Subscription(serverconfig, subscriptionorder))
+            fromBoard.send(message)
+            self.wiring.setdefault(subscribing_processorName, list()).append(
+                (BoardMessage.networksubscription, serverconfig, subscriptionorder, dict()))
 
             return True
 
@@ -157,23 +227,40 @@ class Board(object):
 
             (input_instance, input_connection) = self.processors[subscriptionorder.processorName]
             (subscribing_instance, subscribing_connection)= self.processors[subscribing_processorName]
+            subscriptionorder = self.offlineSubscriptionOrder(input_instance, subscriptionorder)
+
+            if subscribing_processorName in self.fused:
+                self.logger.info('{0} is fused with {1}, injecting chunks directly'.format(subscribing_processorName,subscriptionorder.processorName))
+                direct = (openDirectConnection, (subscribing_processorName, subscriptionorder.receiverKey))
+                (toInput, toProcessor) = (direct, direct)
+                (connectionReduced, ring) = (True, None)
+            elif self.getHost(subscriptionorder.processorName) == self.getHost(subscribing_processorName):
+                self.logger.info('{0} and {1} share a process, passing chunks by reference'.format(subscriptionorder.processorName,subscribing_processorName))
+                key = (subscriptionorder.list(), self.localConnectionCounter.next())
+                (toInput, toProcessor) = ((openLocalConnection, (key, 0)), (openLocalConnection, (key, 1)))
+                (connectionReduced, ring) = (True, None)
+            else:
+                (toInput, toProcessor) = multiprocessing.Pipe()
+                self.connections.append((toInput, toProcessor))
+                (connectionReduced, ring) = (False, self.createSharedMemoryRing(subscriptionorder))
 
-            (toInput, toProcessor) = multiprocessing.Pipe()
-
-            self.connections.append((toInput, toProcessor))
             self.logger.debug('Sending subscription message')
             
-            subscriptionmessage=BoardMessage(BoardMessage.subscribe,Subscription(toInput,subscriptionorder) )
+            subscriptionmessage=BoardMessage(BoardMessage.subscribe,Subscription(toInput,subscriptionorder,connectionReduced=connectionReduced,sharedMemoryRing=ring) )
             
             if type(input_connection) == Connection:
                 input_connection.send(subscriptionmessage)
+                self.wiring.setdefault(subscriptionorder.processorName, list()).append(
+                    (BoardMessage.subscribe, toInput, subscriptionorder, dict(connectionReduced=connectionReduced, sharedMemoryRing=ring)))
             else:
                 input_connection.processBoardMessage(subscriptionmessage)
             
-            subscriptionmessage=BoardMessage(BoardMessage.subscription, Subscription(toProcessor,subscriptionorder))
+            subscriptionmessage=BoardMessage(BoardMessage.subscription, Subscription(toProcessor,subscriptionorder,connectionReduced=connectionReduced,sharedMemoryRing=ring))
 
             if type(subscribing_connection) == Connection:
                 subscribing_connection.send(subscriptionmessage)
+                self.wiring.setdefault(subscribing_processorName, list()).append(
+                    (BoardMessage.subscription, toProcessor, subscriptionorder, dict(connectionReduced=connectionReduced, sharedMemoryRing=ring)))
             else:
                 subscribing_connection.processBoardMessage(subscriptionmessage)
                 
@@ -184,10 +271,21 @@ class Board(object):
         return
 
 
+    @synchronized
     def getConnectionToProcessor(self,subscriptionorder):
         """ get a connection to a processor and return the other
             end of the Pipe
         """
+        if subscriptionorder.processorName in self.replicas:
+            self.logger.error('Processor {0} is replicated, connect to its instances {1} instead'
+                .format(subscriptionorder.processorName, self.replicas[subscriptionorder.processorName]))
+            return None
+
+        fused = self.fusedSubscriber(subscriptionorder.processorName)
+        if fused is not None:
+            self.logger.error('Processor {0} has fused processor {1} as subscriber, start {1} with fuseWith=False to connect to {0}'
+                .format(subscriptionorder.processorName, fused))
+            return None
 
         if subscriptionorder.processorName in self.processors:
 
@@ -195,36 +293,189 @@ class Board(object):
 
 
             (input_instance, input_connection) = self.processors[subscriptionorder.processorName]
+            subscriptionorder = self.offlineSubscriptionOrder(input_instance, subscriptionorder)
             (toInput, toProcessor) = multiprocessing.Pipe()
             self.connections.append((toInput, toProcessor))
-            
+            ring = self.createSharedMemoryRing(subscriptionorder)
                       
-            subscriptionmessage=BoardMessage(BoardMessage.subscribe, Subscription(toInput,subscriptionorder) )
+            subscriptionmessage=BoardMessage(BoardMessage.subscribe, Subscription(toInput,subscriptionorder,sharedMemoryRing=ring) )
             
             if type(input_connection) == Connection:
                 input_connection.send(subscriptionmessage)
+                self.wiring.setdefault(subscriptionorder.processorName, list()).append(
+                    (BoardMessage.subscribe, toInput, subscriptionorder, dict(sharedMemoryRing=ring)))
             else:
                 input_connection.processBoardMessage(subscriptionmessage)
 
-            return Subscription(toProcessor,subscriptionorder)
+            return Subscription(toProcessor,subscriptionorder,sharedMemoryRing=ring)
 
         self.logger.error('Trying to obtain connection to unknown processor {0}'.format(subscriptionorder.processorName))
         return None
 
+    def offlineSubscriptionOrder(self, input_instance, subscriptionorder):
+        """ Subscriptions to a processor running offline are paced by credits,
+            the order gets the credits of that processor unless it has its own.
+        """
+        config = getattr(input_instance, 'config', dict())
+        if not config.get('offline', False) or getattr(subscriptionorder, 'credits', None) is not None:
+            return subscriptionorder
+
+        subscriptionorder = copy.copy(subscriptionorder)
+        subscriptionorder.credits = config['offlineCredits']
+        subscriptionorder.overflowPolicy = 'block'
+        subscriptionorder.creditTimeout = config['offlineCreditTimeout']
+        self.logger.info('Processor {0} runs offline, subscription of {1} gets {2} credits'
+            .format(subscriptionorder.processorName, subscriptionorder.subscriberName, subscriptionorder.credits))
+        return subscriptionorder
+
+    @synchronized
+    def startStreaming(self, processorName):
+        """ Tell a processor waiting for it, such as a WavProcessor in offline
+            mode, that its subscriptions are in place and it can start producing.
+        """
+        if not processorName in self.processors:
+            self.logger.error('Trying to start unknown processor {0}'.format(processorName))
+            return False
+
+        (instance, connection) = self.processors[processorName]
+        message = BoardMessage(BoardMessage.start, None)
+        if type(connection) == Connection:
+            connection.send(message)
+            self.wiring.setdefault(processorName, list()).append((BoardMessage.start, None, None, dict()))
+        else:
+            connection.processBoardMessage(message)
+        return True
+
+    def createSharedMemoryRing(self, subscriptionorder):
+        """ Allocate the shared memory segment for a subscription which
+            asks for the sharedmemory transport, returns None otherwise.
+        """
+        if getattr(subscriptionorder, 'transport', 'pipe') != 'sharedmemory':
+            return None
+
+        ring = SharedMemoryRing.create('{0}-{1}'.format(subscriptionorder.processorName, subscriptionorder.subscriberName),
+            subscriptionorder.sharedMemorySlots,
+            subscriptionorder.sharedMemorySlotSize)
+        self.sharedMemoryRings.append(ring)
+        self.logger.info('Created shared memory segment {0} with {1} slots of {2} bytes'
+            .format(ring.filename, ring.slots, ring.slotsize))
+
+        return ring
+
+    def getHost(self, processorName):
+        """ Name of the processor in whose process processorName runs
+        """
+        return self.hosts.get(processorName, processorName)
+
+    def subscriberCount(self, processorName):
+        """ Number of subscriptions made to processorName by this board
+        """
+        return len([wire for wire in self.wiring.get(processorName, []) if wire[0] == BoardMessage.subscribe])
+
+    def fusedSubscriber(self, processorName):
+        """ Name of a fused processor subscribed to processorName, None if
+            there is none. Such a processor runs inside the publish of
+            processorName, which can therefore have no other subscribers.
+        """
+        for name in sorted(self.fused):
+            if processorName in [getattr(order, 'processorName', None) for order in self.orders[name][1]]:
+                return name
+        return None
+
+    def fusableUpstream(self, processorClass, subscriptionorders):
+        """ Name of the processor a processor with these subscriptions can be
+            fused with, None if its inputs do not come from a single process
+            or an input already has other subscribers. Fusing a branch of a
+            fan-out would run the branches one after another.
+        """
+        if len(getattr(processorClass, 'requiredKeys', [])) == 0 or len(subscriptionorders) == 0:
+            return None
+
+        upstream = set()
+        for subscriptionorder in subscriptionorders:
+            if subscriptionorder.__class__.__name__ != 'SubscriptionOrder' or not subscriptionorder.processorName in self.processors:
+                return None
+            if not type(self.processors[self.getHost(subscriptionorder.processorName)][1]) == Connection:
+                return None
+            if self.subscriberCount(subscriptionorder.processorName) > 0:
+                return None
+            upstream.add(self.getHost(subscriptionorder.processorName))
+
+        if len(upstream) != 1:
+            return None
+
+        return subscriptionorders[0].processorName
+
+    @synchronized
     def startProcessor(self, processorName, processorClass, *subscriptionorders, **kwargs):
-        if processorName in self.processors:
+        """ Start a processor in a process of its own, or with host='otherProcessor'
+            in a thread of the process running otherProcessor. With
+            fuseWith='otherProcessor' it runs in the process of otherProcessor
+            without a thread, its input is then injected directly. A board
+            created with fuseLinearChains=True fuses every processor whose
+            inputs all come from a single process and have no other subscribers
+            yet, unless fuseWith=False is given. Processors with a fused
+            subscriber take no further subscribers.
+            With replicas=N, N instances of the processor share its input round
+            robin by chunk number, see startReplicatedProcessor.
+        """
+        replicas = kwargs.pop('replicas', 1)
+        if replicas > 1:
+            return self.startReplicatedProcessor(processorName, processorClass, replicas, *subscriptionorders, **kwargs)
+
+        if processorName in self.processors or processorName in self.replicas:
             self.logger.error(
             'Trying to start processor with duplicate name {0}. Processors must have unique names.'
             .format(processorName))
             return
 
+        for subscriptionorder in subscriptionorders:
+            fused = self.fusedSubscriber(getattr(subscriptionorder, 'processorName', None))
+            if fused is not None:
+                raise ValueError('Trying to subscribe processor {0} to {1}, which already has fused processor {2} as subscriber. Start {2} with fuseWith=False to give {1} more subscribers.'
+                    .format(processorName, subscriptionorder.processorName, fused))
+
+        self.orders[processorName] = (processorClass, subscriptionorders, dict(kwargs))
+        host = kwargs.pop('host', None)
+        fuseWith = kwargs.pop('fuseWith', None)
+
+        if fuseWith is None and self.fuseLinearChains and host is None:
+            fuseWith = self.fusableUpstream(processorClass, subscriptionorders)
+
+        if fuseWith:
+            if self.fusableUpstream(processorClass, subscriptionorders) is None or \
+                    self.getHost(self.fusableUpstream(processorClass, subscriptionorders)) != self.getHost(fuseWith):
+                raise ValueError('Trying to fuse processor {0} with {1}, a fused processor needs input from processors in the process of {1} only, without other subscribers.'
+                    .format(processorName, fuseWith))
+            host = fuseWith
+
         (fromBoard, toInstance) = multiprocessing.Pipe()
-            
-        self.logger.debug("creating instance of {0}".format(processorName))
-        instance = processorClass(toInstance, processorName, logdir=self.logdir, loglevel=self.loglevel, **kwargs)
 
-        self.processors[processorName] = (instance, fromBoard)
-        instance.start()
+        if host is None:
+            self.logger.debug("creating instance of {0}".format(processorName))
+            instance = self.createInstance(processorName, processorClass, toInstance, kwargs)
+
+            self.processors[processorName] = (instance, fromBoard)
+            self.heartbeats[processorName] = (time.time(), None, 0.)
+            instance.start()
+        else:
+            if not host in self.processors or not type(self.processors[host][1]) == Connection:
+                raise ValueError('Trying to host processor {0} on {1}, which is not a processor started by this board.'
+                    .format(processorName, host))
+
+            host = self.getHost(host)
+            (hostinstance, hostconnection) = self.processors[host]
+            self.logger.info("Asking {0} to host {1}".format(host, processorName))
+            kwargs.update(logdir=self.logdir, loglevel=self.loglevel, metricsdir=self.metricsDir, tracedir=self.traceDir,
+                heartbeatinterval=self.heartbeatInterval)
+            hostconnection.send(BoardMessage(BoardMessage.hostprocessor,
+                HostedProcessorOrder(processorClass, processorName, toInstance, kwargs, fused=bool(fuseWith))))
+
+            self.hosts[processorName] = host
+            if fuseWith:
+                self.fused.add(processorName)
+            self.processors[processorName] = (HostedProcessor(processorName, hostinstance, host), fromBoard)
+            self.heartbeats[processorName] = (time.time(), None, 0.)
 
         # Let processor check whether provided subscriptions fit the required keys, processor
         # will raise ValueErrors is not correct.
@@ -234,7 +485,7 @@ class Board(object):
 
 
         # After passing checks create the subscriptions
-        for subscriptionorder in subscriptionorders:
+        for subscriptionorder in self.expandReplicatedInputs(subscriptionorders):
             # First condition merely indicates that we cannot check this condition for processors initiated outside this board.
             if subscriptionorder.__class__.__name__ == 'SubscriptionOrder' and not (subscriptionorder.processorName in self.processors):
                 raise ValueError('Trying to start processor {0} with input from nonexisting processor {1}. Processors providing input must exist.'
@@ -256,8 +507,79 @@ class Board(object):
     
 
 
+    def createInstance(self, processorName, processorClass, toInstance, kwargs):
+        return processorClass(toInstance, processorName, logdir=self.logdir, loglevel=self.loglevel, logqueue=self.logqueue,
+            metricsdir=self.metricsDir, tracedir=self.traceDir, heartbeatinterval=self.heartbeatInterval, **kwargs)
+
+    @synchronized
+    def startReplicatedProcessor(self, processorName, processorClass, replicas, *subscriptionorders, **kwargs):
+        """ Start replicas instances processorName#0 ... of a processor which is
+            stateless from chunk to chunk. Instance i receives the chunks whose
+            number modulo replicas equals i. Subscribers of processorName are
+            subscribed to all instances and reassemble their output in order of
+            chunk number. A replica of a processor looking back into previous
+            chunks, through its alignment, stops with a ValueError on its
+            first chunk.
+        """
+        if processorName in self.processors or processorName in self.replicas:
+            self.logger.error(
+            'Trying to start processor with duplicate name {0}. Processors must have unique names.'
+            .format(processorName))
+            return
+
+        for subscriptionorder in subscriptionorders:
+            if getattr(subscriptionorder, 'processorName', None) in self.replicas:
+                raise ValueError('Trying to start replicated processor {0} with input from replicated processor {1}, replicated processors can not be chained.'
+                    .format(processorName, subscriptionorder.processorName))
+            if subscriptionorder.__class__.__name__ == 'NetworkSubscriptionOrder':
+                raise ValueError('Trying to start replicated processor {0} with network input, replicas only receive from processors on this board.'
+                    .format(processorName))
+
+        names = list()
+        for index in range(replicas):
+            name = '{0}#{1}'.format(processorName, index)
+            orders = list()
+            for subscriptionorder in subscriptionorders:
+                order = copy.copy(subscriptionorder)
+                order.subscriberName = name
+                order.replicas = replicas
+                order.replicaIndex = index
+                orders.append(order)
+
+            self.startProcessor(name, processorClass, *orders, numberStride=replicas, **kwargs)
+            names.append(name)
+
+        self.replicas[processorName] = names
+
+    def expandReplicatedInputs(self, subscriptionorders):
+        """ Replace subscriptions to a replicated processor by subscriptions to
+            each of its instances.
+        """
+        expanded = list()
+        for subscriptionorder in subscriptionorders:
+            names = self.replicas.get(getattr(subscriptionorder, 'processorName', None))
+            if names is None:
+                expanded.append(subscriptionorder)
+                continue
+            for name in names:
+                order = copy.copy(subscriptionorder)
+                order.processorName = name
+                order.reassemble = len(names)
+                expanded.append(order)
+        return expanded
+
+    def startGraph(self, graph):
+        """ Start the processors described by a PipelineGraph and place them on cores
+        """
+        graph.start(self)
+
+    @synchronized
     def stopProcessor(self, processorName):
-        if processorName in self.processors:
+        self.stopping.add(processorName)
+        if processorName in self.replicas:
+            for name in self.replicas[processorName]:
+                self.stopProcessor(name)
+        elif processorName in self.processors:
             self.logger.info('Stopping processor {0}'
             .format(processorName))
 
@@ -296,9 +618,125 @@ class Board(object):
     def exitOnFalseProcessor(self):
         for processorName in self.processors:
             if not self.processors[processorName][0].is_alive():
+                if self.watchdogThread is not None and not processorName in self.failed:
+                    # The watchdog restarts it
+                    continue
                 self.logger.warning("Processor {0} is inactive. Stopping whole chain".format(processorName))
                 self.stop()
 
+    def startWatchdog(self):
+        """ Check the heartbeats of the processors from a thread, every heartbeat interval
+        """
+        self.watchdogStop = threading.Event()
+        self.watchdogThread = threading.Thread(target=self.runWatchdog, name='watchdog')
+        self.watchdogThread.daemon = True
+        self.watchdogThread.start()
+        self.logger.info('Watchdog expects heartbeats every {0} seconds, restarts processors silent for {1} seconds'
+            .format(self.heartbeatInterval, self._heartBeatTimeout))
+
+    def stopWatchdog(self):
+        if self.watchdogThread is None:
+            return
+        self.watchdogStop.set()
+        if not self.watchdogThread is threading.current_thread():
+            self.watchdogThread.join()
+        self.watchdogThread = None
+
+    def runWatchdog(self):
+        while not self.watchdogStop.wait(self.heartbeatInterval):
+            try:
+                self.watchdog()
+            except Exception as e:
+                self.logger.exception('Watchdog failed: {0}'.format(e))
+
+    @synchronized
+    def watchdog(self):
+        """ Read the messages of the processors and restart those that died
+            or sent no heartbeat for more than heartbeatTimeout seconds.
+        """
+        now = time.time()
+        for (processorName, (instance, connection)) in self.processors.items():
+            if processorName in self.stopping or processorName in self.failed:
+                continue
+            self.readProcessorMessages(processorName, connection)
+
+            if not instance.is_alive():
+                if processorName in self.hosts or instance.exitcode == 0:
+                    # Guests go with their host, an input processor leaves its run loop at the end of its input
+                    continue
+                reason = 'exited with code {0}'.format(instance.exitcode)
+            elif now - self.heartbeats[processorName][0] > self._heartBeatTimeout:
+                reason = 'sent no heartbeat for {0:.1f} seconds'.format(now - self.heartbeats[processorName][0])
+            else:
+                continue
+
+            self.logger.error('Processor {0} {1}'.format(processorName, reason))
+            if self.restartable(processorName):
+                self.restartProcessor(processorName)
+            else:
+                self.logger.error('Processor {0} shares its process with other processors and can not be restarted on its own'
+                    .format(processorName))
+                self.failed.add(processorName)
+
+    def readProcessorMessages(self, processorName, connection):
+        while True:
+            try:
+                if not connection.poll(0):
+                    return
+                message = connection.recv()
+            except (EOFError, IOError):
+                return
+            if not isinstance(message, ProcessorMessage):
+                continue
+            if message.getType() == ProcessorMessage.heartbeat:
+                (sent, number) = message.getContents()
+                (previousTime, previousNumber, rate) = self.heartbeats[processorName]
+                if number is not None and previousNumber is not None and time.time() > previousTime:
+                    rate = (number - previousNumber)/(time.time() - previousTime)
+                self.heartbeats[processorName] = (time.time(), number, rate)
+            elif message.getType() == ProcessorMessage.error:
+                self.logger.error('Processor {0} reported {1}'.format(processorName, message.getContents()))
+
+    def restartable(self, processorName):
+        """ Only processors with a process of their own, hosting no other processors
+        """
+        return type(self.processors[processorName][1]) == Connection and \
+            not processorName in self.hosts and not processorName in self.hosts.values()
+
+    def restartProcessor(self, processorName):
+        """ Replace a failed processor by a new instance with the same
+            subscriptions. Its subscribers see a discontinuity, chunk numbers of
+            an input processor continue after those its predecessor may have used.
+        """
+        (instance, connection) = self.processors[processorName]
+        if instance.is_alive():
+            instance.terminate()
+        instance.join(1.0)
+        connection.close()
+
+        (processorClass, subscriptionorders, kwargs) = self.orders[processorName]
+        (fromBoard, toInstance) = multiprocessing.Pipe()
+        instance = self.createInstance(processorName, processorClass, toInstance, dict(kwargs))
+
+        (lastTime, lastNumber, rate) = self.heartbeats[processorName]
+        if lastNumber is not None:
+            instance.continueNumbering(lastNumber + int(math.ceil(rate*(time.time() - lastTime))) + 1)
+
+        self.processors[processorName] = (instance, fromBoard)
+        self.heartbeats[processorName] = (time.time(), None, 0.)
+        instance.start()
+
+        # The board kept its ends of the pipes, the new instance takes over the other ends.
+        # A Subscription holds a connection reduced for a single receiver, a new one is needed.
+        for (messageType, connection, subscriptionorder, kwargs) in self.wiring.get(processorName, list()):
+            if subscriptionorder is None:
+                fromBoard.send(BoardMessage(messageType, None))
+            else:
+                fromBoard.send(BoardMessage(messageType, Subscription(connection, subscriptionorder, **kwargs)))
+
+        self.restarts[processorName] = self.restarts.get(processorName, 0) + 1
+        self.logger.warning('Restarted processor {0}, restart {1}'.format(processorName, self.restarts[processorName]))
+
     def isHealthy(self):
         healthy=True
         for processorName in self.processors:
@@ -309,6 +747,11 @@ class Board(object):
         return healthy
 
     def stopallprocessors(self):
+        self.stopWatchdog()
+        with self.lock:
+            self.stopProcessors()
+
+    def stopProcessors(self):
         for processorName in self.processors:
             self.stopProcessor(processorName)
 
@@ -317,8 +760,59 @@ class Board(object):
 
         self.connections=list()
 
+        # Mappings made by the processors outlive the files.
+        for ring in self.sharedMemoryRings:
+            ring.unlink()
+
+        self.sharedMemoryRings=list()
+
 
     def stop(self,*args):
         self.stopallprocessors()
         self.logger.info("Terminating a Board")
+        if self.metricsServer is not None:
+            self.metricsServer.shutdown()
+            self.metricsServer.server_close()
+            self.metricsServer = None
+        self.stopLogWriter()
         logging.shutdown()
+
+    def renderMetrics(self):
+        """ The metrics last written by the processors in the Prometheus text format
+        """
+        if self.metricsDir is None:
+            raise ValueError('Board has no metricsDir, create it with metricsDir or metricsPort to collect metrics')
+        return metrics.render(metrics.readSnapshots(self.metricsDir))
+
+    def writeMetrics(self, filename):
+        """ Replace filename by the rendered metrics, for collectors reading files
+        """
+        text = self.renderMetrics()
+        (fd, tmpname) = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(filename)), suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            f.write(text)
+        os.rename(tmpname, filename)
+
+    def writeTrace(self, filename):
+        """ Join the trace events written by the processors into filename, call
+            this after stopping the processors to include their last events.
+        """
+        if self.traceDir is None:
+            raise ValueError('Board has no traceDir, create it with traceDir to trace chunks')
+        count = tracing.mergeTraces(self.traceDir, filename)
+        self.logger.info('Wrote {0} trace events to {1}'.format(count, filename))
+        return count
+
+    def stopLogWriter(self, timeout=5.0):
+        """ Let the LogWriter write what is queued and stop it, processors
+            still running log nothing after this.
+        """
+        if self.logwriter is None:
+            return
+        self.logqueue.put(None)
+        self.logqueue.close()
+        self.logqueue.join_thread()
+        self.logwriter.join(timeout)
+        if self.logwriter.is_alive():
+            self.logwriter.terminate()
+        self.logwriter = None
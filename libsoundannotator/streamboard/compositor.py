@@ -20,6 +20,8 @@ limitations under the License.
 import numpy as np
 import logger
 import time
+import collections
+import sys
 
 from continuity import Continuity, chunkAlignment
 
@@ -28,6 +30,13 @@ class DataChunk(object):
     """ A chunk of data, starting at a specific time and at a specific
         framerate
     """
+    
+    # Thousands of chunks per second pass through a pipeline, slots keep them small and 
+    # quick to create. Attributes outside the slots, set by some processors and tests, 
+    # go into a __dict__ created on first use.
+    __slots__ = ('sources', 'data', 'startTime', 'fs', 'processorname', 'continuity', 'number', 
+        'alignment', 'dataGenerationTime', 'identifier', 'metadata', 'initialSampleTime', 
+        'announcements', '__dict__')
 
     def __init__(self,  data, 
                         startTime, 
@@ -36,11 +45,12 @@ class DataChunk(object):
                         sources, 
                         continuity=Continuity.withprevious, 
                         number=0, 
-                        alignment=chunkAlignment(), 
-                        dataGenerationTime=dict(), 
+                        alignment=None, 
+                        dataGenerationTime=None, 
                         identifier=None,
-                        metadata = dict(), 
-                        initialSampleTime=None):
+                        metadata=None, 
+                        initialSampleTime=None,
+                        announcements=None):
 
         assert(type(sources) is set)
         self.sources = sources
@@ -51,12 +61,31 @@ class DataChunk(object):
         self.processorname = processorname
         self.continuity=continuity
         self.number=number
+        if alignment is None:
+            alignment=chunkAlignment()
         self.alignment=alignment
         
-        self.setDataGenerationTime(dataGenerationTime)
+        if dataGenerationTime is None:
+            dataGenerationTime=dict()
+        elif type(dataGenerationTime) is not dict:
+            self.setDataGenerationTime(dataGenerationTime)
+        self.dataGenerationTime=dataGenerationTime
         self.identifier = identifier
-        self.setMetaData(metadata)
+        if metadata is None:
+            metadata=dict()
+        elif type(metadata) is not dict:
+            self.setMetaData(metadata)
+        self.metadata=metadata
         self.initialSampleTime=initialSampleTime
+        # Descriptions behind the references in metadata, for receivers that may not know them, see metadata.py
+        self.announcements=announcements
+
+    def __reduce__(self):
+        # The fields in order of the arguments of __init__, without their names
+        state=self.__dict__ or None
+        return (DataChunk, (self.data, self.startTime, self.fs, self.processorname, self.sources, 
+            self.continuity, self.number, self.alignment, self.dataGenerationTime, self.identifier, 
+            self.metadata, self.initialSampleTime, self.announcements), state)
 
     def getLength(self):
         return np.shape(self.data)[0]
@@ -85,6 +114,9 @@ class compositeChunk(object):
     complete=1
     processed=2
     
+    __slots__ = ('status', 'requiredKeys', 'received', 'number', 'startTime', 'initialSampleTime', 
+        'dataGenerationTime', 'metadata', 'identifier', 'alignment', 'continuity', 'chunkcontinuity')
+    
     def __init__(self, number, requiredKeys, 
                     startTime=None,
                     dataGenerationTime=None,
@@ -94,7 +126,10 @@ class compositeChunk(object):
                         
         self.status=compositeChunk.incomplete
         
-        self.openKeys=set(requiredKeys)
+        # Shared with the compositeManager, the keys still open are those not received
+        if type(requiredKeys) is not frozenset:
+            requiredKeys=frozenset(requiredKeys)
+        self.requiredKeys=requiredKeys
         self.received=dict()
         self.number=number
         
@@ -105,88 +140,274 @@ class compositeChunk(object):
         self.metadata=metadata
         self.identifier=identifier
         
-        # used in publish
-        self.alignment=chunkAlignment()
+        # used in publish, set by the compositeManager on the composites it passes to processData
+        self.alignment=None
         self.continuity=Continuity.withPrevious
         
         self.chunkcontinuity=Continuity.withPrevious
+    
+    def __reduce__(self):
+        return (_rebuildCompositeChunk, tuple([getattr(self, name) for name in compositeChunk.__slots__]))
+    
+    @property
+    def openKeys(self):
+        return set(self.requiredKeys).difference(self.received)
         
     def update(self, receiverKey, chunk):
         
         assert(self.number==chunk.number)
         
-        if receiverKey in self.openKeys:
+        if receiverKey in self.requiredKeys and not receiverKey in self.received:
             self.received[receiverKey]=chunk
-            self.openKeys.remove(receiverKey)
         else:
             raise ValueError('Incorrect key ({0}) passed to compositeChunk.update'.format(receiverKey))
            
 
-        if len(self.openKeys)==0:
+        if len(self.received)==len(self.requiredKeys):
             self.status = compositeChunk.complete
 
         return self.status
     
+def _rebuildCompositeChunk(*values):
+    composite=compositeChunk.__new__(compositeChunk)
+    for (name, value) in zip(compositeChunk.__slots__, values):
+        setattr(composite, name, value)
+    return composite
             
    
+class rollingBuffer(object):
+    """ Contiguous history of the data of a single key, each chunk is written
+        behind the one before it along the last axis. Frames once written are
+        not overwritten while views of them are handed out, the views are
+    read-only so processors cannot change the history. When a chunk no
+        longer fits, the look-back moves to the front of the buffer, or to a
+        new buffer with room for chunksPerBuffer chunks if views of the old
+        one are still around.
+    """
+
+    chunksPerBuffer=4
+
+    def __init__(self):
+        self.buffer=None
+        self.end=0
+
+    def append(self, data, lookback):
+        ''' Append data, keeping at least lookback frames before it, returns the index of its first frame '''
+        data=np.asarray(data)
+        length=data.shape[-1]
+        if self.buffer is None or self.buffer.shape[:-1]!=data.shape[:-1] or self.buffer.dtype!=data.dtype:
+            (self.buffer, self.end)=(None, 0)
+        if self.buffer is None or self.end+length > self.buffer.shape[-1]:
+            kept=min(lookback, self.end)
+            size=kept+self.chunksPerBuffer*length
+            if self.buffer is not None and sys.getrefcount(self.buffer) == 2 and kept+length <= self.buffer.shape[-1] <= 2*size:
+                # No views of the buffer are left, the look-back moves to its front
+                buffer=self.buffer
+            else:
+                buffer=np.empty(data.shape[:-1]+(size,), dtype=data.dtype)
+            if kept > 0:
+                lookbackdata=self.buffer[...,self.end-kept:self.end]
+                if buffer is self.buffer and self.end < 2*kept:
+                    lookbackdata=lookbackdata.copy()
+                buffer[...,:kept]=lookbackdata
+            (self.buffer, self.end)=(buffer, kept)
+        start=self.end
+        self.buffer[...,start:start+length]=data
+        self.end+=length
+        return start
+
+    def view(self, start, stop):
+        ''' Read-only view of frames start up to stop, the history of the next chunks '''
+        view=self.buffer[...,start:stop]
+        view.flags.writeable=False
+        return view
+
+
+class compositeRing(object):
+    """ The composites of chunk numbers start up to end in a fixed number of
+        slots, the composite of number n lives in slot n % capacity. A slot
+        stays empty until the first chunk with its number arrives.
+    """
+
+    def __init__(self, capacity):
+        self.capacity=capacity
+        self.slots=[None]*capacity
+        self.start=None
+        self.end=None
+
+    def __len__(self):
+        if self.start is None:
+            return 0
+        return self.end-self.start
+
+    def __getitem__(self, index):
+        ''' The composite at index from the start, None if no chunk arrived for it '''
+        return self.slots[(self.start+index)%self.capacity]
+
+    def reset(self, number):
+        self.start=number
+        self.end=number
+
+    def composite(self, number, requiredKeys):
+        slot=number%self.capacity
+        if self.slots[slot] is None:
+            self.slots[slot]=compositeChunk(number, requiredKeys)
+        self.end=max(self.end, number+1)
+        return self.slots[slot]
+
+    def popleft(self):
+        slot=self.start%self.capacity
+        composite=self.slots[slot]
+        self.slots[slot]=None
+        self.start+=1
+        return composite
+
+    def resize(self, capacity):
+        composites=[self[index] for index in range(len(self))]
+        self.capacity=capacity
+        self.slots=[None]*capacity
+        for composite in composites:
+            if composite is not None:
+                self.slots[composite.number%capacity]=composite
+
+
 class compositeManager(object):
 
+    defaultCapacity=64
+
     def __init__(self, requiredKeys,processor):
         self.requiredKeys=frozenset(requiredKeys)
         self.processor=processor
-        
+
+        config=getattr(processor, 'config', dict())
+        # Replicated processors only see every numberStride-th chunk
+        self.numberStride=config.get('numberStride', 1)
+
+        # Chunk numbers the manager waits for at most, a chunk further ahead evicts the oldest composites
+        self.capacity=config.get('ReorderCapacity', compositeManager.defaultCapacity)
+
+        # Input from replicated processors arrives out of order and is processed strictly by number
+        self.strictOrder=False
+        self.reorderWindow=None
+
         '''
-            compositeChunkList: central data structure of the manager contains references to all composite chunk that still need to be processed.
-            
-            position 0 contains the first unprocessed composite, will be processed when complete, will be discarded if a later composite completes before that time.              
+            compositeChunkRing: central data structure of the manager, holds the composite chunks that still need to be processed.
+
+            its start is the first unprocessed composite, will be processed when complete, will be evicted if a later composite completes before
+            that time or a chunk arrives capacity numbers ahead of it.
+
+            evictions: number and missing keys of the latest evicted composites.
         '''
         self.initialize()
 
-     
+
     def initialize(self):
-        self.compositeChunkList=list()
-        self.lastcompleted=None 
-        self.index0number=None       
+        self.compositeChunkRing=compositeRing(self.capacity)
+        self.evictions=collections.deque(maxlen=self.capacity)
+        self.lastcompleted=None
         self.streamInitialized=False
         self.alignments_out=dict()
-        
+        self.histories=dict()
+
         #self.chunkbuffer=dict(zip(self.requiredKeys,[None].len(self.requiredKeys)))
-            
+
+    def setStrictOrder(self, replicas):
+        ''' Process composites strictly in order of chunk number, a composite
+        completed ahead of its predecessors waits for them. An incomplete
+        composite is given up once the window spans more than reorderWindow
+        composites. '''
+        self.strictOrder=True
+        self.reorderWindow=max(self.reorderWindow or 0, 4*replicas)
+        if self.compositeChunkRing.capacity <= self.reorderWindow:
+            self.compositeChunkRing.resize(self.reorderWindow+1)
+
     def inject(self, receiverKey, chunk):
-        
-        ''' If the list is empty we make the incoming chunk the 
-        first compositeChunk in the list. If the chunk.number is 
-        beyond the end of a non-empty list we create the intermediate 
-        compositeChunk and the composite chunk needed. '''
-        
-        noofcomposites=len(self.compositeChunkList)
-        if  noofcomposites == 0:
-            newComposite=compositeChunk(chunk.number,self.requiredKeys)
-            self.compositeChunkList.append(newComposite)
-            self.index0number=chunk.number
-        else: 
-            while not chunk.number-self.index0number < noofcomposites:
-                newComposite=compositeChunk(self.index0number+noofcomposites,self.requiredKeys)
-                self.compositeChunkList.append(newComposite)
-                noofcomposites+=1
-                
-        
-        
+
+        ''' If the window is empty it starts at the number of the incoming
+        chunk. A chunk capacity numbers or more beyond the start of the window
+        evicts the composites before it. Composites are only created for
+        numbers that chunks arrive for. '''
+
+        ring=self.compositeChunkRing
+        if  len(ring) == 0 and self.strictOrder and self.lastcompleted is not None:
+            # Wait for the chunks following the last completed one as well
+            ring.reset(self.lastcompleted.number+1)
+        elif  len(ring) == 0:
+            ring.reset(chunk.number)
+        elif self.strictOrder and chunk.number < ring.start and ring.end-chunk.number <= ring.capacity and \
+                (self.lastcompleted is None or chunk.number > self.lastcompleted.number):
+            # Chunks from replicas can overtake chunks with lower numbers which are still expected
+            ring.start=chunk.number
+
+        if chunk.number >= ring.start+ring.capacity:
+            self.evict(chunk.number-ring.capacity+1)
+
         status=None
-        
-        index=chunk.number-self.index0number
-        self.processor.logger.info('Received a chunk for key {} number {}'.format(receiverKey,chunk.number))
+
+        index=chunk.number-ring.start
+        self.chunklogger.info('Received a chunk for key %s number %s', receiverKey, chunk.number)
+        if self.metrics is not None:
+            self.metrics.count('chunks_in_total', key=receiverKey)
+        if self.tracer is not None:
+            self.tracer.receive(receiverKey, chunk)
+        if self.metadataCache is not None:
+            self.metadataCache.learn(getattr(chunk, 'announcements', None))
         if  index >= 0:
-            status=self.compositeChunkList[index].update(receiverKey, chunk)
+            status=ring.composite(chunk.number, self.requiredKeys).update(receiverKey, chunk)
+        else:
+            self.processor.logger.warning('Received a chunk with an outdated chunknumber: {0} while index is at: {1}'.format(chunk.number, ring.start))
+
+        if self.strictOrder:
+            if status==compositeChunk.complete or len(ring) > self.reorderWindow:
+                self.processInOrder()
+        elif status==compositeChunk.complete:
+            self.completeComposite(index)
+            self.evict(chunk.number+1)
+
+    def processInOrder(self):
+        ring=self.compositeChunkRing
+        if len(ring) > self.reorderWindow:
+            self.evict(ring.end-self.reorderWindow)
+        while len(ring) > 0 and ring[0] is not None and ring[0].status==compositeChunk.complete:
+            self.evict(ring.start+1)
+
+    def completeComposite(self, index):
+        composite=self.compositeChunkRing[index]
+        self.processCompositeChunk(index)
+        composite.status=compositeChunk.processed
+        # Only the number of the last completed composite is needed, the histories keep the look-back
+        composite.received=dict()
+        self.lastcompleted=composite
+
+    def evict(self, number):
+        ''' Move the start of the window up to number, complete composites
+        before it are processed and incomplete ones given up. '''
+        ring=self.compositeChunkRing
+        while len(ring) > 0 and ring.start < number:
+            composite=ring[0]
+            if composite is None:
+                # Out of strict order a number nothing arrived for is just a gap in the stream
+                if self.strictOrder:
+                    self.giveUp(ring.start, self.requiredKeys)
+            elif composite.status==compositeChunk.complete:
+                self.completeComposite(0)
+            elif composite.status==compositeChunk.incomplete:
+                self.giveUp(composite.number, composite.openKeys)
+            ring.popleft()
+        if ring.start < number:
+            ring.reset(number)
+
+    def giveUp(self, number, missingKeys):
+        missingKeys=sorted(missingKeys)
+        self.evictions.append((number, missingKeys))
+        if self.metrics is not None:
+            for key in missingKeys:
+                self.metrics.count('composites_evicted_total', key=key)
+        if self.strictOrder:
+            self.processor.logger.warning('Giving up on chunk number {0}, missing keys {1}'.format(number, missingKeys))
         else:
-            self.processor.logger.warning('Received a chunk with an outdated chunknumber: {0} while index is at: {1}'.format(chunk.number, self.index0number))
-        
-        if status==compositeChunk.complete:
-            self.processCompositeChunk(index)
-            self.lastcompleted=self.compositeChunkList[index]
-            del self.compositeChunkList[:index+1]    
-            self.index0number+=index+1
-     
+            self.chunklogger.info('Evicted chunk number %s, missing keys %s', number, missingKeys)
+
     def processCompositeChunk(self,index):
         
         # Preprocess chunks
@@ -196,20 +417,31 @@ class compositeManager(object):
         # Some info is dynamic but stable over runtime
         if not self.streamInitialized:
             self.alignment_in, self.alignments_out  = self.calculateAlignment(index)   
+            if self.numberStride > 1:
+                self.checkStateless(index)
             self.sources                            = self.mergeSources(index)              
             self.streamInitialized                  = True
         
         dataGenerationTime,metadata,identifier      = self.fuseMetadata(index)
+        resolvedMetadata, unknown                   = self.resolveMetadata(metadata)
+        if unknown and continuity == Continuity.withprevious:
+            continuity=Continuity.discontinuous
         
         initialSampleTime = self.calculateInitialSampleTime(index,continuity, chunkcontinuity,starttime)
         
         
-        compositechunk=self.alignIncomingChunks(index, continuity, chunkcontinuity, starttime, dataGenerationTime,metadata, identifier, initialSampleTime)
+        compositechunk=self.alignIncomingChunks(index, continuity, chunkcontinuity, starttime, dataGenerationTime,resolvedMetadata, identifier, initialSampleTime)
         
+        processingStart=time.time()
         data=self.processor.processData(compositechunk)   # This is where the processor is called to do the real work.
+        processingEnd=time.time()
+        if self.metrics is not None:
+            self.metrics.observe('processdata_seconds', processingEnd-processingStart)
+        if self.tracer is not None:
+            self.tracer.process(compositechunk.number, processingStart, processingEnd)
         
         
-        self.processor.logger.debug("Got data in smartCompositeChunk")
+        self.chunklogger.debug("Got data in smartCompositeChunk")
         self.processor.publish(
             data, 
             continuity, 
@@ -219,7 +451,9 @@ class compositeManager(object):
             metadata=metadata,
             identifier=identifier,
         )
-        self.processor.logger.debug("Called publish on processor")
+        self.chunklogger.debug("Called publish on processor")
+        if self.metrics is not None:
+            self.processor.reportMetrics()
 
                 
         
@@ -239,7 +473,7 @@ class compositeManager(object):
         continuity=Continuity.withprevious         # this flag includes transmission error corrections
         chunkcontinuity=Continuity.withprevious    # this one is purely derived from incoming chunks
         
-        compositechunk=self.compositeChunkList[index]
+        compositechunk=self.compositeChunkRing[index]
         for key in self.requiredKeys:
             chunk=compositechunk.received[key]
             if chunk.continuity != Continuity.withprevious:
@@ -252,8 +486,10 @@ class compositeManager(object):
         if (continuity >= Continuity.withprevious):
             if (self.lastcompleted is None) :
                 continuity=Continuity.discontinuous
-            elif (compositechunk.number != self.lastcompleted.number+1 ):
+            elif (compositechunk.number != self.lastcompleted.number+self.numberStride ):
                 continuity=Continuity.discontinuous
+                if self.metrics is not None:
+                    self.metrics.count('discontinuities_total')
             
         ''' In the old code we did this and hopefully for some silly reason
          # Set continuity for all incoming chunks
@@ -267,7 +503,7 @@ class compositeManager(object):
         alignment_in=None
         alignments_out=dict()
         
-        compositechunk=self.compositeChunkList[index]
+        compositechunk=self.compositeChunkRing[index]
         for key in self.requiredKeys:
             chunk=compositechunk.received[key]
             if alignment_in  is None:
@@ -285,6 +521,36 @@ class compositeManager(object):
         
         return alignment_in, alignments_out
     
+    def checkStateless(self,index):
+        ''' A replica joins chunk k+numberStride to chunk k as if they were adjacent,
+        output depending on earlier chunks would silently be wrong. Look-back 
+        into the history of an input or by the processor itself is refused. '''
+        compositechunk=self.compositeChunkRing[index]
+        lookback=[key for key in self.requiredKeys 
+            if self.alignment_in.includedPast > compositechunk.received[key].alignment.includedPast]
+        lookback+=[key for (key, alignment) in self.processor.processorAlignments.items() 
+            if alignment.includedPast > 0 or alignment.droppedAfterDiscontinuity > 0]
+        if lookback:
+            raise ValueError('Processor {0} is replicated, but looks back into previous chunks for keys {1}. Only stateless processors can be replicated.'
+                .format(self.processor.name, sorted(lookback)))
+
+    @property
+    def chunklogger(self):
+        # Stand-ins for processors, as used in tests, may only have a logger
+        return getattr(self.processor, 'chunklogger', self.processor.logger)
+
+    @property
+    def metrics(self):
+        return getattr(self.processor, 'metrics', None)
+
+    @property
+    def tracer(self):
+        return getattr(self.processor, 'tracer', None)
+
+    @property
+    def metadataCache(self):
+        return getattr(self.processor, 'metadataCache', None)
+
     def getAlignment(self,key):
         alignment=chunkAlignment()
         
@@ -297,7 +563,7 @@ class compositeManager(object):
         
     def mergeSources(self, index):
         sources=set()
-        compositechunk=self.compositeChunkList[index]
+        compositechunk=self.compositeChunkRing[index]
         for key in self.requiredKeys:
             chunk=compositechunk.received[key]
             sources=sources.union(chunk.sources)
@@ -307,7 +573,7 @@ class compositeManager(object):
     def calculateStartTime(self,index):
         startTime='Initial'
         
-        compositechunk=self.compositeChunkList[index]
+        compositechunk=self.compositeChunkRing[index]
         for key in self.requiredKeys:
             chunk=compositechunk.received[key]
             
@@ -321,11 +587,10 @@ class compositeManager(object):
         return startTime
     
     def fuseMetadata(self,index):
-        compositechunk=self.compositeChunkList[index]
+        compositechunk=self.compositeChunkRing[index]
         dataGenerationTime=dict({self.processor.name:time.time()})
         identifier = None
         metadata=dict()
-        metadata[self.processor.name]   = self.processor.getMetaData()
         
         for key in self.requiredKeys:
             chunk=compositechunk.received[key]
@@ -339,8 +604,8 @@ class compositeManager(object):
                     dataGenerationTime[key2]=value2
             '''
             
-            metadata=dict(compositechunk.received[key].metadata.items()+
-            metadata.items())
+            for (name, description) in chunk.metadata.iteritems():
+                metadata.setdefault(name, description)
             
             
             
@@ -350,8 +615,23 @@ class compositeManager(object):
             else:
                 if not identifier==chunk.identifier:
                     raise ValueError('Received incompatible chunk identifiers: {0} {1}'.format(identifier,chunk.identifier))
+        
+        metadata[self.processor.name]   = self.processor.getCachedMetaData()
             
         return dataGenerationTime,metadata,identifier
+    
+    def resolveMetadata(self, metadata):
+        # Chunks carry references, processors get the descriptions and the names of 
+        # those with a description never announced, which are left out
+        if self.metadataCache is None:
+            return metadata, []
+        resolved=self.metadataCache.resolve(metadata)
+        unknown=self.metadataCache.unknown(metadata)
+        if unknown:
+            self.processor.logger.warning('No description known for the metadata of {0}, marking the chunk discontinuous'.format(unknown))
+            for name in unknown:
+                del resolved[name]
+        return resolved, unknown
         
     def alignIncomingChunks(self,index, 
                                 continuity, 
@@ -362,8 +642,7 @@ class compositeManager(object):
                                 identifier,
                                 initialSampleTime):
                                     
-        current_composite       = self.compositeChunkList[index]
-        previous_composite      = self.lastcompleted
+        current_composite       = self.compositeChunkRing[index]
         to_processor_composite  = compositeChunk(current_composite.number, 
                                                         self.requiredKeys, 
                                                         starttime, 
@@ -401,37 +680,24 @@ class compositeManager(object):
                     chunkdiscontinuity_lowindicesdrop=self.alignment_in.droppedAfterDiscontinuity+current_chunk.alignment.includedPast
                     
                     
-                    self.processor.logger.info("Keys in arriving chunk {0}".format(key))
-                    self.processor.logger.info("          lowindices_drop {0}".format(lowindices_drop))
-                    self.processor.logger.info("          highindices_drop {0}".format(highindices_drop))
-                    self.processor.logger.info("          chunkdiscontinuity_lowindicesdrop {0}".format(chunkdiscontinuity_lowindicesdrop))
-                    self.processor.logger.info("          dimension {0}".format(dimension))
+                    self.chunklogger.info("Keys in arriving chunk %s, lowindices_drop %s, highindices_drop %s, chunkdiscontinuity_lowindicesdrop %s, dimension %s",
+                        key, lowindices_drop, highindices_drop, chunkdiscontinuity_lowindicesdrop, dimension)
                     
                     
-                    if dimension == 1:
-                        if continuity >= Continuity.withprevious:                   # Regular Continuous Case
-                            previous_data=previous_composite.received[key].data
-                            previous_data_shape=np.shape(previous_data)
-                            previous_data_length=previous_data_shape[-1]
-                            
-                            newdata=np.concatenate((previous_data[previous_data_length-highindices_drop:],current_data[:current_data_length-highindices_drop]))
-                        elif current_chunk.continuity >= Continuity.withprevious:   # Irregular Discontinuous Case
-                            newdata=current_data[chunkdiscontinuity_lowindicesdrop:current_data_length-highindices_drop]  # shave off the part  not present had this chunk been discontinuous and the part shaved of if it had been discontinuous.
-                        else:                                                       # Regular Discontinuous Case
-                            newdata=current_data[lowindices_drop:current_data_length-highindices_drop]
-                    elif dimension == 2:
-                        if continuity >= Continuity.withprevious:                   # Regular Continuous Case
-                            previous_data=previous_composite.received[key].data
-                            previous_data_shape=np.shape(previous_data)
-                            previous_data_length=previous_data_shape[-1]
-                            newdata=np.concatenate((previous_data[:,previous_data_length-highindices_drop:],current_data[:,:current_data_length-highindices_drop]), axis=1)
-                        elif current_chunk.continuity >= Continuity.withprevious:   # Irregular Discontinuous Case
-                            newdata=current_data[:,chunkdiscontinuity_lowindicesdrop:current_data_length-highindices_drop]  # shave off the part  not present had this stream been discontinuous and the part shaved of it it had been discontinuous.
-                        else:                                                       # Regular Discontinuous Case
-                            newdata=current_data[:,lowindices_drop:current_data_length-highindices_drop]
-                    else:
+                    if dimension > 2:
                         raise ValueError('compositeManager does not support numpy arrays of dimensions higher than 2')
                     
+                    # The stream of a key is appended to its history, a continuous chunk 
+                    # is a view starting highindices_drop frames back in the history
+                    history=self.histories.setdefault(key, rollingBuffer())
+                    start=history.append(current_data, highindices_drop)
+                    if continuity >= Continuity.withprevious:                   # Regular Continuous Case
+                        newdata=history.view(start-highindices_drop, start+current_data_length-highindices_drop)
+                    elif current_chunk.continuity >= Continuity.withprevious:   # Irregular Discontinuous Case
+                        newdata=history.view(start+chunkdiscontinuity_lowindicesdrop, start+current_data_length-highindices_drop)  # shave off the part  not present had this stream been discontinuous and the part shaved of it it had been discontinuous.
+                    else:                                                       # Regular Discontinuous Case
+                        newdata=history.view(start+lowindices_drop, start+current_data_length-highindices_drop)
+                    
                     newChunk=DataChunk( newdata, 
                                         starttime, 
                                         current_chunk.fs, 
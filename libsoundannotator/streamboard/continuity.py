@@ -65,14 +65,23 @@ class chunkAlignment(object):
     """
         Class to keep track of alignment of chunk with respect to the original signal
     """
+    
+    __slots__ = ('includedPast', 'droppedAfterDiscontinuity', 'invalidLargeScales', 
+        'invalidSmallScales', 'alignable', 'fsampling', 'eventlike')
+    
     def __init__(self   , includedPast=0 , droppedAfterDiscontinuity=0 
                         , invalidLargeScales=0 , invalidSmallScales=0
                         , alignable=True, fsampling=None
                         ,eventlike=False):
         
-        self.set(includedPast, droppedAfterDiscontinuity, invalidLargeScales
-                            , invalidSmallScales, alignable
-                            , fsampling,eventlike)
+        # Assigned here rather than through set, every chunk without alignment creates one
+        self.includedPast=includedPast
+        self.droppedAfterDiscontinuity=droppedAfterDiscontinuity
+        self.invalidLargeScales=invalidLargeScales
+        self.invalidSmallScales=invalidSmallScales
+        self.alignable=alignable
+        self.fsampling=fsampling
+        self.eventlike=eventlike
         
     def set(self, includedPast, droppedAfterDiscontinuity, 
                     invalidLargeScales, invalidSmallScales, 
@@ -85,6 +94,10 @@ class chunkAlignment(object):
         self.fsampling=fsampling
         self.eventlike=eventlike
     
+    def __reduce__(self):
+        return (type(self), (self.includedPast, self.droppedAfterDiscontinuity, self.invalidLargeScales, 
+            self.invalidSmallScales, self.alignable, self.fsampling, self.eventlike))
+    
     def copy(self):
         return chunkAlignment(
             self.includedPast,
@@ -195,6 +208,8 @@ class chunkAlignment(object):
               
 class processorAlignment(chunkAlignment):
     
+    __slots__ = ()
+    
     def copy(self):
         return processorAlignment(
             self.includedPast,
@@ -0,0 +1,260 @@
+'''
+This file is part of libsoundannotator. The library libsoundannotator is
+designed for processing sound using time-frequency representations.
+
+Copyright 2011-2014 Sensory Cognition Group, University of Groningen
+Copyright 2014-2017 SoundAppraisal BV
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+'''
+Credit based flow control for subscriptions.
+
+A subscription created with credits=N allows at most N chunks to be in
+transit between publisher and subscriber. The subscriber returns a Credit
+over the same duplex pipe for every chunk it receives. Chunks published
+while no credit is available wait in a bounded queue of overflowQueueLength
+chunks, the overflowPolicy decides what happens when that queue is full:
+
+    block           wait up to creditTimeout seconds for a credit, drop the
+                    new chunk if none arrives. With creditTimeout=None wait
+                    as long as it takes, as a full pipe would
+    drop-oldest     drop the oldest queued chunk
+    drop-newest     drop the new chunk
+    coalesce        replace everything queued by the new chunk
+
+Dropped chunks show up at the subscriber as gaps in the chunk numbers,
+which the compositeManager already treats as a discontinuity. Every drop
+is counted in the FlowCounters of the subscription. A subscriber that went
+away closes the connection, chunks offered to it are dropped and the
+publisher removes the subscription.
+
+Usage:
+    SubscriptionOrder('myTFProcessor','myFileOutput','E','E',
+        credits=4, overflowPolicy='drop-oldest', overflowQueueLength=2)
+'''
+import time
+from collections import deque
+
+overflowPolicies = ['block', 'drop-oldest', 'drop-newest', 'coalesce']
+
+
+class Credit(object):
+    """ Returned by a subscriber for every chunk it received.
+    """
+    def __init__(self, count=1):
+        self.count = count
+
+
+class FlowCounters(object):
+    """ Counts what happened to the chunks offered to a subscription.
+    """
+    names = ['sent', 'queued', 'blocked', 'timedOut', 'droppedOldest', 'droppedNewest', 'coalesced', 'droppedClosed']
+
+    def __init__(self):
+        self.counts = dict([(name, 0) for name in self.names])
+
+    def count(self, name, n=1):
+        self.counts[name] += n
+
+    def dropped(self):
+        return (self.counts['timedOut'] + self.counts['droppedOldest'] +
+            self.counts['droppedNewest'] + self.counts['coalesced'] + self.counts['droppedClosed'])
+
+    def __str__(self):
+        return ', '.join(['{0}: {1}'.format(name, self.counts[name]) for name in self.names])
+
+
+class CreditedConnection(object):
+    """ Sending end of a subscription with credit based flow control. Offers
+        the send/send_bytes interface of the wrapped connection.
+    """
+    def __init__(self, connection, subscriptionorder, counters, logger=None):
+        self.connection = connection
+        self.credits    = subscriptionorder.credits
+        self.policy     = subscriptionorder.overflowPolicy
+        self.queueLength    = subscriptionorder.overflowQueueLength
+        self.timeout    = subscriptionorder.creditTimeout
+        self.counters   = counters
+        self.logger     = logger
+        self.pending    = deque()
+        # Set once the subscriber went away
+        self.closed     = False
+
+        if hasattr(connection, 'send_bytes'):
+            self.send_bytes = self._send_bytes
+
+    def send(self, chunk):
+        self.offer(self.connection.send, chunk)
+
+    def _send_bytes(self, payload):
+        self.offer(self.connection.send_bytes, payload)
+
+    def offer(self, method, item):
+        self.flush()
+
+        if self.closed:
+            self.counters.count('droppedClosed')
+            return
+
+        if self.credits > 0:
+            self.transmit(method, item)
+            return
+
+        if len(self.pending) < self.queueLength and self.policy != 'coalesce':
+            self.pending.append((method, item))
+            self.counters.count('queued')
+        elif self.policy == 'block':
+            self.counters.count('blocked')
+            if self.waitForCredit(self.deadline(self.timeout)):
+                self.flush()
+                self.pending.append((method, item))
+                self.flush()
+            elif self.closed:
+                self.counters.count('droppedClosed')
+            else:
+                self.counters.count('timedOut')
+                self.logDrop('no credit within {0}s'.format(self.timeout))
+        elif self.policy == 'drop-newest':
+            self.counters.count('droppedNewest')
+            self.logDrop('queue full')
+        elif self.policy == 'drop-oldest':
+            self.pending.popleft()
+            self.pending.append((method, item))
+            self.counters.count('droppedOldest')
+            self.logDrop('queue full')
+        elif self.policy == 'coalesce':
+            self.counters.count('coalesced', len(self.pending))
+            self.pending.clear()
+            self.pending.append((method, item))
+
+    def flush(self, timeout=0):
+        """ Collect returned credits and send queued chunks while credits
+            last. Waits up to timeout seconds, or as long as it takes with
+            timeout=None, for the queue to empty, returns True if it did.
+        """
+        deadline = self.deadline(timeout)
+        self.collectCredits()
+        while len(self.pending) > 0 and not self.closed:
+            if self.credits == 0 and not self.waitForCredit(deadline):
+                return False
+            (method, item) = self.pending.popleft()
+            self.transmit(method, item)
+
+        if self.closed:
+            self.counters.count('droppedClosed', len(self.pending))
+            self.pending.clear()
+            return False
+        return True
+
+    def transmit(self, method, item):
+        if self.closed:
+            self.counters.count('droppedClosed')
+            return
+        try:
+            method(item)
+        except (EOFError, IOError):
+            self.subscriberClosed()
+            self.counters.count('droppedClosed')
+            return
+        self.credits -= 1
+        self.counters.count('sent')
+
+    def collectCredits(self):
+        while not self.closed and self.pollCredit(0):
+            self.receiveCredit()
+
+    def deadline(self, timeout):
+        if timeout is None:
+            return None
+        return time.time() + timeout
+
+    def waitForCredit(self, deadline):
+        while self.credits == 0 and not self.closed:
+            remaining = None if deadline is None else deadline - time.time()
+            if (remaining is not None and remaining <= 0) or not self.pollCredit(remaining):
+                return False
+            self.receiveCredit()
+        return self.credits > 0
+
+    def pollCredit(self, timeout):
+        try:
+            return self.connection.poll(timeout)
+        except (EOFError, IOError):
+            self.subscriberClosed()
+            return False
+
+    def receiveCredit(self):
+        try:
+            message = self.connection.recv()
+        except (EOFError, IOError):
+            self.subscriberClosed()
+            return
+        if isinstance(message, Credit):
+            self.credits += message.count
+        elif self.logger is not None:
+            self.logger.warning('Unexpected message {0} on credited connection'.format(message))
+
+    def subscriberClosed(self):
+        """ The subscriber went away, no credits will return
+        """
+        if not self.closed and self.logger is not None:
+            self.logger.info('Subscriber closed the connection, dropping {0} queued chunks'.format(len(self.pending)))
+        self.closed = True
+
+    def logDrop(self, reason):
+        if self.logger is not None:
+            self.logger.debug('Dropped chunk, {0}. {1}'.format(reason, self.counters))
+
+    def poll(self, timeout=0.0):
+        return self.connection.poll(timeout)
+
+    def fileno(self):
+        return self.connection.fileno()
+
+    def close(self):
+        self.connection.close()
+
+
+class CreditReturningConnection(object):
+    """ Receiving end of a subscription with credit based flow control,
+        returns a credit for every chunk received.
+    """
+    def __init__(self, connection):
+        self.connection = connection
+
+    def recv(self):
+        try:
+            chunk = self.connection.recv()
+        except IOError:
+            # Credits left unread by a publisher that stopped reset the connection
+            raise EOFError('Publisher closed the connection')
+        try:
+            self.connection.send(Credit())
+        except (IOError, OSError):
+            # The publisher is gone, nobody is waiting for the credit
+            pass
+        return chunk
+
+    def poll(self, timeout=0.0):
+        try:
+            return self.connection.poll(timeout)
+        except IOError:
+            # Let recv report the end of the stream
+            return True
+
+    def fileno(self):
+        return self.connection.fileno()
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,346 @@
+'''
+This file is part of libsoundannotator. The library libsoundannotator is
+designed for processing sound using time-frequency representations.
+
+Copyright 2011-2014 Sensory Cognition Group, University of Groningen
+Copyright 2014-2017 SoundAppraisal BV
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+'''
+Declarative pipelines.
+
+A PipelineGraph describes the processors of a Board and their subscriptions
+in a JSON file:
+
+    {
+        "cores": [0, 1, 2, 3],
+        "processors": [
+            {"name": "wav", "class": "libsoundannotator.streamboard.processors.input.wav.WavProcessor",
+             "parameters": {"SoundFiles": ["a.wav"], "ChunkSize": 1024, "timestep": 0.02, "SampleRate": 44100},
+             "cost": 0.1},
+            {"name": "gcfb", "class": "libsoundannotator.cpsp.tfprocessor.GammachirpProcessor",
+             "inputs": [{"from": "wav", "senderKey": "sound", "receiverKey": "sound"}],
+             "parameters": {"SampleRate": 44100}, "cost": 2.0, "nice": -5, "realtime": 10}
+        ]
+    }
+
+Inputs take the keyword arguments of SubscriptionOrder as well, processors
+take host, fuseWith and replicas. validate checks the graph before anything is
+started: classes must import, inputs must name known processors without
+forming cycles, the receiverKeys must match the requiredKeys of the
+subscribing processor and, where the processorAlignments of the publishing
+processor can be obtained, the senderKeys must be among them.
+
+start starts the processors in topological order and then places them on
+the cores. Placement assigns the most expensive processes first, each to
+the core with the least cost so far, and pins the processes with CPU
+affinity. The cost of a hosted or fused processor counts for its host.
+Declared costs can be replaced by measured CPU usage with rebalance.
+
+Usage:
+    graph = PipelineGraph.fromFile('pipeline.json')
+    graph.validate()
+    board = Board()
+    board.startGraph(graph)
+'''
+import importlib, json, logging, multiprocessing, subprocess, time
+import psutil
+
+from subscription import SubscriptionOrder
+from continuity   import chunkAlignment
+
+logger = logging.getLogger('libsoundannotator')
+
+
+class GraphSpecError(ValueError):
+    pass
+
+
+def placeProcessors(costs, cores):
+    """ Assign processes to cores, heaviest first to the least loaded core.
+
+        costs   dict from process name to cost
+        cores   list of core numbers
+
+        Returns a dict from process name to core.
+    """
+    load = dict([(core, 0.0) for core in cores])
+    placement = dict()
+    for name in sorted(costs, key=lambda name: (-costs[name], name)):
+        core = min(cores, key=lambda core: (load[core], core))
+        placement[name] = core
+        load[core] += costs[name]
+    return placement
+
+
+class PipelineGraph(object):
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.cores = spec.get('cores', None)
+        self.nodes = list()
+        self.byName = dict()
+
+        for node in spec.get('processors', []):
+            if not 'name' in node or not 'class' in node:
+                raise GraphSpecError('Every processor needs a name and a class: {0}'.format(node))
+            if node['name'] in self.byName:
+                raise GraphSpecError('Duplicate processor name {0}'.format(node['name']))
+            node.setdefault('inputs', [])
+            node.setdefault('parameters', {})
+            self.nodes.append(node)
+            self.byName[node['name']] = node
+
+        self.placement = dict()
+
+    @classmethod
+    def fromFile(cls, filename):
+        with open(filename) as f:
+            return cls(json.load(f))
+
+    def processorClass(self, node):
+        (modulename, _, classname) = node['class'].rpartition('.')
+        try:
+            return getattr(importlib.import_module(modulename), classname)
+        except (ImportError, AttributeError, ValueError) as e:
+            raise GraphSpecError('Cannot load class {0} of processor {1}: {2}'.format(node['class'], node['name'], e))
+
+    def subscriptionOrders(self, node):
+        orders = list()
+        for subscription in node['inputs']:
+            kwargs = dict(subscription)
+            upstream = kwargs.pop('from')
+            senderKey = kwargs.pop('senderKey')
+            receiverKey = kwargs.pop('receiverKey', senderKey)
+            orders.append(SubscriptionOrder(upstream, node['name'], senderKey, receiverKey, **kwargs))
+        return orders
+
+    def topologicalOrder(self):
+        order = list()
+        state = dict()
+
+        def visit(name, path):
+            if state.get(name) == 'done':
+                return
+            if state.get(name) == 'visiting':
+                raise GraphSpecError('Cycle in pipeline graph: {0}'.format(' -> '.join(path + [name])))
+            state[name] = 'visiting'
+            for subscription in self.byName[name]['inputs']:
+                visit(subscription['from'], path + [name])
+            for key in ('host', 'fuseWith'):
+                if self.byName[name].get(key):
+                    visit(self.byName[name][key], path + [name])
+            state[name] = 'done'
+            order.append(self.byName[name])
+
+        for node in self.nodes:
+            visit(node['name'], [])
+
+        return order
+
+    def validate(self, probe=True):
+        """ Check the graph, raises a GraphSpecError describing the first
+            problem found. With probe=True the publishing processors are
+            constructed, without starting them, to learn their processorAlignments.
+        """
+        for node in self.nodes:
+            for subscription in node['inputs']:
+                if not 'from' in subscription or not 'senderKey' in subscription:
+                    raise GraphSpecError('Input of {0} needs from and senderKey: {1}'.format(node['name'], subscription))
+                if not subscription['from'] in self.byName:
+                    raise GraphSpecError('Processor {0} subscribes to unknown processor {1}'.format(node['name'], subscription['from']))
+            for key in ('host', 'fuseWith'):
+                if node.get(key) and not node[key] in self.byName:
+                    raise GraphSpecError('Processor {0} has unknown {1} {2}'.format(node['name'], key, node[key]))
+
+        self.topologicalOrder()
+
+        outputs = dict()
+        for node in self.nodes:
+            processorClass = self.processorClass(node)
+
+            receiverKeys = [order.receiverKey for order in self.subscriptionOrders(node)]
+            requiredKeys = getattr(processorClass, 'requiredKeys', [])
+            if set(receiverKeys) != set(requiredKeys) or len(receiverKeys) != len(set(receiverKeys)):
+                raise GraphSpecError('Processor {0} requires keys {1}, its inputs provide {2}'
+                    .format(node['name'], sorted(requiredKeys), sorted(receiverKeys)))
+
+            if probe:
+                outputs[node['name']] = self.probeOutputs(processorClass, node)
+
+        for node in self.nodes:
+            for subscription in node['inputs']:
+                available = outputs.get(subscription['from'])
+                if available is not None and subscription['senderKey'] != '*' and not subscription['senderKey'] in available:
+                    raise GraphSpecError('Processor {0} subscribes to key {1} of {2}, which only publishes {3}'
+                        .format(node['name'], subscription['senderKey'], subscription['from'], sorted(available)))
+
+    def probeOutputs(self, processorClass, node):
+        """ Keys of the processorAlignments of a processor, None when these
+            cannot be known before the processor runs.
+        """
+        processorAlignments = self.probeAlignments(processorClass, node)
+
+        # Processors without fixed outputs, such as those calibrated at runtime, publish an empty dict here
+        if not processorAlignments:
+            return None
+        return set(processorAlignments.keys())
+
+    def probeAlignments(self, processorClass, node):
+        """ The processorAlignments of a processor constructed without starting
+            it, None when these cannot be known before the processor runs.
+        """
+        (boardConn, other) = multiprocessing.Pipe()
+        try:
+            instance = processorClass(boardConn, node['name'], **node['parameters'])
+            if not hasattr(instance, 'processorAlignments'):
+                instance.setProcessorAlignments()
+            return instance.processorAlignments
+        except Exception as e:
+            logger.info('Cannot determine the output keys of processor {0} up front: {1}'.format(node['name'], e))
+            return None
+        finally:
+            boardConn.close()
+            other.close()
+
+    def alignments(self):
+        """ The chunkAlignment of every output of every processor, accumulated
+            along the graph from the input processors, as a dict from processor
+            name to a dict from key to chunkAlignment. Raises a GraphSpecError
+            when the processorAlignments of a processor cannot be obtained.
+        """
+        alignments = dict()
+        for node in self.topologicalOrder():
+            processorAlignments = self.probeAlignments(self.processorClass(node), node)
+            if processorAlignments is None:
+                raise GraphSpecError('Cannot determine the alignment of processor {0}'.format(node['name']))
+
+            alignment_in = None
+            for subscription in node['inputs']:
+                upstream = alignments[subscription['from']].get(subscription['senderKey'])
+                if upstream is None:
+                    raise GraphSpecError('Cannot determine the alignment of key {0} of processor {1}'
+                        .format(subscription['senderKey'], subscription['from']))
+                alignment_in = upstream.copy() if alignment_in is None else alignment_in.merge(upstream)
+
+            alignments[node['name']] = dict()
+            for (key, processoralignment) in processorAlignments.items():
+                # Input processors impose their alignment on an empty one, as in InputProcessor.getAlignment
+                start = alignment_in if alignment_in is not None else chunkAlignment(fsampling=processoralignment.fsampling)
+                try:
+                    alignments[node['name']][key] = start.impose_processor_alignment(processoralignment)
+                except ValueError as e:
+                    raise GraphSpecError('Cannot determine the alignment of key {0} of processor {1}: {2}'.format(key, node['name'], e))
+
+        return alignments
+
+    def start(self, board, place=True):
+        """ Start all processors on the board in topological order and, with
+            place=True, place them on cores. Subscribers of a processor with
+            more than one subscriber are not fused unless their node sets fuseWith.
+        """
+        subscribers = dict()
+        for node in self.nodes:
+            for subscription in node['inputs']:
+                subscribers.setdefault(subscription['from'], set()).add(node['name'])
+
+        for node in self.topologicalOrder():
+            kwargs = dict(node['parameters'])
+            if any([len(subscribers[subscription['from']]) > 1 for subscription in node['inputs']]):
+                kwargs['fuseWith'] = False
+            for key in ('host', 'fuseWith', 'replicas'):
+                if key in node:
+                    kwargs[key] = node[key]
+            board.startProcessor(node['name'], self.processorClass(node), *self.subscriptionOrders(node), **kwargs)
+
+        if place:
+            self.place(board)
+
+    def processes(self, board):
+        """ Map of the names of processes started on the board to their
+            psutil.Process and graph node, guests are left out.
+        """
+        processes = dict()
+        for node in self.nodes:
+            for name in board.replicas.get(node['name'], [node['name']]):
+                if board.getHost(name) == name and name in board.processors:
+                    instance = board.processors[name][0]
+                    if getattr(instance, 'pid', None) is not None:
+                        processes[name] = (psutil.Process(instance.pid), node)
+        return processes
+
+    def place(self, board, costs=None):
+        """ Pin every process to a core according to costs, a dict from processor
+            name to cost, or the declared costs. Sets the declared nice values and
+            realtime priorities as well.
+        """
+        if costs is None:
+            costs = dict([(node['name'], float(node.get('cost', 1.0))) for node in self.nodes])
+
+        processes = self.processes(board)
+        processcosts = dict([(name, 0.0) for name in processes])
+        for (name, cost) in costs.items():
+            # The replicas of a processor share its cost
+            names = board.replicas.get(name, [name])
+            for replica in names:
+                if board.getHost(replica) in processcosts:
+                    processcosts[board.getHost(replica)] += cost/len(names)
+
+        cores = self.cores
+        if cores is None:
+            cores = range(psutil.cpu_count())
+
+        self.placement = placeProcessors(processcosts, cores)
+
+        for (name, (process, node)) in processes.items():
+            try:
+                process.cpu_affinity([self.placement[name]])
+                if 'nice' in node:
+                    process.nice(node['nice'])
+                if node.get('realtime'):
+                    subprocess.check_call(['chrt', '-f', '-p', str(node['realtime']), str(process.pid)])
+                board.logger.info('Placed processor {0} on core {1}'.format(name, self.placement[name]))
+            except (psutil.Error, AttributeError, OSError, subprocess.CalledProcessError) as e:
+                board.logger.warning('Could not place processor {0}: {1}'.format(name, e))
+
+        return self.placement
+
+    def measure(self, board, interval=1.0):
+        """ CPU usage in seconds per second of every process, the usage of
+            guests is attributed to their host.
+        """
+        processes = self.processes(board)
+        before = dict()
+        for (name, (process, node)) in processes.items():
+            times = process.cpu_times()
+            before[name] = times.user + times.system
+
+        time.sleep(interval)
+
+        usage = dict()
+        for (name, (process, node)) in processes.items():
+            try:
+                times = process.cpu_times()
+            except psutil.Error:
+                continue
+            usage[name] = (times.user + times.system - before[name])/interval
+        return usage
+
+    def rebalance(self, board, interval=1.0):
+        """ Measure the CPU usage of the running processes for interval seconds
+            and place them again according to it.
+        """
+        usage = self.measure(board, interval)
+        board.logger.info('Measured CPU usage {0}'.format(usage))
+        return self.place(board, usage)
@@ -0,0 +1,210 @@
+'''
+This file is part of libsoundannotator. The library libsoundannotator is
+designed for processing sound using time-frequency representations.
+
+Copyright 2011-2014 Sensory Cognition Group, University of Groningen
+Copyright 2014-2017 SoundAppraisal BV
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+'''
+In-process placement of processors.
+
+A processor started with host='otherProcessor' does not get a process of its
+own. The Board asks the host processor to construct it, the host then runs
+the guest in a thread of its own process. Subscriptions between processors
+living in the same process use a LocalConnection, chunks are passed by
+reference and never pickled.
+
+A processor started with fuseWith='otherProcessor' is hosted as well, but
+runs without a thread of its own. Chunks published to it are injected
+straight into its compositeManager through a DirectConnection, so a linear
+chain of fused processors runs as nested calls of processData and publish
+in the process of the first processor of the chain. The host services the
+board connections of its fused guests. A fused processor can only receive
+from processors in the same process. Chunks sent before the fused processor
+is registered are kept, up to DirectConnection.pendingLength, and injected
+ahead of the next chunk.
+
+Usage:
+    b.startProcessor('myMicInput', MicInput, SampleRate=44100, ChunkSize=1024)
+    b.startProcessor('myRelay', AudioRelayProcessor,
+        SubscriptionOrder('myMicInput','myRelay','sound','sound'),
+        SampleRate=44100, host='myMicInput')
+    b.startProcessor('myResampler', Resampler,
+        SubscriptionOrder('myRelay','myResampler','sound','timeseries'),
+        SampleRate=44100, fuseWith='myRelay')
+'''
+import copy, errno, fcntl, logging, os, select, threading
+from collections import deque
+
+import multiprocessing.reduction as reduction
+
+logger = logging.getLogger('libsoundannotator')
+
+
+class LocalConnection(object):
+    """ One end of an in-process duplex connection. Offers poll/send/recv
+        and a fileno which becomes readable when something was sent, so
+        Processor.getInputs can wait on it together with its pipes.
+
+        Every message is announced with a byte on a wake pipe. The bytes are
+        only hints, poll drains them and then looks at the queue itself.
+    """
+    def __init__(self, inbox, outbox, wakeread, wakewrite):
+        self.inbox      = inbox
+        self.outbox     = outbox
+        self.wakeread   = wakeread
+        self.wakewrite  = wakewrite
+
+    def send(self, obj):
+        self.outbox.append(obj)
+        try:
+            os.write(self.wakewrite, 'x')
+        except OSError as e:
+            # A full wake pipe is readable already
+            if e.errno != errno.EAGAIN:
+                raise
+
+    def recv(self):
+        # The receiver gets its own chunk object sharing the data with the sender
+        return copy.copy(self.inbox.popleft())
+
+    def poll(self, timeout=0.0):
+        if len(self.inbox) == 0 and timeout != 0:
+            select.select([self.wakeread], [], [], timeout)
+        try:
+            os.read(self.wakeread, 4096)
+        except OSError as e:
+            if e.errno != errno.EAGAIN:
+                raise
+        return len(self.inbox) > 0
+
+    def fileno(self):
+        return self.wakeread
+
+    def close(self):
+        pass
+
+
+def _wakePipe():
+    (r, w) = os.pipe()
+    for fd in (r, w):
+        fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+    return (r, w)
+
+def localConnectionPair():
+    """ Create two connected LocalConnections, the analogue of multiprocessing.Pipe()
+    """
+    (a, b) = (deque(), deque())
+    (ar, aw) = _wakePipe()
+    (br, bw) = _wakePipe()
+    return (LocalConnection(a, b, ar, bw), LocalConnection(b, a, br, aw))
+
+
+_channels = dict()
+_channelsLock = threading.Lock()
+
+def openLocalConnection(key, side):
+    """ Return end 'side' (0 or 1) of the local connection 'key', creating the
+        pair when the first end is opened. Both ends have to be opened in the
+        same process.
+    """
+    with _channelsLock:
+        if not key in _channels:
+            _channels[key] = [localConnectionPair(), set()]
+        (pair, opened) = _channels[key]
+        opened.add(side)
+        if len(opened) == 2:
+            del _channels[key]
+    return pair[side]
+
+
+class DirectConnection(object):
+    """ Sending end of a subscription to a fused processor, send injects the
+        chunk into the compositeManager of the subscriber. The receiving end
+        never has anything to poll.
+    """
+    synchronous = True
+
+    pendingLength = 64
+
+    def __init__(self, subscriberName, receiverKey):
+        self.subscriberName = subscriberName
+        self.receiverKey    = receiverKey
+        self.pending        = deque()
+        self.dropped        = 0
+
+    def send(self, chunk):
+        # The subscriber may be created after its upstream started publishing
+        subscriber = _fusedProcessors.get(self.subscriberName)
+        if subscriber is None:
+            if len(self.pending) == self.pendingLength:
+                self.pending.popleft()
+                self.dropped += 1
+                if self.dropped == 1:
+                    logger.warning('Fused processor {0} not registered yet, dropping its oldest pending chunks'.format(self.subscriberName))
+            self.pending.append(copy.copy(chunk))
+            return
+        while self.pending:
+            subscriber.compositeManager.inject(self.receiverKey, self.pending.popleft())
+        subscriber.compositeManager.inject(self.receiverKey, copy.copy(chunk))
+
+    def poll(self, timeout=0.0):
+        return False
+
+    def close(self):
+        pass
+
+
+_fusedProcessors = dict()
+
+def openDirectConnection(subscriberName, receiverKey):
+    return DirectConnection(subscriberName, receiverKey)
+
+def registerFusedProcessor(processor):
+    _fusedProcessors[processor.name] = processor
+
+def unregisterFusedProcessor(processor):
+    _fusedProcessors.pop(processor.name, None)
+
+
+class HostedProcessorOrder(object):
+    """ Contents of a BoardMessage.hostprocessor, everything a host processor
+        needs to construct a guest.
+    """
+    def __init__(self, processorClass, name, boardConn, kwargs, fused=False):
+        self.processorClass = processorClass
+        self.name           = name
+        self.boardConn      = reduction.reduce_connection(boardConn)
+        self.kwargs         = kwargs
+        self.fused          = fused
+
+    def create(self):
+        boardConn = self.boardConn[0](*self.boardConn[1])
+        guest = self.processorClass(boardConn, self.name, **self.kwargs)
+        guest.hosted = True
+        return guest
+
+
+class HostedProcessor(object):
+    """ Stands in for a guest processor in the administration of the Board,
+        a guest is alive as long as its host is.
+    """
+    def __init__(self, name, host, hostName):
+        self.name       = name
+        self.host       = host
+        self.hostName   = hostName
+
+    def is_alive(self):
+        return self.host.is_alive()
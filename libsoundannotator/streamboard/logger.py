@@ -21,10 +21,26 @@ limitations under the License.
 Unify calls to logger under windows and linux. Multiprocessing 
 logger fails under windows, to make some level of logging available 
 it is redericted to stdout.
+
+Asynchronous logging: a Board created with asyncLogging=True starts a
+LogWriter process and gives every processor a QueueHandler instead of a
+RotatingFileHandler of its own. Logging then only costs the caller the
+creation of a record and putting it on a queue, the writer formats the
+record and writes it to the same per processor log file as before.
+Messages are formatted lazily, pass the arguments instead of formatting
+the string up front:
+
+    self.logger.info('Received chunk %s for key %s', chunk.number, key)
+
+Messages logged for every chunk go to the chunklogger of a processor. It
+passes only one in ChunkLogSampling records and, when ChunkLogRate is set,
+at most ChunkLogRate records per second of the same message.
 '''
 import multiprocessing
-import logging
-import sys, os
+import logging, logging.handlers
+import sys, os, time, Queue
+
+logformat = '%(asctime)s %(name)-15s %(levelname)-8s %(processName)-10s %(message)s'
 
 def new(reattach=False, level=logging.WARNING):
     
@@ -67,3 +83,106 @@ class win_logger(object):
     def critical(self,critical):
         if(self.level <= logging.CRITICAL):
             print('[CRITICAL]: {0}' .format(critical))
+
+
+class QueueHandler(logging.Handler):
+    """ Hands records to a LogWriter. The message is formatted by the writer,
+        unless its arguments might not survive pickling. Records are dropped
+        rather than blocking the caller when the queue is full.
+    """
+    simpletypes = (basestring, int, long, float, bool, type(None))
+
+    def __init__(self, queue, logfile):
+        logging.Handler.__init__(self)
+        self.queue = queue
+        self.logfile = logfile
+        self.dropped = 0
+
+    def prepare(self, record):
+        args = record.args
+        if not isinstance(record.msg, basestring) or isinstance(args, dict) or \
+                (args and not all([isinstance(arg, self.simpletypes) for arg in args])):
+            record.msg = record.getMessage()
+            record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        record.logfile = self.logfile
+        return record
+
+    def emit(self, record):
+        try:
+            self.queue.put_nowait(self.prepare(record))
+        except Queue.Full:
+            self.dropped += 1
+        except Exception:
+            self.handleError(record)
+
+
+class LogWriter(multiprocessing.Process):
+    """ Writes the records put on queue by QueueHandlers to a rotating log
+        file per logfile in logdir. Put None on the queue to stop it, records
+        put on the queue after that are lost.
+    """
+    def __init__(self, queue, logdir, maxBytes=1000000, backupCount=10):
+        super(LogWriter, self).__init__(name='logwriter')
+        self.queue = queue
+        self.logdir = logdir
+        self.maxBytes = maxBytes
+        self.backupCount = backupCount
+
+    def run(self):
+        formatter = logging.Formatter(logformat)
+        handlers = dict()
+        while True:
+            try:
+                record = self.queue.get()
+            except (EOFError, IOError):
+                break
+            if record is None:
+                break
+
+            logfile = getattr(record, 'logfile', record.name)
+            if not logfile in handlers:
+                handlers[logfile] = logging.handlers.RotatingFileHandler(
+                    os.path.join(self.logdir, '{0}.log'.format(logfile)),
+                    maxBytes=self.maxBytes,
+                    backupCount=self.backupCount)
+                handlers[logfile].setFormatter(formatter)
+            handlers[logfile].handle(record)
+
+        for handler in handlers.values():
+            handler.close()
+
+
+class SamplingFilter(logging.Filter):
+    """ Passes one in every 'every' records of the same message and, with
+        rate set, at most rate of those per second.
+    """
+    def __init__(self, every=1, rate=None):
+        logging.Filter.__init__(self)
+        self.every = max(1, int(every))
+        self.rate = rate
+        self.counts = dict()
+        self.buckets = dict()
+        self.suppressed = 0
+
+    def filter(self, record):
+        key = (record.name, record.msg)
+        count = self.counts.get(key, 0)
+        self.counts[key] = count + 1
+        if count % self.every != 0:
+            self.suppressed += 1
+            return False
+
+        if self.rate is not None:
+            now = time.time()
+            (tokens, last) = self.buckets.get(key, (self.rate, now))
+            tokens = min(self.rate, tokens + (now - last)*self.rate)
+            if tokens < 1:
+                self.buckets[key] = (tokens, now)
+                self.suppressed += 1
+                return False
+            self.buckets[key] = (tokens - 1, now)
+
+        return True
@@ -26,6 +26,8 @@ class BoardMessage(object):
     subscription=2
     networksubscription=3
     testrequiredkeys=4
+    hostprocessor=5
+    start=6
 
     def __init__(self, mType, args):
         self.mType = mType
@@ -42,6 +44,7 @@ class ProcessorMessage(object):
     """
 
     error = 0
+    heartbeat = 1
     def __init__(self, mType, contents):
         self.mType = mType
         self.contents = contents
@@ -0,0 +1,102 @@
+'''
+This file is part of libsoundannotator. The library libsoundannotator is
+designed for processing sound using time-frequency representations.
+
+Copyright 2011-2014 Sensory Cognition Group, University of Groningen
+Copyright 2014-2017 SoundAppraisal BV
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+'''
+Metadata of chunks by reference.
+
+Processors describe themselves with getMetaData, typically the sha1 hash and
+JSON of their configuration. A chunk carries these descriptions for every
+processor it passed, keyed by processor name. Instead of the descriptions
+themselves chunks now carry a MetadataReference per processor, the sha1 hash
+of its description. The descriptions travel along as announcements on the
+chunks to subscribers that may not know them yet: the first chunk after a
+subscriber was added, after a description changed, at a discontinuity and
+every MetadataInterval chunks for subscribers that missed one.
+
+Receiving processors keep the descriptions in a MetadataCache and hand the
+resolved metadata to processData, so compositeChunk.metadata looks as it
+always did. Metadata of which the description was never announced is left
+out and the composite is marked discontinuous. Those reading chunks from Board.getConnectionToProcessor resolve
+them with a MetadataCache of their own.
+
+Usage:
+    cache = MetadataCache()
+    chunk = subscription.connection.recv()
+    cache.learn(chunk.announcements)
+    metadata = cache.resolve(chunk.metadata)
+'''
+import cPickle
+from hashlib import sha1
+
+
+class MetadataReference(str):
+    """ The sha1 hash of the description of a processor
+    """
+    __slots__ = ()
+
+    def __reduce__(self):
+        return (MetadataReference, (str(self),))
+
+
+def reference(description):
+    return MetadataReference(sha1(cPickle.dumps(description, cPickle.HIGHEST_PROTOCOL)).hexdigest())
+
+
+class MetadataCache(object):
+    """ The descriptions a processor published or received, by reference
+    """
+    def __init__(self):
+        self.descriptions = dict()
+        # Per processor name the last description converted and its reference
+        self.converted = dict()
+
+    def references(self, metadata):
+        """ metadata with descriptions replaced by their references. A
+            description passed again as the same object is not hashed again.
+        """
+        references = dict()
+        for (name, description) in metadata.items():
+            if isinstance(description, MetadataReference):
+                references[name] = description
+                continue
+            if not (name in self.converted and self.converted[name][0] is description):
+                self.converted[name] = (description, reference(description))
+                self.descriptions[self.converted[name][1]] = description
+            references[name] = self.converted[name][1]
+        return references
+
+    def announcements(self, references):
+        return dict([(ref, self.descriptions[ref]) for ref in references.values() if ref in self.descriptions])
+
+    def learn(self, announcements):
+        if announcements:
+            self.descriptions.update(announcements)
+
+    def resolve(self, metadata):
+        """ metadata with references replaced by the descriptions known,
+            references to unknown descriptions are left in place
+        """
+        return dict([(name, self.descriptions.get(value, value) if isinstance(value, MetadataReference) else value)
+            for (name, value) in metadata.items()])
+
+    def unknown(self, metadata):
+        """ Names in metadata with a reference to a description not known
+        """
+        return sorted([name for (name, value) in metadata.items()
+            if isinstance(value, MetadataReference) and not value in self.descriptions])
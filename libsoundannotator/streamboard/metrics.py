@@ -0,0 +1,224 @@
+'''
+This file is part of libsoundannotator. The library libsoundannotator is
+designed for processing sound using time-frequency representations.
+
+Copyright 2011-2014 Sensory Cognition Group, University of Groningen
+Copyright 2014-2017 SoundAppraisal BV
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+'''
+Performance metrics of processors.
+
+Every processor keeps a MetricsRegistry with:
+
+    processdata_seconds     histogram of the duration of processData
+    chunks_in_total         chunks received, per receiverKey
+    chunks_out_total        chunks published, per senderKey
+    bytes_sent_total        serialized bytes written, per subscriber and key
+    discontinuities_total   composites marked discontinuous because chunks went missing
+    composites_evicted_total    incomplete composites given up, per missing key
+    subscription_chunks_total   what happened to the chunks offered to a
+                            subscription with flow control, per event
+    subscription_queue_depth    chunks waiting for credits
+
+A Board created with metricsDir or metricsPort has its processors write a
+snapshot of their registry to metricsDir every MetricsInterval seconds.
+The Board joins the snapshots into the Prometheus text format, served on
+http://127.0.0.1:metricsPort/metrics or written to a file with
+Board.writeMetrics, for instance for the textfile collector of the
+Prometheus node exporter.
+
+Usage:
+    b = Board(metricsPort=9123)
+    ...
+    curl http://127.0.0.1:9123/metrics
+'''
+import bisect, json, os, tempfile, threading
+import BaseHTTPServer
+
+prefix = 'libsoundannotator_'
+
+descriptions = {
+    'processdata_seconds': 'Duration of processData',
+    'chunks_in_total': 'Chunks received',
+    'chunks_out_total': 'Chunks published',
+    'bytes_sent_total': 'Serialized bytes written to subscriptions',
+    'discontinuities_total': 'Composite chunks marked discontinuous because chunks went missing',
+    'composites_evicted_total': 'Incomplete composite chunks given up, per missing key',
+    'subscription_chunks_total': 'Chunks offered to subscriptions with flow control',
+    'subscription_queue_depth': 'Chunks waiting for credits',
+}
+
+defaultBuckets = [0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5]
+
+
+class Histogram(object):
+
+    def __init__(self, buckets=defaultBuckets):
+        self.buckets = list(buckets)
+        self.counts = [0]*(len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def to_dict(self):
+        return {'buckets': self.buckets, 'counts': self.counts, 'sum': self.sum, 'count': self.count}
+
+    @classmethod
+    def from_dict(cls, d):
+        histogram = cls(d['buckets'])
+        histogram.counts = list(d['counts'])
+        histogram.sum = d['sum']
+        histogram.count = d['count']
+        return histogram
+
+
+def labelKey(labels):
+    return tuple(sorted(labels.items()))
+
+
+class MetricsRegistry(object):
+    """ Counters, gauges and histograms of a single processor, identified
+        by name and labels.
+    """
+    def __init__(self):
+        self.counters = dict()
+        self.gauges = dict()
+        self.histograms = dict()
+
+    def count(self, name, n=1, **labels):
+        key = (name, labelKey(labels))
+        self.counters[key] = self.counters.get(key, 0) + n
+
+    def setCount(self, name, value, **labels):
+        """ Set a counter kept elsewhere, such as the FlowCounters of a subscription
+        """
+        self.counters[(name, labelKey(labels))] = value
+
+    def gauge(self, name, value, **labels):
+        self.gauges[(name, labelKey(labels))] = value
+
+    def observe(self, name, value, **labels):
+        key = (name, labelKey(labels))
+        if not key in self.histograms:
+            self.histograms[key] = Histogram()
+        self.histograms[key].observe(value)
+
+    def snapshot(self, **labels):
+        """ Plain data of all metrics, with labels added to every metric
+        """
+        def entries(metrics, convert):
+            return [[name, dict(list(key) + labels.items()), convert(value)] for ((name, key), value) in metrics.items()]
+
+        return {
+            'counters': entries(self.counters, lambda value: value),
+            'gauges': entries(self.gauges, lambda value: value),
+            'histograms': entries(self.histograms, lambda value: value.to_dict()),
+        }
+
+    def write(self, filename, **labels):
+        """ Replace filename by a snapshot, readers never see a partial file
+        """
+        (fd, tmpname) = tempfile.mkstemp(dir=os.path.dirname(filename), suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.snapshot(**labels), f)
+        os.rename(tmpname, filename)
+
+
+def readSnapshots(metricsdir):
+    snapshots = list()
+    for filename in sorted(os.listdir(metricsdir)):
+        if not filename.endswith('.metrics.json'):
+            continue
+        try:
+            with open(os.path.join(metricsdir, filename)) as f:
+                snapshots.append(json.load(f))
+        except (IOError, ValueError):
+            # A processor stopped while writing, its next snapshot will do
+            continue
+    return snapshots
+
+
+def formatLabels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(['{0}="{1}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+        for (name, value) in sorted(labels.items())]) + '}'
+
+def formatValue(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+def render(snapshots):
+    """ The Prometheus text format of a list of snapshots
+    """
+    families = dict()
+    for snapshot in snapshots:
+        for kind in ('counters', 'gauges', 'histograms'):
+            for (name, labels, value) in snapshot.get(kind, []):
+                families.setdefault((name, kind), []).append((labels, value))
+
+    types = {'counters': 'counter', 'gauges': 'gauge', 'histograms': 'histogram'}
+    lines = list()
+    for (name, kind) in sorted(families):
+        metric = prefix + name
+        if name in descriptions:
+            lines.append('# HELP {0} {1}'.format(metric, descriptions[name]))
+        lines.append('# TYPE {0} {1}'.format(metric, types[kind]))
+        for (labels, value) in families[(name, kind)]:
+            if kind != 'histograms':
+                lines.append('{0}{1} {2}'.format(metric, formatLabels(labels), formatValue(value)))
+                continue
+            cumulative = 0
+            for (bound, count) in zip(value['buckets'] + [float('inf')], value['counts']):
+                cumulative += count
+                lines.append('{0}_bucket{1} {2}'.format(metric, formatLabels(dict(labels, le=formatValue(bound))), cumulative))
+            lines.append('{0}_sum{1} {2}'.format(metric, formatLabels(labels), formatValue(value['sum'])))
+            lines.append('{0}_count{1} {2}'.format(metric, formatLabels(labels), value['count']))
+
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = render(readSnapshots(self.server.metricsdir))
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def startMetricsServer(metricsdir, port, host='127.0.0.1'):
+    """ Serve the metrics in metricsdir on http://host:port/metrics from a
+        thread, returns the server. Stop it with shutdown.
+    """
+    server = BaseHTTPServer.HTTPServer((host, port), MetricsRequestHandler)
+    server.metricsdir = metricsdir
+    thread = threading.Thread(target=server.serve_forever, name='metricsserver')
+    thread.daemon = True
+    thread.start()
+    return server
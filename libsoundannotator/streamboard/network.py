@@ -17,7 +17,9 @@ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 See the License for the specific language governing permissions and
 limitations under the License.
 '''
-import socket, sys, select, struct, cPickle, time, lz4, zlib
+import socket, sys, select, struct, cPickle, time, lz4, zlib, errno, copy
+from collections import deque
+import numpy as np
 
 class NetworkConfigError(Exception):
 	def __init__(self, value):
@@ -35,6 +37,8 @@ class BusyNetworkException(Exception):
 	pass
 class SocketBufferFullException(Exception):
 	pass
+class FrameFormatException(Exception):
+	pass
 
 class SocketStateMeta(type):
 	def __getattr__(cls, key):
@@ -51,26 +55,142 @@ class SocketState(object):
 		'SENDING' : "sending", #we are sending data
 		'RECEIVING' : "receiving", #we are receiving data
 		'PACKAGE' : "package", #we have retrieved the package information
+		'HEADER' : "header", #we have decoded the frame header and receive the buffers
 		'END' : "end", #we are done sending or receiving
 	}
 
+"""
+	Wire format, version 1
+
+	Every message is a frame consisting of
+		preamble    '!2sBBHI': magic 'SB', version, flags, number of buffers, header length
+		table       '!Q' per buffer: length of the buffer in bytes
+		header      pickled tuple (message, buffer descriptions), message.data is
+					replaced by None when it is sent as a raw buffer
+		buffers     raw bytes of the numpy arrays, in C order
+
+	When the FRAME_LZ4 flag is set header and buffers are lz4 compressed. The
+	buffers are sent without joining them into a single string and received
+	straight into freshly allocated arrays.
+"""
+FRAME_MAGIC = 'SB'
+FRAME_VERSION = 1
+FRAME_LZ4 = 1
+
+framePreamble = struct.Struct('!2sBBHI')
+frameBufferLength = struct.Struct('!Q')
+
+def encodeFrame(message, compress=False):
+	"""
+		Encode a message, typically a DataChunk, as a list of buffers forming a
+		single frame. A plain numpy array in message.data is not pickled but sent
+		as a raw buffer.
+	"""
+	arrays = []
+	data = getattr(message, 'data', None)
+	if type(data) is np.ndarray and not data.dtype.hasobject:
+		arrays.append(np.ascontiguousarray(data))
+		message = copy.copy(message)
+		message.data = None
+
+	header = cPickle.dumps((message, [(a.dtype.str, a.shape) for a in arrays]), cPickle.HIGHEST_PROTOCOL)
+	buffers = [memoryview(a.reshape(-1).view(np.uint8)) for a in arrays]
+
+	flags = 0
+	if compress:
+		flags |= FRAME_LZ4
+		header = lz4.dumps(header)
+		buffers = [lz4.dumps(b.tobytes()) for b in buffers]
+
+	table = ''.join([frameBufferLength.pack(len(b)) for b in buffers])
+	preamble = framePreamble.pack(FRAME_MAGIC, FRAME_VERSION, flags, len(buffers), len(header))
+
+	return [preamble + table + header] + buffers
+
+class FrameReceiver(object):
+	"""
+		Receiving state of a single frame after its preamble has been read
+	"""
+	def __init__(self, preamble):
+		(magic, version, flags, nbuffers, headerlength) = framePreamble.unpack_from(preamble)
+		if magic != FRAME_MAGIC or version != FRAME_VERSION:
+			raise FrameFormatException('Unknown frame magic {0!r} or version {1}'.format(magic, version))
+		self.flags = flags
+		self.nbuffers = nbuffers
+		self.headerlength = headerlength
+		self.headerpartlength = nbuffers*frameBufferLength.size + headerlength
+
+	def setHeader(self, headerpart):
+		tablelength = self.nbuffers*frameBufferLength.size
+		self.lengths = [frameBufferLength.unpack_from(headerpart, i*frameBufferLength.size)[0] for i in range(self.nbuffers)]
+		header = headerpart[tablelength:].tobytes()
+		if self.flags & FRAME_LZ4:
+			header = lz4.loads(header)
+		(self.message, self.descriptions) = cPickle.loads(header)
+
+		self.targets = []
+		self.views = []
+		for (dtype, shape), length in zip(self.descriptions, self.lengths):
+			if self.flags & FRAME_LZ4:
+				target = bytearray(length)
+				self.views.append(memoryview(target))
+			else:
+				target = np.empty(shape, dtype=np.dtype(dtype))
+				if target.nbytes != length:
+					raise FrameFormatException('Buffer length {0} does not match array of shape {1} and type {2}'.format(length, shape, dtype))
+				self.views.append(memoryview(target.reshape(-1).view(np.uint8)))
+			self.targets.append(target)
+
+		self.current = 0
+		self.offset = 0
+
+	def receiveBuffers(self, sock):
+		"""
+			Read as much of the buffers as the socket offers, returns True when
+			the frame is complete.
+		"""
+		while self.current < len(self.views):
+			view = self.views[self.current]
+			if self.offset < len(view):
+				n = sock.recv_into(view[self.offset:], len(view) - self.offset)
+				if n == 0:
+					return False
+				self.offset += n
+			if self.offset == len(view):
+				self.current += 1
+				self.offset = 0
+		return True
+
+	def result(self):
+		if len(self.targets) > 0:
+			data = self.targets[0]
+			if self.flags & FRAME_LZ4:
+				(dtype, shape) = self.descriptions[0]
+				data = np.frombuffer(lz4.loads(bytes(data)), dtype=np.dtype(dtype)).reshape(shape)
+			self.message.data = data
+		return self.message
+
 class NetworkMixin(object):
+	wireformat = 'frame'
 	_sockets = {}
 	_socketstates = {} #volatile
 	_socketmsglengths = {} #volatile
 	_socketpoll = select.poll()
-	_socketfrmt = struct.Struct('!I') #struct format can contain 32bits to indicate size
 	_socketbuffer = 8192 #8K for now, max buffer on Ubuntu 14.04 can be 65K
 	_socketdata = {} #volatile
 	_socketdataMaxSize = 10000000 #which is 10MB. Let's make it large ;).
 	_sockettimers = {} #volatile
+	_socketframes = {} #volatile
+	_socketrecvbuffers = {} #reused for the preamble and header of every frame
+	_socketrecvfilled = {} #volatile
 	_listen_sock = None
 	_afterdataCallback = None
 	_networkType = None
 
 	_sendTimeout = 0.0
 
-	_useCompression = True
+	# Compression forces a copy of every buffer, the raw frames avoid that
+	_useCompression = False
 
 	def setupSocket(self, config, **kwargs):
 		if not 'interface' in config:
@@ -166,6 +286,8 @@ class NetworkMixin(object):
 		self._socketstates.pop(sock, None)
 		self._socketdata.pop(sock, None)
 		self._socketmsglengths.pop(sock, None)
+		self._socketframes.pop(sock, None)
+		self._forgetReceiveBuffer(sock)
 		return
 
 
@@ -262,6 +384,7 @@ class NetworkMixin(object):
 				self._socketstates.pop(sock, None)
 				self._socketdata.pop(sock, None)
 				self._socketmsglengths.pop(sock, None)
+				self._forgetReceiveBuffer(sock)
 				#in this case, we want to propagate the closing of the socket
 				raise ClosedSocketException("Removed closed socket {0}".format(fd))
 
@@ -273,7 +396,6 @@ class NetworkMixin(object):
 				fd = newsock.fileno()
 				self._sockets[fd] = newsock
 				self._socketpoll.register(fd, select.POLLIN)
-				self._socketdata[newsock] = ''
 				self._logInfo("Established new connection {0} on listening socket".format(fd))
 				#if an old socket was present, remove it for now.
 				#TODO: find out why old socket was not closed
@@ -291,35 +413,18 @@ class NetworkMixin(object):
 					self._socketstates.pop(oldsock, None)
 					self._socketdata.pop(oldsock, None)
 					self._socketmsglengths.pop(oldsock, None)
+					self._forgetReceiveBuffer(oldsock)
 					raise NotSameSocketException
 				continue
 
 			#collect incoming data
 			elif event & select.POLLIN:
-				if not sock in self._socketstates:
-					#receive data until the length of the package has been parsed
-					#will probably require only one go to read, but we can't be too sure,
-					#thats why the receiveUntil function is still called
-					self._receiveUntil(sock, SocketState.PACKAGE)
-				elif (self._socketstates[sock] == SocketState.PACKAGE) or\
-					 (self._socketstates[sock] == SocketState.RECEIVING):
-					#receive data until the end of indicated length has been reached
-					data = self._receiveUntil(sock, SocketState.END)
-					if data:
-						try:
-							#uncompressed = zlib.decompress(data)
-							unpickled = self._unpickle(data)
-						except:
-							continue #don't perform callback and don't set data
-						#extra callback option
-						if self._afterdataCallback is not None:
-							self._logInfo("Invoking afterdataCallback")
-							self._afterdataCallback(unpickled)
-						#unpickled data sits there until socket is ended
-						self._socketdata[sock] = unpickled
-				else:
-					self._logError("No known socketstate when handling incoming data: {0}".format(self._socketstates[sock]))
-					raise e
+				data = self._receiveFrame(sock)
+				if data is not None:
+					#extra callback option
+					if self._afterdataCallback is not None:
+						self._logInfo("Invoking afterdataCallback")
+						self._afterdataCallback(data)
 
 			else: #do nothing, next socket please
 				continue
@@ -330,6 +435,13 @@ class NetworkMixin(object):
 		Store a data object for the socket to send
 	"""
 	def prepareSend(self, sock, data):
+		self.prepareSendSerialized(sock, encodeFrame(data, self._useCompression))
+
+	"""
+		Store a message already encoded by encodeFrame for the socket to send, this
+		allows a publisher to encode a chunk once for all its subscribers
+	"""
+	def prepareSendSerialized(self, sock, buffers):
 		self._logInfo("Prepare Send")
 		#sock may be none if we have only one socket
 		if sock is None:
@@ -355,32 +467,29 @@ class NetworkMixin(object):
 			self._socketdata.pop(sock, None)
 			self._sockettimers.pop(sock, None)
 
-		pickled = self._pickle(data)
-		#optional compressing
-		if self._useCompression:
-			pickled = lz4.dumps(pickled)
-
-		#self._logDebug("Compression {0:.0f}%".format( float(len(pickled))/float(len(compressed))*100 ))
 		"""
-				We prepare a byte package that contains the data and metadata combined.
-				The first 4 bytes of the package indicate its total length.
+				The package is a queue of buffers which are sent in order without
+				joining them, _socketmsglengths holds the number of bytes still queued.
 		"""
-		package = self._socketfrmt.pack(len(pickled)) + pickled #byte length augmented package
+		package = deque([memoryview(b) for b in buffers])
+		length = sum([len(b) for b in package])
 		# at this point, check to see if the socket is still sending, and if so, if the package would
 		# fit at the end of the buffer
 		if sock in self._socketstates and self._socketstates[sock] == SocketState.SENDING:
 			#will the package fit inside the buffer?
-			if len(self._socketdata[sock]) + len(package) > self._socketdataMaxSize:
+			if self._socketmsglengths[sock] + length > self._socketdataMaxSize:
 				#if not, throw an exception
-				raise SocketBufferFullException("Trying to append to full socket buffer:\n{0}".format(sock.fileno(), len(self._socketdata[sock])))
+				raise SocketBufferFullException("Trying to append to full socket buffer {0}: {1}".format(sock.fileno(), self._socketmsglengths[sock]))
 
-			self._logInfo("Socket {0} still sending. Will append chunk {1} to buffer".format(sock.fileno(), data.number))
-			self._socketdata[sock] += package
+			self._logInfo("Socket {0} still sending. Will append package of {1:.2f}KB to buffer".format(sock.fileno(), length/1024.))
+			self._socketdata[sock].extend(package)
+			self._socketmsglengths[sock] += length
 		else:
 			self._socketdata[sock] = package
+			self._socketmsglengths[sock] = length
 			self._socketstates[sock] = SocketState.READYSEND
 			self._sockettimers[sock] = time.time()
-			self._logInfo("Socket {0} ready to send package, {1:.2f}KB".format(sock.fileno(), len(package)/1024.))
+			self._logInfo("Socket {0} ready to send package, {1:.2f}KB".format(sock.fileno(), length/1024.))
 
 
 	"""
@@ -392,90 +501,119 @@ class NetworkMixin(object):
 			raise Exception("No data for socket to send. This should not happen")
 		try:
 			package = self._socketdata[sock]
-			#create a timed loop, try and send as much data as possible within timeout
-			n = sock.send(package)
-			if n < len(package):
-				self._socketdata[sock] = package[n:] #residual
+			while len(package) > 0:
+				n = sock.send(package[0])
+				self._socketmsglengths[sock] -= n
+				if n < len(package[0]):
+					package[0] = package[0][n:] #residual
+					self._socketstates[sock] = SocketState.SENDING
+					self._logDebug("Buffer size {0}".format(self._socketmsglengths[sock]))
+					return self._socketstates[sock]
+				package.popleft()
+
+			self._socketstates[sock] = SocketState.END #indicate we're done
+			self._logDebug("Sending ended")
+
+		except socket.error as e:
+			if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
 				self._socketstates[sock] = SocketState.SENDING
-				self._logDebug("Buffer size {0}".format(len(self._socketdata[sock])))
 			else:
-				self._socketstates[sock] = SocketState.END #indicate we're done
-				self._logDebug("Sending ended")
-
-		except Exception as e:
-			self._logError("Exception occured in sending: {0}".format(e))
-			raise e
+				self._logError("Exception occured in sending: {0}".format(e))
+				raise e
 
 		return self._socketstates[sock]
 
 	"""
 		Workhorse in receiving data from a socket.
-		Specifies length of data to receive. If length was not acquired, store data.
-		It is guaranteed that this function only returns data if 'length' bytes have been
-		read from the socket.
+		Receives until 'length' bytes are available, partial data is kept in a
+		bytearray per socket which is reused for every message and only grows
+		when a longer header arrives. Returns a memoryview on the data once all
+		'length' bytes have been read, None otherwise. The view is only valid
+		until the next call for the same socket.
 	"""
 	def _recvall(self, sock, length):
-		data = sock.recv(length)
-		fd = sock.fileno()
-		self._logDebug("Received {0}/{1}".format(len(data), length))
-		if len(data) == length: #we have everything, return the data
-			#did we store previous data? then prepend it
-			if sock in self._socketdata:
-				data = self._socketdata[sock] + data
-			return data
-		else:
-			if not sock in self._socketdata:
-				self._logError("No data entry for socket {0}. This should not happen".format(fd))
-				self._socketdata[sock] = ''
+		buf = self._socketrecvbuffers.get(sock)
+		filled = self._socketrecvfilled.get(sock, 0)
+		if buf is None or len(buf) < length:
+			grown = bytearray(max(length, 2*len(buf) if buf is not None else self._socketbuffer))
+			if filled > 0:
+				grown[:filled] = buf[:filled]
+			buf = grown
+			self._socketrecvbuffers[sock] = buf
+
+		n = sock.recv_into(memoryview(buf)[filled:length], length - filled)
+		self._logDebug("Received {0}/{1}".format(filled + n, length))
+		if n == 0:
+			return None
 
-			self._socketdata[sock] += data
-			#log how many bytes still needed
-			self._socketmsglengths[sock] -= len(data)
-			return
+		filled += n
+		if filled == length: #we have everything, return the data
+			self._socketrecvfilled[sock] = 0
+			return memoryview(buf)[:length]
 
+		self._socketrecvfilled[sock] = filled
+		return None
 
-	def _receiveUntil(self, sock, endstate):
+	def _forgetReceiveBuffer(self, sock):
+		self._socketrecvbuffers.pop(sock, None)
+		self._socketrecvfilled.pop(sock, None)
+
+	"""
+		Progress the frame being received on a socket as far as the available data
+		allows. Returns the decoded message when the frame is complete, None otherwise.
+	"""
+	def _receiveFrame(self, sock):
 		fd = sock.fileno()
-		if endstate == SocketState.PACKAGE: #retrieve until package length has been parsed
-			try:
-				data = self._recvall(sock, self._socketfrmt.size)
-				if data:
-					#set the endstate
-					self._socketstates[sock] = endstate
-					(length,) = self._socketfrmt.unpack(data)
-					self._socketmsglengths[sock] = length
-					self._socketdata[sock] = ''
+		try:
+			while True:
+				state = self._socketstates.get(sock, SocketState.END)
+				if state == SocketState.END or state == SocketState.RECEIVING:
+					self._socketstates[sock] = SocketState.RECEIVING
+					preamble = self._recvall(sock, framePreamble.size)
+					if preamble is None:
+						return None
+					self._socketframes[sock] = FrameReceiver(preamble)
+					self._socketstates[sock] = SocketState.PACKAGE
 					self._sockettimers[sock] = time.time()
-					self._logDebug("Need to receive {0:.2f} KB from socket {1}".format(length/1024., fd))
-					return
-				else:
-					return
-			except Exception as e:
-				self._logError("Problem when retrieving package size from socket {0}: {1}".format(fd, e))
-				raise e
 
-		elif endstate == SocketState.END: #retrieve until there is nothing more
-			try:
-				data = self._recvall(sock, self._socketmsglengths[sock])
-				if data:
-					#set the endstate
-					self._socketstates[sock] = endstate
+				elif state == SocketState.PACKAGE:
+					frame = self._socketframes[sock]
+					headerpart = self._recvall(sock, frame.headerpartlength)
+					if headerpart is None:
+						return None
+					frame.setHeader(headerpart)
+					self._socketstates[sock] = SocketState.HEADER
+					self._logDebug("Need to receive {0:.2f} KB from socket {1}".format(sum(frame.lengths)/1024., fd))
+
+				elif state == SocketState.HEADER:
+					frame = self._socketframes[sock]
+					if not frame.receiveBuffers(sock):
+						return None
+					self._socketstates[sock] = SocketState.END
+					self._socketframes.pop(sock, None)
 					elapsed = time.time() - self._sockettimers[sock]
-					self._logDebug("Package took {0:.2f}s, {1:.2f}KB/s".format(elapsed, (len(data)/elapsed)/1024.))
-					#optional decompressing
-					if self._useCompression:
-						data = lz4.loads(data)
+					self._logDebug("Package took {0:.2f}s".format(elapsed))
+					return frame.result()
 
-					return data
 				else:
-					self._socketstates[sock] = SocketState.RECEIVING
-					return
-			except Exception as e:
-				self._logError("Problem when retrieving package data from socket {0}: {1}".format(fd, e))
-				raise e
-		else:
-			self._logError("Not a valid socket end state: {0}".format(endstate))
-			return
+					self._logError("No known socketstate when handling incoming data: {0}".format(state))
+					return None
+
+		except socket.error as e:
+			if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+				return None
+			self._logError("Problem when receiving from socket {0}: {1}".format(fd, e))
+			raise e
+		except FrameFormatException as e:
+			self._logError("Dropping socket {0}: {1}".format(fd, e))
+			self._socketpoll.unregister(fd)
+			del self._sockets[fd]
+			self._socketstates.pop(sock, None)
+			self._socketdata.pop(sock, None)
+			self._socketframes.pop(sock, None)
+			self._forgetReceiveBuffer(sock)
+			sock.close()
+			raise ClosedSocketException("Removed socket {0} sending unknown frames".format(fd))
 
 
 	def _logError(self, msg):
@@ -495,17 +633,3 @@ class NetworkMixin(object):
 			self.logger.debug(msg)
 		else:
 			print "[DEBUG]: {0}".format(msg)
-
-	def _pickle(self, data):
-		try:
-			return cPickle.dumps(data)
-		except Exception as e:
-			self._logError("Unable to pickle data object: {0}".format(data))
-			raise e
-
-	def _unpickle(self, s):
-		try:
-			return cPickle.loads(s)
-		except Exception as e:
-			self._logError("Unable to unpickle serialized object: {0}".format(e))
-			raise e
@@ -37,7 +37,9 @@ class SocketBufferFullException(Exception):
     pass
 
 class NetworkMixin(object):
+    wireformat = 'pickle'
     _chunk = None
+    _payload = None
     _connection = None
     _data = None
 
@@ -89,12 +91,22 @@ class NetworkMixin(object):
         # stash the chunk
         self._chunk = chunk
 
+    def prepareSendSerialized(self, sock, payload):
+        if self._networkType == 'server':
+            raise Exception('Unable to send chunk in a receiving connection')
+
+        # stash the already pickled chunk
+        self._payload = payload
+
     def pollSockets(self, timeout):
         if self._networkType == 'client':
             # send the stashed chunk
             if self._chunk is not None:
                 self._connection.send(self._chunk)
                 self._chunk = None
+            if self._payload is not None:
+                self._connection.send_bytes(self._payload)
+                self._payload = None
 
         elif self._networkType == 'server':
             hasData = self._connection.poll(timeout)
@@ -114,6 +126,7 @@ class NetworkMixin(object):
         self._connection.close()
         self._connection = None
         self._chunk = None
+        self._payload = None
         self._data = None
 
     def _logError(self, msg):
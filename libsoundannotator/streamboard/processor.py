@@ -18,7 +18,7 @@ See the License for the specific language governing permissions and
 limitations under the License.
 '''
 # -*- coding: u8 -*-
-import multiprocessing, math, time, pyaudio, sys, setproctitle, os,  traceback
+import multiprocessing, math, time, pyaudio, sys, setproctitle, os,  traceback, select, errno, threading, copy
 import numpy as np
 import logger as streamboard_logger
 import logging
@@ -28,7 +28,12 @@ import multiprocessing.connection
 from continuity     import Continuity, chunkAlignment, processorAlignment
 from messages       import BoardMessage, NetworkMessage, ProcessorMessage
 from compositor     import compositeChunk, compositeManager, DataChunk
-from subscription   import NetworkConnection, NetworkSubscriptionOrder, Subscription
+from subscription   import NetworkConnection, NetworkSubscriptionOrder, Subscription, serializeChunk, payloadLength, subscriberLabel
+from inprocess      import registerFusedProcessor, unregisterFusedProcessor
+from metrics        import MetricsRegistry
+from tracing        import ChunkTracer
+from metadata       import MetadataCache
+from flowcontrol    import CreditedConnection
 from json import loads, dumps
 from hashlib import sha1
 
@@ -42,10 +47,17 @@ class BaseProcessor(multiprocessing.Process):
         'BoardConnectionTimeOut': 0.01,
         'InputConnectionTimeOut': 0.025,
         'network': False,
-        'NetworkTimeout': 10
+        'NetworkTimeout': 10,
+        'ChunkLogSampling': 1,
+        'ChunkLogRate': None,
+        'MetricsInterval': 5.0,
+        'TraceSampling': 50,
+        'ReorderCapacity': 64,
+        'MetadataInterval': 100,
     }
 
-    def __init__(self, boardConn, name, logdir=None, loglevel=None, **kwargs):
+    def __init__(self, boardConn, name, logdir=None, loglevel=None, logqueue=None, metricsdir=None, tracedir=None,
+            heartbeatinterval=None, **kwargs):
         super(BaseProcessor, self).__init__()
         # Don't use logging before calling addloger
         if(sys.platform=='win32'):
@@ -54,28 +66,64 @@ class BaseProcessor(multiprocessing.Process):
             self.loglevel=loglevel
 
         self.logdir = logdir
+        self.logqueue = logqueue
+
+        # Snapshots of the metrics go to metricsdir, none are written without it
+        self.metricsdir = metricsdir
+        self.metrics = MetricsRegistry()
+        self.metricsWritten = 0
 
         self.logmsg = self.__createConfig(kwargs)
         self.boardConn = boardConn
 
+        # Trace events of sampled chunks go to tracedir, see tracing.py
+        self.tracer = None
+        if tracedir is not None:
+            self.tracer = ChunkTracer(name, tracedir, self.config['TraceSampling'])
+
         self.name = name
 
         self.currentTimeStamp = time.time()
         self.sources=set([self.name])
         self.overwriteContinuity = True
 
+        # Set by processors whose process() also waits on the board connection
+        self.multiplexBoardConnection = False
+
+        # Guests run in threads of this process, a hosted processor is such a guest
+        self.hosted = False
+        self.guests = list()
+        self.fusedGuests = list()
+
+        # Set by BoardMessage.start, processors waiting for it hold off producing data
+        self.started = False
+
+        # A board with a watchdog expects a heartbeat every heartbeatinterval seconds
+        self.heartbeatInterval = heartbeatinterval
+        self.heartbeatSent = 0
+        self.lastNumber = None
+
     def addlogger(self, reattach=True):
-        filepath = os.path.join(self.logdir, '{0}.log'.format(self.name))
-        formatter = logging.Formatter('%(asctime)s %(name)-15s %(levelname)-8s %(processName)-10s %(message)s')
-        self.handler = logging.handlers.RotatingFileHandler(filepath,
-            maxBytes=1000000,
-            backupCount=10)
-        self.handler.setFormatter(formatter)
+        if self.logqueue is not None:
+            self.handler = streamboard_logger.QueueHandler(self.logqueue, self.name)
+        else:
+            filepath = os.path.join(self.logdir, '{0}.log'.format(self.name))
+            formatter = logging.Formatter('%(asctime)s %(name)-15s %(levelname)-8s %(processName)-10s %(message)s')
+            self.handler = logging.handlers.RotatingFileHandler(filepath,
+                maxBytes=1000000,
+                backupCount=10)
+            self.handler.setFormatter(formatter)
 
         self.logger = logging.getLogger(self.name)
         self.logger.setLevel(self.loglevel)
         self.logger.addHandler(self.handler)
 
+        # Messages for every chunk, these propagate to self.logger when sampled
+        self.chunklogger = logging.getLogger('{0}.chunks'.format(self.name))
+        for chunkfilter in list(self.chunklogger.filters):
+            self.chunklogger.removeFilter(chunkfilter)
+        self.chunklogger.addFilter(streamboard_logger.SamplingFilter(self.config['ChunkLogSampling'], self.config['ChunkLogRate']))
+
         self.logger.info("=============Logger was attached to Processor {0}============".format(self.name))
 
         #print any stored messages
@@ -94,7 +142,8 @@ class BaseProcessor(multiprocessing.Process):
 
     def run(self):
         self.prerun()
-        setproctitle.setproctitle(self.name)
+        if not self.hosted:
+            setproctitle.setproctitle(self.name)
         self.logger.info('Processor {0} started'.format(self.name))
         self.stayAlive = True
 
@@ -115,7 +164,11 @@ class BaseProcessor(multiprocessing.Process):
             
             try:
                 self.process()
-                self.checkAndProcessBoardMessage()
+                if not self.multiplexBoardConnection:
+                    self.checkAndProcessBoardMessage()
+                if len(self.fusedGuests) > 0:
+                    self.serviceFusedGuests()
+                self.sendHeartbeat()
             except Exception as e:
                 messageString=['{0}'.format(e.__class__.__name__),'{0}'.format(e),self.name,]
                 traceback.print_exc()
@@ -144,13 +197,71 @@ class BaseProcessor(multiprocessing.Process):
         if hasattr(self, 'listener'):
             self.listener.close()
 
-    def checkAndProcessBoardMessage(self):
-        m = self.checkForBoardMessage()
+        for (guest, thread) in self.guests:
+            thread.join(1.0)
+            if thread.is_alive():
+                self.logger.warning('Guest processor {0} did not stop'.format(guest.name))
+
+        for guest in self.fusedGuests:
+            unregisterFusedProcessor(guest)
+            guest.finalize()
+        self.fusedGuests = list()
+
+        self.reportMetrics(force=True)
+        if self.tracer is not None:
+            self.tracer.flush()
+
+    def updateMetrics(self):
+        """ Override to bring metrics kept elsewhere into self.metrics
+            before a snapshot is written.
+        """
+        pass
+
+    def reportMetrics(self, force=False):
+        """ Write a snapshot of the metrics to metricsdir, at most once
+            every MetricsInterval seconds unless forced.
+        """
+        if self.metricsdir is None:
+            return
+        now = time.time()
+        if not force and now - self.metricsWritten < self.config['MetricsInterval']:
+            return
+        self.metricsWritten = now
+
+        self.updateMetrics()
+        try:
+            self.metrics.write(os.path.join(self.metricsdir, '{0}.metrics.json'.format(self.name)), processor=self.name)
+        except (IOError, OSError) as e:
+            self.logger.warning('Could not write metrics of processor {0}: {1}'.format(self.name, e))
+
+    def sendHeartbeat(self):
+        """ Tell the board this processor is alive and which chunk it
+            published last, at most once every heartbeat interval.
+        """
+        if self.heartbeatInterval is None or self.boardConn is None:
+            return
+        now = time.time()
+        if now - self.heartbeatSent < self.heartbeatInterval:
+            return
+        self.heartbeatSent = now
+        self.boardConn.send(ProcessorMessage(ProcessorMessage.heartbeat, (now, self.lastNumber)))
+
+    def continueNumbering(self, number):
+        """ Called by the board on a processor replacing one that failed,
+            with the number after which its predecessor may have published.
+        """
+        pass
+
+    def checkAndProcessBoardMessage(self, timeout=None):
+        self.sendHeartbeat()
+        m = self.checkForBoardMessage(timeout)
         if m:
             self.processBoardMessage(m)
 
-    def checkForBoardMessage(self):
-        hasNew = self.boardConn.poll(self.config['BoardConnectionTimeOut'])
+    def checkForBoardMessage(self, timeout=None):
+        if timeout is None:
+            timeout = self.config['BoardConnectionTimeOut']
+        hasNew = self.boardConn.poll(timeout)
         if hasNew:
             try:
                 message = self.boardConn.recv()
@@ -174,9 +285,49 @@ class BaseProcessor(multiprocessing.Process):
             self.stayAlive = False
         elif message.getType()==BoardMessage.testrequiredkeys:
             self.testRequiredKeys(message)
+        elif message.getType()==BoardMessage.hostprocessor:
+            self.hostProcessor(message.getContents())
+        elif message.getType()==BoardMessage.start:
+            self.logger.info('Received start message on processor {0}'.format(self.name))
+            self.started = True
         else:
             self.procesCustomBoardMessage(message)
 
+    def hostProcessor(self, order):
+        """ Construct the processor described by a HostedProcessorOrder and
+            run it in a thread of this process.
+        """
+        guest = order.create()
+        # A queue is only handed down to child processes, guests share the one of their host
+        guest.logqueue = self.logqueue
+        guest.metricsdir = self.metricsdir
+        guest.heartbeatInterval = self.heartbeatInterval
+        if order.fused:
+            # A fused guest only runs when chunks are injected into it
+            guest.prerun()
+            guest.stayAlive = True
+            registerFusedProcessor(guest)
+            self.fusedGuests.append(guest)
+            self.logger.info('Processor {0} is running fused processor {1}'.format(self.name, guest.name))
+        else:
+            thread = threading.Thread(target=guest.run, name=guest.name)
+            thread.daemon = True
+            thread.start()
+            self.guests.append((guest, thread))
+            self.logger.info('Processor {0} is hosting processor {1}'.format(self.name, guest.name))
+
+    def serviceFusedGuests(self):
+        """ Process the board messages of fused guests, these have no loop of
+            their own.
+        """
+        for guest in list(self.fusedGuests):
+            guest.checkAndProcessBoardMessage(0)
+            if not guest.stayAlive:
+                self.logger.info('Fused processor {0} stopped'.format(guest.name))
+                unregisterFusedProcessor(guest)
+                self.fusedGuests.remove(guest)
+                guest.finalize()
+
     def procesCustomBoardMessage(self, message):
         self.overrideError('process received board message for which no handler was defined messagetype: {0}'.format(message.getType()))
 
@@ -269,6 +420,13 @@ class InputProcessor(BaseProcessor):
         #genesis chunk
         self.oldchunk = DataChunk([],dict(), 0, self.name, set([self.name]), number=0)
         self.continuity=Continuity.discontinuous
+
+        # Chunks carry references to metadata, the descriptions are announced to subscribers
+        # that may not know them yet, see metadata.py
+        self.metadataCache = MetadataCache()
+        self.cachedMetaData = None
+        self.announced = dict()
+        self.sinceAnnouncement = 0
         
     def prerun(self):
         super(InputProcessor, self).prerun()
@@ -286,11 +444,18 @@ class InputProcessor(BaseProcessor):
     def process(self):
         self.currentTimeStamp = time.time() #provide a reasonable default time, for more precision provide timestamp in generateData of the derived class
         data = self.generateData()
-        self.publish(data, self.continuity, self.getTimeStamp(None), self.getchunknumber(), {self.name:self.currentTimeStamp}, metadata=self.getMetaData())
+        if self.tracer is not None and data is not None:
+            self.tracer.process(self.getchunknumber(), self.currentTimeStamp, time.time(), name='generate')
+        self.publish(data, self.continuity, self.getTimeStamp(None), self.getchunknumber(), {self.name:self.currentTimeStamp}, metadata=self.getCachedMetaData())
+        self.reportMetrics()
 
     def getchunknumber(self):
         return self.oldchunk.number+1
 
+    def continueNumbering(self, number):
+        # Chunk numbers go on where the failed processor may have stopped, subscribers would drop lower ones
+        self.oldchunk.number = number
+
     def getsamplerate(self,key):
         return self.config['SampleRate']
 
@@ -313,32 +478,66 @@ class InputProcessor(BaseProcessor):
             return
 
         data['technicalkey']=None
+        self.lastNumber = number
+
+        self.flushSubscriptions()
+
+        announcements=None
+        if metadata is not None:
+            metadata=self.metadataCache.references(metadata)
+            announcements=self.getAnnouncements(metadata, continuity)
+
+        # Subscriptions sharing a senderKey receive identical chunks, build and
+        # serialize those once per wireformat and write the same bytes to every connection.
+        chunks=dict()
+        payloads=dict()
         for subscriptionorder, subscriber in self.subscriptions.viewitems():
-            self.logger.info('Processor {0} publishing with sendingKey:{1} receiverKey:{2} continuity:{3} '.format(self.name,subscriber.senderKey,subscriber.receiverKey, continuity))
+            self.chunklogger.info('Processor %s publishing with sendingKey:%s receiverKey:%s continuity:%s', self.name, subscriber.senderKey, subscriber.receiverKey, continuity)
+
+            senderKey=subscriber.senderKey
+            if not senderKey in chunks:
+                #wildcard discards data
+                if (senderKey == '*'):
+                    dataout = None
+                else:
+                    dataout=data[senderKey]
+                    if type(dataout) is np.ndarray:
+                        if dataout.shape[-1] == 0:
+                            raise ValueError("Empty 2d array produced. Please consider removing processor {} sending {} or increasing chunk size!".format(self.name,senderKey))
+
+                chunks[senderKey] = DataChunk(dataout,
+                    starttime,
+                    self.getsamplerate(senderKey),
+                    self.name,
+                    self.sources,
+                    continuity=continuity,
+                    number=number,
+                    alignment=self.getAlignment(senderKey),
+                    dataGenerationTime = generationTime,
+                    metadata = metadata,
+                    identifier = identifier,
+                    announcements = announcements,
+                )
+                self.metrics.count('chunks_out_total', key=senderKey)
+
+            chunk=chunks[senderKey]
+
+            # Replicas of a processor each receive their share of the chunk numbers
+            order=subscriber.subscriptionorder
+            if getattr(order, 'replicas', 1) > 1 and number % order.replicas != order.replicaIndex:
+                continue
 
-            #wildcard discards data
-            if (subscriber.senderKey == '*'):
-                dataout = None
-            else:
-                dataout=data[subscriber.senderKey]
-                if type(dataout) is np.ndarray:
-                    if dataout.shape[-1] == 0:
-                        raise ValueError("Empty 2d array produced. Please consider removing processor {} sending {} or increasing chunk size!".format(self.name,subscriber.senderKey))
-
-            chunk = DataChunk(dataout,
-                starttime,
-                self.getsamplerate(subscriber.senderKey),
-                self.name,
-                self.sources,
-                continuity=continuity,
-                number=number,
-                alignment=self.getAlignment(subscriber.senderKey),
-                dataGenerationTime = generationTime,
-                metadata = metadata,
-                identifier = identifier,
-            )
             try:
-                subscriber.connection.send(chunk)
+                if hasattr(subscriber.connection, 'send_bytes'):
+                    wireformat=getattr(subscriber.connection, 'wireformat', 'pickle')
+                    if not (senderKey, wireformat) in payloads:
+                        payloads[(senderKey, wireformat)]=serializeChunk(chunk, wireformat)
+                    subscriber.connection.send_bytes(payloads[(senderKey, wireformat)])
+                    self.metrics.count('bytes_sent_total', payloadLength(payloads[(senderKey, wireformat)]), subscriber=subscriberLabel(order), key=senderKey)
+                else:
+                    subscriber.connection.send(chunk)
+                if announcements is not None:
+                    self.announced[subscriptionorder]=frozenset(metadata.values())
             except NoNetworkException as e:
                 self.logger.info("Initiating reconnect")
                 subscriber.connection.setupNetworkWithBackoff()
@@ -346,16 +545,78 @@ class InputProcessor(BaseProcessor):
                 #thrown when network buffer is full
                 #don't send anything, but mark the continuity as discontinuous
                 self.continuity = Continuity.discontinuous
+                subscriber.counters.count('droppedNewest')
+
+        # Give the end of a stream the chance to reach subscribers with queued chunks
+        if continuity == Continuity.last:
+            for subscriber in self.subscriptions.values():
+                if hasattr(subscriber.connection, 'flush'):
+                    subscriber.connection.flush(getattr(subscriber.subscriptionorder, 'creditTimeout', 0))
+
+        self.removeClosedSubscriptions()
 
         #TODO why this code? It interferes with the last chunk continuity...
         if (len(self.subscriptions) > 0): # Make sure oldchunk exists
-            self.oldchunk=chunk
+            # Local subscribers may still hold the chunk itself, only drop the data from our copy
+            self.oldchunk=copy.copy(chunk)
             #hacky way of preventing overwriting from continuity, when also set in a processor
             if self.overwriteContinuity:
                 self.continuity=chunk.continuity
-            chunk.data=None
+            self.oldchunk.data=None
 
-        self.logger.debug('Processor {0} published output with startTime {1}, continuity is now {2}' .format(self.name,self.currentTimeStamp, self.continuity))
+        if self.tracer is not None:
+            self.tracer.publish(number, generationTime)
+
+        self.chunklogger.debug('Processor %s published output with startTime %s, continuity is now %s', self.name, self.currentTimeStamp, self.continuity)
+
+    def getAnnouncements(self, references, continuity):
+        """ The descriptions behind references, if any subscriber may not
+            know them: a new subscriber, a changed description, a
+            discontinuity or MetadataInterval chunks since the last announcement.
+        """
+        self.sinceAnnouncement+=1
+        known=frozenset(references.values())
+        if continuity >= Continuity.withprevious and self.sinceAnnouncement < self.config['MetadataInterval'] and \
+                all([self.announced.get(order) == known for order in self.subscriptions]):
+            return None
+        self.sinceAnnouncement=0
+        return self.metadataCache.announcements(references)
+
+    def flushSubscriptions(self):
+        """ Send chunks queued on subscriptions with flow control for which
+            credits have been returned in the mean time.
+        """
+        for subscriber in self.subscriptions.values():
+            if hasattr(subscriber.connection, 'flush'):
+                subscriber.connection.flush()
+
+    def removeClosedSubscriptions(self):
+        """ Remove subscriptions with flow control whose subscriber went away
+        """
+        for (key, subscriber) in self.subscriptions.items():
+            if isinstance(subscriber.connection, CreditedConnection) and subscriber.connection.closed:
+                self._unsubscribe(key)
+
+    def _unsubscribe(self, key):
+        subscriber = self.subscriptions.pop(key)
+        self.announced.pop(key, None)
+        self.logger.info('Removed subscription {0} from processor {1}, its subscriber went away. {2}'
+            .format(key, self.name, subscriber.counters))
+
+    def finalize(self):
+        for subscriber in self.subscriptions.values():
+            if subscriber.counters.dropped() > 0:
+                self.logger.warning('Subscription {0} dropped {1} chunks. {2}'
+                    .format(subscriber.subscriptionorder.list(), subscriber.counters.dropped(), subscriber.counters))
+        super(InputProcessor, self).finalize()
+
+    def updateMetrics(self):
+        for subscriber in self.subscriptions.values():
+            labels = dict(subscriber=subscriberLabel(subscriber.subscriptionorder), key=subscriber.senderKey)
+            for (event, count) in subscriber.counters.counts.items():
+                self.metrics.setCount('subscription_chunks_total', count, event=event, **labels)
+            if hasattr(subscriber.connection, 'pending'):
+                self.metrics.gauge('subscription_queue_depth', len(subscriber.connection.pending), **labels)
 
     def processBoardMessage(self, message):
         if message.getType()==BoardMessage.subscribe:
@@ -375,6 +636,7 @@ class InputProcessor(BaseProcessor):
         try:
             connection = NetworkConnection(config, logger=self.logger)
             subscription = Subscription(connection, order)
+            self.announced.pop(subscription.subscriptionorder.list(), None)
             self.subscriptions[subscription.subscriptionorder.list()] = subscription
             self.logger.info('Subscribed a new network connection to processor {0}. Now have {1} subscribers'
                 .format(self.name, len(self.subscriptions)))
@@ -382,13 +644,15 @@ class InputProcessor(BaseProcessor):
             self.logger.error("Could not create network subscription: {0}".format(e))
 
     def _subscribe(self, subscription):
-        subscription.riseConnection(self.logger)
+        subscription.riseConnection(self.logger, sending=True)
         #replace connection config with real connection in case of network
         if "Network" in subscription.subscriptionorder.__class__.__name__:
             subscription.connection = NetworkConnection(subscription.connection,
                 logger=self.logger
             )
 
+        # A subscriber subscribing again, e.g. after a restart, knows no descriptions
+        self.announced.pop(subscription.subscriptionorder.list(), None)
         self.subscriptions[subscription.subscriptionorder.list()]= subscription
         self.logger.info('Subscribed a new connection to processor {0}. Now have {1} subscribers.'
         .format(self.name,len(self.subscriptions)))
@@ -398,6 +662,18 @@ class InputProcessor(BaseProcessor):
         config_json=dumps(self.config, sort_keys=True)
         config_hash=sha1(config_json).hexdigest()
         return  config_hash, config_json
+
+    def getCachedMetaData(self):
+        """ getMetaData, only called again after resetMetaData
+        """
+        if self.cachedMetaData is None:
+            self.cachedMetaData=self.getMetaData()
+        return self.cachedMetaData
+
+    def resetMetaData(self):
+        """ Call when the outcome of getMetaData changes, e.g. on a new source
+        """
+        self.cachedMetaData=None
     
     def getAlignment(self,key):
         chunkalignment=chunkAlignment(fsampling=self.getsamplerate(key))
@@ -436,6 +712,8 @@ class Processor(InputProcessor):
         super(Processor,self).__init__(boardConn, name, **kwargs)
         self.inConn = []
         self.timeout=self.config['InputConnectionTimeOut']
+        # select does not work on pipes under windows, poll connections one by one there
+        self.multiplexBoardConnection = not sys.platform=='win32'
 
 
     def prerun(self):
@@ -448,6 +726,7 @@ class Processor(InputProcessor):
     def process(self):
         self.currentTimeStamp = time.time() #provide a reasonable default time, for more precision provide timestamp in generateData of the derived class
         data = self.getInputs()
+        self.flushSubscriptions()
 
     def finalize(self):
         self.logger.warning("=================Finalize in Processor called===================\n\n")
@@ -455,6 +734,56 @@ class Processor(InputProcessor):
         super(Processor, self).finalize()
 
     def getInputs(self):
+        """ Wait until the board connection or any of the input connections
+            becomes readable and drain every ready input.
+
+            Board messages are handled before the inputs, a subscription sent
+            by the board ahead of the data it concerns is then in place
+            before that data is published. Connections without a fileno,
+            i.e. network connections, are polled after the wait, which is
+            then limited to self.timeout.
+        """
+        if not self.multiplexBoardConnection:
+            self.pollInputs()
+            return
+
+        waitable = dict()
+        pollable = list()
+        for subscription in self.inConn:
+            if hasattr(subscription.connection, 'fileno'):
+                waitable[subscription.connection.fileno()] = subscription
+            else:
+                pollable.append(subscription)
+
+        readers = waitable.keys()
+        boardfd = None
+        if self.boardConn is not None:
+            boardfd = self.boardConn.fileno()
+            readers.append(boardfd)
+
+        if len(pollable) > 0:
+            timeout = self.timeout
+        else:
+            timeout = self.config['InputConnectionTimeOut']
+
+        try:
+            (ready, _, _) = select.select(readers, [], [], timeout)
+        except select.error as e:
+            if e.args[0] != errno.EINTR:
+                raise
+            ready = []
+
+        if boardfd in ready:
+            self.checkAndProcessBoardMessage(0)
+
+        for fd in ready:
+            if fd in waitable:
+                self.drainInput(waitable[fd])
+
+        for subscription in pollable:
+            self.drainInput(subscription)
+
+    def pollInputs(self):
         for idx, subscription in enumerate(self.inConn):
             try:
                 new = subscription.connection.poll(self.timeout)
@@ -463,16 +792,33 @@ class Processor(InputProcessor):
                 new = False
 
             if new:
-                try:
-                    self.logger.debug("Got new. Calling blocking recv()")
-                    dataChunk = subscription.connection.recv()
-                    self.logger.debug(dataChunk)
-                except Exception as e:
-                    self.logger.error("Could not recv data: {0}".format(e))
-                    dataChunk=None
+                self.receiveInput(subscription)
+
+    def drainInput(self, subscription):
+        """ Receive and inject chunks until the connection has nothing left
+        """
+        try:
+            while subscription in self.inConn and subscription.connection.poll(0):
+                self.receiveInput(subscription)
+        except (ClosedSocketException, NotSameSocketException) as e:
+            self.logger.error("Recoverable incoming socket error. Need to re-initialize: {0}".format(e))
+
+    def receiveInput(self, subscription):
+        try:
+            self.chunklogger.debug("Got new. Calling blocking recv()")
+            dataChunk = subscription.connection.recv()
+            self.chunklogger.debug('%s', dataChunk)
+        except EOFError as e:
+            # A closed pipe stays readable, stop listening to it
+            self.logger.warning("Input connection for key {0} closed, removing subscription".format(subscription.receiverKey))
+            self.inConn.remove(subscription)
+            dataChunk=None
+        except Exception as e:
+            self.logger.error("Could not recv data: {0}".format(e))
+            dataChunk=None
 
-                if not dataChunk is None:
-                    self.compositeManager.inject(subscription.receiverKey, dataChunk)
+        if not dataChunk is None:
+            self.compositeManager.inject(subscription.receiverKey, dataChunk)
 
 
     def processBoardMessage(self, message):
@@ -496,6 +842,8 @@ class Processor(InputProcessor):
             )
 
         self.inConn.append(subscription)
+        if getattr(subscription.subscriptionorder, 'reassemble', None):
+            self.compositeManager.setStrictOrder(subscription.subscriptionorder.reassemble)
         noofInputs=len(self.inConn)
         if(noofInputs>0):
             self.timeout=self.config['InputConnectionTimeOut']/noofInputs
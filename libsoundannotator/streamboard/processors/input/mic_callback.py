@@ -153,7 +153,7 @@ class MicInputProcessor(processor.InputProcessor):
 		self.currentTimeStamp = time.time() #provide a reasonable default time, for more precision provide timestamp in generateData of the derived class
 		data = self.generateData()
 		if not data is None:
-			self.publish(data, self.continuity, self.getTimeStamp('sound'), self.getchunknumber(), {self.name:self.currentTimeStamp}, metadata=self.getMetaData())
+			self.publish(data, self.continuity, self.getTimeStamp('sound'), self.getchunknumber(), {self.name:self.currentTimeStamp}, metadata=self.getCachedMetaData())
 
 
 	def generateData(self):
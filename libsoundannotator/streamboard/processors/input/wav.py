@@ -36,7 +36,8 @@ class WavProcessor(processor.InputProcessor):
             super(WavProcessor, self).__init__(conn, name, *args, **kwargs)
 
         self.requiredParameters('ChunkSize', 'SoundFiles', 'timestep','SampleRate')
-        self.requiredParametersWithDefault(AddWhiteNoise=None, newFileContinuity=Continuity.newfile, startLatency=1.0)
+        self.requiredParametersWithDefault(AddWhiteNoise=None, newFileContinuity=Continuity.newfile, startLatency=1.0,
+            offline=False, offlineCredits=4, offlineCreditTimeout=60.0)
         self.samplerate = self.config['SampleRate']
         self.chunksize = self.config['ChunkSize']
         self.soundfiles = self.config['SoundFiles']
@@ -44,6 +45,7 @@ class WavProcessor(processor.InputProcessor):
         self.AddWhiteNoise = self.config['AddWhiteNoise']
         self.newFileContinuity=self.config['newFileContinuity']
         self.startLatency = self.config['startLatency']
+        self.offline = self.config['offline']
         self.source = None
         self.reader = None
         
@@ -56,8 +58,17 @@ class WavProcessor(processor.InputProcessor):
         self.logger.info("Processor {0} started".format(self.name))
         self.stayAlive = True
         self.checkAndProcessBoardMessage()
-        self.logger.info("Sleeping for {} seconds".format(self.startLatency))
-        time.sleep(self.startLatency)
+        if self.offline:
+            '''
+                In offline mode the board tells us when all subscriptions are in place,
+                from then on the credits of the subscriptions pace the reading.
+            '''
+            self.logger.info("Waiting for start message")
+            while self.stayAlive and not self.started:
+                self.checkAndProcessBoardMessage()
+        else:
+            self.logger.info("Sleeping for {} seconds".format(self.startLatency))
+            time.sleep(self.startLatency)
         for soundfile in self.soundfiles:
             self.processSoundfile(soundfile)
 
@@ -77,9 +88,12 @@ class WavProcessor(processor.InputProcessor):
     '''
     def processSoundfile(self, soundfile):
         self.continuity = self.newFileContinuity
+        # The metadata describe the source
+        self.resetMetaData()
 
         if soundfile.storagetype == 'wav':
-            self.reader = WavChunkReader(soundfile.filehandle)
+            self.reader = WavChunkReader(soundfile.filehandle,
+                getattr(soundfile, 'startframe', 0), getattr(soundfile, 'stopframe', None))
             if not self.samplerate == self.reader.getSamplerate():
                 raise  RuntimeError('Sample rate of file is inconsistent with specified sample rate')
              
@@ -100,12 +114,16 @@ class WavProcessor(processor.InputProcessor):
             '''
 
             self.process()
-            self.checkAndProcessBoardMessage()
-            '''
-                Sleep is an artificial means of lowering the system load. Here it is done to allow
-                chunks to propagate along other modules
-            '''
-            time.sleep(self.timestep)
+            if self.offline:
+                # Publishing blocks until the subscribers return credits, no need to wait here
+                self.checkAndProcessBoardMessage(0)
+            else:
+                self.checkAndProcessBoardMessage()
+                '''
+                    Sleep is an artificial means of lowering the system load. Here it is done to allow
+                    chunks to propagate along other modules
+                '''
+                time.sleep(self.timestep)
             #set continuity
             self.continuity = Continuity.withprevious
 
@@ -168,7 +186,7 @@ class WavProcessor(processor.InputProcessor):
         data['sound'] =frames
         
         self.continuity=Continuity.last
-        self.publish(data, self.continuity, self.getTimeStamp(None), self.getchunknumber(), {self.name:time.time()}, metadata=self.getMetaData())
+        self.publish(data, self.continuity, self.getTimeStamp(None), self.getchunknumber(), {self.name:time.time()}, metadata=self.getCachedMetaData())
 
        
     def setProcessorAlignments(self): 
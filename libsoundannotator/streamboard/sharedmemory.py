@@ -0,0 +1,196 @@
+'''
+This file is part of libsoundannotator. The library libsoundannotator is
+designed for processing sound using time-frequency representations.
+
+Copyright 2011-2014 Sensory Cognition Group, University of Groningen
+Copyright 2014-2017 SoundAppraisal BV
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+'''
+Shared memory transport for DataChunk payloads.
+
+A SharedMemoryConnection wraps the pipe the Board creates for a single
+subscription. Numpy payloads are copied into a slot of a ring of fixed size
+slots in a file backed shared memory segment, only a SharedMemoryDescriptor
+and the remaining chunk fields travel through the pipe. Payloads which are
+not plain numpy arrays or which do not fit in a slot are sent through the
+pipe unchanged.
+
+Every slot starts with a sequence number used as a seqlock. The sender makes
+it odd while writing and even when done, the receiver checks it before and
+after copying the payload out of the slot. A slot overwritten by a sender
+that lapped the ring is detected this way and the chunk is dropped, the
+compositeManager of the receiver then sees a discontinuity.
+
+A SubscriptionOrder for this transport gets sharedMemorySlots credits unless
+it has credits of its own, no more than sharedMemorySlots. With these
+default credits the sender waits for a slow reader instead of lapping it,
+so no chunks are lost, as with a pipe.
+
+Usage:
+    SubscriptionOrder('myTFProcessor','myStructureProcessor','E','E',
+        transport='sharedmemory', sharedMemorySlots=8, sharedMemorySlotSize=2**20)
+'''
+import copy, itertools, mmap, os, struct, tempfile
+import numpy as np
+
+
+class SharedMemoryDescriptor(object):
+    """ Replaces the data of a DataChunk while it travels through the pipe.
+    """
+    def __init__(self, slot, sequence, shape, dtype):
+        self.slot       = slot
+        self.sequence   = sequence
+        self.shape      = shape
+        self.dtype      = dtype
+
+
+class SharedMemoryRing(object):
+    """ Ring of fixed size slots in a file backed shared memory segment.
+
+        The Board allocates the segment, both ends of the subscription map
+        it after the Subscription has been received.
+    """
+    slotHeader = struct.Struct('=Q')
+    slotAlignment = 64
+    counter = itertools.count()
+
+    def __init__(self, filename, slots, slotsize):
+        self.filename   = filename
+        self.slots      = slots
+        self.slotsize   = slotsize
+        headersize      = max(self.slotHeader.size, self.slotAlignment)
+        self.headersize = headersize
+        self.stride     = headersize + int(np.ceil(slotsize/float(self.slotAlignment)))*self.slotAlignment
+        self.mapping    = None
+        self.sequence   = 0
+
+    @classmethod
+    def create(cls, name, slots, slotsize):
+        if os.path.isdir('/dev/shm'):
+            directory = '/dev/shm'
+        else:
+            directory = tempfile.gettempdir()
+
+        filename = os.path.join(directory, 'libsoundannotator-{0}-{1}-{2}'
+            .format(os.getpid(), name, cls.counter.next()))
+
+        ring = cls(filename, slots, slotsize)
+        with open(filename, 'wb') as f:
+            f.truncate(ring.slots*ring.stride)
+
+        return ring
+
+    def open(self):
+        if self.mapping is None:
+            fd = os.open(self.filename, os.O_RDWR)
+            try:
+                self.mapping = mmap.mmap(fd, self.slots*self.stride)
+            finally:
+                os.close(fd)
+
+    def close(self):
+        if self.mapping is not None:
+            self.mapping.close()
+            self.mapping = None
+
+    def unlink(self):
+        try:
+            os.unlink(self.filename)
+        except OSError:
+            pass
+
+    def fits(self, data):
+        return (type(data) is np.ndarray and
+            not data.dtype.hasobject and
+            data.nbytes <= self.slotsize)
+
+    def write(self, data):
+        self.sequence += 1
+        slot = self.sequence % self.slots
+        offset = slot*self.stride
+
+        self.slotHeader.pack_into(self.mapping, offset, 2*self.sequence-1)
+        target = np.ndarray(data.shape, data.dtype, buffer=self.mapping,
+            offset=offset+self.headersize)
+        target[...] = data
+        self.slotHeader.pack_into(self.mapping, offset, 2*self.sequence)
+
+        return SharedMemoryDescriptor(slot, self.sequence, data.shape, data.dtype.str)
+
+    def read(self, descriptor):
+        """ Copy the payload described by the descriptor out of the ring,
+            returns None if the slot was overwritten in the mean time.
+        """
+        offset = descriptor.slot*self.stride
+        expected = 2*descriptor.sequence
+
+        if self.slotHeader.unpack_from(self.mapping, offset)[0] != expected:
+            return None
+
+        data = np.ndarray(descriptor.shape, np.dtype(descriptor.dtype),
+            buffer=self.mapping, offset=offset+self.headersize).copy()
+
+        if self.slotHeader.unpack_from(self.mapping, offset)[0] != expected:
+            return None
+
+        return data
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['mapping'] = None
+        return state
+
+
+class SharedMemoryConnection(object):
+    """ Connection wrapper offering the poll/send/recv interface of a pipe
+        while passing numpy payloads through a SharedMemoryRing.
+    """
+    def __init__(self, connection, ring, logger=None):
+        self.connection = connection
+        self.ring       = ring
+        self.logger     = logger
+        self.ring.open()
+
+    def send(self, chunk):
+        if self.ring.fits(getattr(chunk, 'data', None)):
+            descriptor = self.ring.write(chunk.data)
+            chunk = copy.copy(chunk)
+            chunk.data = descriptor
+
+        self.connection.send(chunk)
+
+    def recv(self):
+        chunk = self.connection.recv()
+        descriptor = getattr(chunk, 'data', None)
+
+        if isinstance(descriptor, SharedMemoryDescriptor):
+            chunk.data = self.ring.read(descriptor)
+            if chunk.data is None:
+                if self.logger is not None:
+                    self.logger.warning('Shared memory slot {0} was overwritten before chunk {1} was read, dropping chunk'
+                        .format(descriptor.slot, chunk.number))
+                return None
+
+        return chunk
+
+    def poll(self, timeout=0.0):
+        return self.connection.poll(timeout)
+
+    def fileno(self):
+        return self.connection.fileno()
+
+    def close(self):
+        self.ring.close()
+        self.connection.close()
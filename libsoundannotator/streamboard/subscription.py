@@ -18,13 +18,38 @@ See the License for the specific language governing permissions and
 limitations under the License.
 '''
 import multiprocessing.reduction as reduction
-import sys, time
+import sys, time, cPickle
 import numpy as np
 try:
-    from network import NetworkMixin, NoNetworkException, BusyNetworkException, SocketBufferFullException
+    from network import NetworkMixin, NoNetworkException, BusyNetworkException, SocketBufferFullException, encodeFrame
 except AttributeError as e:
     from networkfallback import NetworkMixin, NoNetworkException, BusyNetworkException, SocketBufferFullException
+    encodeFrame = None
 from decimal import *
+from sharedmemory import SharedMemoryConnection
+from flowcontrol import CreditedConnection, CreditReturningConnection, FlowCounters, overflowPolicies
+
+def serializeChunk(chunk, wireformat='pickle'):
+    ''' Serialize a chunk once, the result can be written with send_bytes to
+        every connection of a fan-out using the same wireformat. Receiving
+        ends recv() it as usual.
+
+        wireformat: 'pickle' for pipes, 'frame' for network connections
+    '''
+    if wireformat == 'frame':
+        return encodeFrame(chunk, NetworkMixin._useCompression)
+    return cPickle.dumps(chunk, cPickle.HIGHEST_PROTOCOL)
+
+def payloadLength(payload):
+    ''' Bytes in a payload of serializeChunk, a frame is a list of buffers '''
+    if type(payload) is list:
+        return sum([len(buf) for buf in payload])
+    return len(payload)
+
+def subscriberLabel(order):
+    ''' Name of the subscriber of a subscription order, network
+        subscribers are named after their address '''
+    return getattr(order, 'subscriberName', None) or '{0}:{1}'.format(order.IP, order.port)
 
 class NetworkSubscriptionOrder(object):
     def __init__(self, senderKey, receiverKey, IP, port, **kwargs):
@@ -43,16 +68,37 @@ class SubscriptionOrder(object):
         self.subscriberName = subscriberName
         self.senderKey      = senderKey
         self.receiverKey    = receiverKey
+        self.transport      = kwargs.get('transport', 'pipe')
+        self.sharedMemorySlots      = kwargs.get('sharedMemorySlots', 8)
+        self.sharedMemorySlotSize   = kwargs.get('sharedMemorySlotSize', 2**20)
+        self.credits                = kwargs.get('credits', None)
+        self.overflowPolicy         = kwargs.get('overflowPolicy', 'block')
+        self.overflowQueueLength    = kwargs.get('overflowQueueLength', 1)
+        self.creditTimeout          = kwargs.get('creditTimeout', 1.0)
+
+        if not self.overflowPolicy in overflowPolicies:
+            raise ValueError('Unknown overflowPolicy {0}, expected one of {1}'.format(self.overflowPolicy, overflowPolicies))
+
+        if self.transport == 'sharedmemory':
+            # A sender may not lap the ring, it waits for the reader like it would on a full pipe
+            if self.credits is None:
+                self.credits        = self.sharedMemorySlots
+                self.creditTimeout  = kwargs.get('creditTimeout', None)
+            elif self.credits > self.sharedMemorySlots:
+                raise ValueError('{0} credits exceed the {1} sharedMemorySlots of the subscription of {2} to {3}'
+                    .format(self.credits, self.sharedMemorySlots, self.subscriberName, self.processorName))
 
     def list(self):
         return (self.processorName, self.subscriberName, self.senderKey, self.receiverKey,)
 
 class Subscription(object):
 
-    def __init__(self, connection, subscriptionorder,connectionReduced=False):
-        self.connectionReduced=False
+    def __init__(self, connection, subscriptionorder,connectionReduced=False, sharedMemoryRing=None):
+        self.connectionReduced=connectionReduced
         self.connection  = connection
         self.subscriptionorder = subscriptionorder
+        self.sharedMemoryRing = sharedMemoryRing
+        self.counters = FlowCounters()
         if not connectionReduced and not (subscriptionorder.__class__.__name__ == "NetworkSubscriptionOrder"):
             self.__reduceConnection()
             self.connectionReduced=True
@@ -67,13 +113,25 @@ class Subscription(object):
         else:
             self.connection = reduction.reduce_connection(self.connection)
 
-    def riseConnection(self,logger):
+    def riseConnection(self,logger,sending=False):
         if self.connectionReduced:
             logger.info('Connection for subscription to {0} with channel name {1} has risen!'.format(self.senderKey, self.receiverKey))
             red_conn = self.connection
             self.connection = red_conn[0](*red_conn[1])
             self.connectionReduced=False
 
+            if self.sharedMemoryRing is not None:
+                logger.info('Connection for subscription to {0} with channel name {1} uses shared memory segment {2}'.format(self.senderKey, self.receiverKey, self.sharedMemoryRing.filename))
+                self.connection = SharedMemoryConnection(self.connection, self.sharedMemoryRing, logger)
+
+            # A synchronous connection has delivered the chunk when send returns
+            if getattr(self.subscriptionorder, 'credits', None) is not None and not getattr(self.connection, 'synchronous', False):
+                logger.info('Connection for subscription to {0} with channel name {1} has {2} credits, overflow policy {3}'.format(self.senderKey, self.receiverKey, self.subscriptionorder.credits, self.subscriptionorder.overflowPolicy))
+                if sending:
+                    self.connection = CreditedConnection(self.connection, self.subscriptionorder, self.counters, logger)
+                else:
+                    self.connection = CreditReturningConnection(self.connection)
+
         else:
             logger.info('Connection to {0} with channel name {1} had risen already!'.format(self.senderKey, self.receiverKey))
 
@@ -123,9 +181,16 @@ class NetworkConnection(NetworkMixin):
 
     """Send a chunk of data, wait for a maximum of self.pollTimeout before returning"""
     def send(self, chunk):
+        self.__send(self.prepareSend, chunk)
+
+    """Send a chunk serialized by serializeChunk with self.wireformat, wait for a maximum of self.pollTimeout before returning"""
+    def send_bytes(self, payload):
+        self.__send(self.prepareSendSerialized, payload)
+
+    def __send(self, prepare, data):
         #send data to socket None, which defaults to the only one if there is only one registered
         try:
-            self.prepareSend(None, chunk)
+            prepare(None, data)
             self.pollSockets(self.pollTimeout)
         except NoNetworkException as e:
             self._logError("Unable to send: network disconnected.")
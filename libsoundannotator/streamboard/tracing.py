@@ -0,0 +1,148 @@
+'''
+This file is part of libsoundannotator. The library libsoundannotator is
+designed for processing sound using time-frequency representations.
+
+Copyright 2011-2014 Sensory Cognition Group, University of Groningen
+Copyright 2014-2017 SoundAppraisal BV
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+'''
+End to end tracing of chunks.
+
+A processor with a trace directory records, for the chunks whose number is
+a multiple of TraceSampling, when it received them per key, when it
+processed them, or generated them in case of an input processor, and when
+it published its result. All processors sample the
+same chunk numbers, so a sampled chunk can be followed from the input
+processor to the last output. Publish events carry the time since the input
+processors generated the data, from the dataGenerationTime of the chunk.
+
+The events are written in the trace event format of Chrome and Perfetto, one
+file per processor in the trace directory, and joined into a single trace
+with mergeTraces or Board.writeTrace. Open the result in chrome://tracing
+or https://ui.perfetto.dev, every processor is a track of its own.
+
+Usage:
+    b = Board(traceDir='/tmp/trace')
+    b.startProcessor('mic', MicInput, TraceSampling=10)
+    ...
+    b.stop()
+    b.writeTrace('pipeline.trace.json')
+'''
+import json, os, time, zlib
+
+
+def timestamp(t):
+    # Trace events count microseconds
+    return int(t*1e6)
+
+
+class ChunkTracer(object):
+    """ Buffers the trace events of one processor and appends them to
+        <tracedir>/<name>.trace.json, at most every flushInterval seconds.
+    """
+    def __init__(self, name, tracedir, sampling, flushInterval=1.0):
+        self.name = name
+        self.tracedir = tracedir
+        self.sampling = max(int(sampling), 1)
+        self.flushInterval = flushInterval
+        self.events = list()
+        self.pid = None
+        self.tid = zlib.crc32(name) & 0x7fffffff
+        self.flushed = time.time()
+        self.started = False
+
+    def sampled(self, number):
+        return number % self.sampling == 0
+
+    def event(self, name, phase, t, **args):
+        if self.pid is None:
+            # Only known in the process running the processor
+            self.pid = os.getpid()
+        event = {'name': name, 'cat': 'chunk', 'ph': phase, 'ts': timestamp(t),
+            'pid': self.pid, 'tid': self.tid, 'args': args}
+        if phase == 'i':
+            event['s'] = 't'
+        self.events.append(event)
+
+    def receive(self, key, chunk):
+        if self.sampled(chunk.number):
+            self.event('receive {0}'.format(key), 'i', time.time(), chunk=chunk.number, sender=chunk.processorname)
+
+    def process(self, number, start, end, name='process'):
+        if self.sampled(number):
+            self.event(name, 'X', start, chunk=number)
+            self.events[-1]['dur'] = timestamp(end) - timestamp(start)
+            self.flushIfDue(end)
+
+    def publish(self, number, generationTime):
+        if not self.sampled(number):
+            return
+        now = time.time()
+        args = dict(chunk=number)
+        if generationTime:
+            args['sinceInput'] = round((now - min(generationTime.values()))*1e3, 3)
+        self.event('publish', 'i', now, **args)
+        self.flushIfDue(now)
+
+    def flushIfDue(self, now):
+        if now - self.flushed > self.flushInterval:
+            self.flush()
+
+    def flush(self):
+        """ Append the buffered events. The file holds a JSON array without
+            its closing bracket, which trace viewers accept as well.
+        """
+        self.flushed = time.time()
+        if len(self.events) == 0:
+            return
+        with open(os.path.join(self.tracedir, '{0}.trace.json'.format(self.name)), 'a' if self.started else 'w') as f:
+            if not self.started:
+                f.write('[\n')
+                metadata = {'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': self.tid, 'args': {'name': self.name}}
+                f.write(json.dumps(metadata) + ',\n')
+                self.started = True
+            for event in self.events:
+                f.write(json.dumps(event) + ',\n')
+        self.events = list()
+
+
+def readTrace(filename):
+    """ The events in a trace file written by a ChunkTracer, a line cut
+        short by a processor stopped while writing is left out.
+    """
+    events = list()
+    with open(filename) as f:
+        for line in f:
+            line = line.strip().rstrip(',')
+            if line in ('', '[', ']'):
+                continue
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                continue
+    return events
+
+def mergeTraces(tracedir, filename):
+    """ Join the traces of all processors in tracedir into filename,
+        returns the number of events.
+    """
+    events = list()
+    for name in sorted(os.listdir(tracedir)):
+        if name.endswith('.trace.json'):
+            events.extend(readTrace(os.path.join(tracedir, name)))
+
+    with open(filename, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+    return len(events)
@@ -0,0 +1,56 @@
+'''
+This file is part of libsoundannotator. The library libsoundannotator is 
+designed for processing sound using time-frequency representations.
+
+Copyright 2011-2014 Sensory Cognition Group, University of Groningen
+Copyright 2014-2017 SoundAppraisal BV
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+from libsoundannotator.cpsp.oafilterbank_numpy import OAFilterbank
+from libsoundannotator.streamboard.continuity  import Continuity
+import logging, tempfile
+import numpy as np
+
+
+def makeFilterbank(filter_t):
+    filterbank = OAFilterbank(None, 'oafilterbank', logdir=tempfile.mkdtemp(), loglevel=logging.WARNING,
+        SampleRate=8000., TargetLatency=0.05)
+    filterbank.filter_t = filter_t
+    filterbank.prerun()
+    return filterbank
+
+def filterChunks(filter_t, chunks):
+    filterbank = makeFilterbank(filter_t)
+    continuities = [Continuity.discontinuous] + [Continuity.withprevious]*(len(chunks)-1)
+    return [filterbank.oafilter(chunk, continuity) for (chunk, continuity) in zip(chunks, continuities)]
+
+def checkRealSignalComplexKernel(filter_t, chunks):
+    # The real signal takes the rfft path, the same samples as complex ones the full complex path
+    real = filterChunks(filter_t, chunks)
+    complex = filterChunks(filter_t, [chunk.astype(np.complex64) for chunk in chunks])
+    for (r, c) in zip(real, complex):
+        assert(r.dtype == c.dtype and r.shape == c.shape)
+        np.testing.assert_allclose(r, c, rtol=1e-5, atol=1e-5)
+
+def test_real_signal_complex_kernel_1D():
+    np.random.seed(25)
+    filter_t = (np.random.randn(101) + 1j*np.random.randn(101))/10.
+    chunks = [np.random.randn(n).astype(np.float32) for n in (1000, 700, 1500)]
+    checkRealSignalComplexKernel(filter_t, chunks)
+
+def test_real_signal_complex_kernel_2D():
+    np.random.seed(25)
+    filter_t = (np.random.randn(101, 3) + 1j*np.random.randn(101, 3))/10.
+    chunks = [np.random.randn(n).astype(np.float32) for n in (1000, 700, 1500)]
+    checkRealSignalComplexKernel(filter_t, chunks)
@@ -376,7 +376,7 @@ class CompositeTester(processor.Processor):
                 if multiply is None:
                     multiply=compositeChunk.received[key].data
                 else:
-                    multiply*=compositeChunk.received[key].data
+                    multiply=multiply*compositeChunk.received[key].data
                     
                     
         if not set(self.compositeManager.sources) == set(scenarioline.sources):
@@ -386,8 +386,8 @@ class CompositeTester(processor.Processor):
             raise ValueError('incorrect initialSampleTime, recieved : {0:.6f} expected: {1:.6f} difference: {2:.6f}'.format(compositeChunk.initialSampleTime, scenarioline.initialSampleTime,compositeChunk.initialSampleTime-scenarioline.initialSampleTime))
         
         '''
-        if not self.compositeManager.compositeChunkList[indexfordebugger].identifier == scenarioline.identifier:
-            raise ValueError('compositeChunk has incorrect identifier,\n compositeChunk: |{0}| \n expected: |{1}|'.format(self.compositeManager.compositeChunkList[indexfordebugger].identifier, scenarioline.identifier))
+        if not self.compositeManager.compositeChunkRing[indexfordebugger].identifier == scenarioline.identifier:
+            raise ValueError('compositeChunk has incorrect identifier,\n compositeChunk: |{0}| \n expected: |{1}|'.format(self.compositeManager.compositeChunkRing[indexfordebugger].identifier, scenarioline.identifier))
         '''   
       
             
@@ -0,0 +1,146 @@
+'''
+This file is part of libsoundannotator. The library libsoundannotator is
+designed for processing sound using time-frequency representations.
+
+Copyright 2011-2014 Sensory Cognition Group, University of Groningen
+Copyright 2014-2017 SoundAppraisal BV
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+from libsoundannotator.streamboard              import processor
+from libsoundannotator.streamboard.batch        import CorpusRunner, ShardedRunner, readManifest
+from libsoundannotator.streamboard.continuity   import Continuity, processorAlignment
+from libsoundannotator.io.annotations           import FileAnnotation
+from libsoundannotator.tests.streamboard_test.test_offline import writeWav
+import numpy as np
+import json, logging, os, tempfile, wave
+
+
+class SampleCounter(processor.OutputProcessor):
+    requiredKeys = ['sound']
+
+    def __init__(self, boardConn, name, *args, **kwargs):
+        super(SampleCounter, self).__init__(boardConn, name, *args, **kwargs)
+        self.requiredParameters('outfile')
+
+    def prerun(self):
+        super(SampleCounter, self).prerun()
+        self.processorAlignments = dict()
+
+    def processData(self, compositeChunk):
+        if compositeChunk.continuity != Continuity.last:
+            with open(self.config['outfile'], 'a') as f:
+                f.write('{0}\n'.format(len(compositeChunk.received['sound'].data)))
+
+
+class MovingSum(processor.Processor):
+    requiredKeys = ['sound']
+    window = 8
+
+    def __init__(self, boardConn, name, *args, **kwargs):
+        super(MovingSum, self).__init__(boardConn, name, *args, **kwargs)
+        self.requiredParameters('SampleRate')
+        self.setProcessorAlignments()
+
+    def prerun(self):
+        super(MovingSum, self).prerun()
+        self.history = np.zeros(0, dtype=np.int64)
+
+    def setProcessorAlignments(self):
+        self.processorAlignments = {'sum': processorAlignment(droppedAfterDiscontinuity=self.window - 1, fsampling=self.config['SampleRate'])}
+
+    def processData(self, compositeChunk):
+        if compositeChunk.continuity < Continuity.withprevious:
+            self.history = np.zeros(0, dtype=np.int64)
+        signal = np.concatenate([self.history, compositeChunk.received['sound'].data.astype(np.int64)])
+        self.history = signal[-(self.window - 1):]
+        return {'sum': np.convolve(signal, np.ones(self.window, dtype=np.int64), 'valid')}
+
+
+spec = {
+    'processors': [
+        {'name': 'wav', 'class': 'libsoundannotator.streamboard.processors.input.wav.WavProcessor',
+         'parameters': {'SampleRate': 8000, 'ChunkSize': 100, 'timestep': 1.0, 'SoundFiles': []}},
+        {'name': 'reporter', 'class': 'libsoundannotator.tests.streamboard_test.test_inprocess.ProcessReporter',
+         'inputs': [{'from': 'wav', 'senderKey': 'sound'}], 'parameters': {'SampleRate': 8000}},
+        {'name': 'counter', 'class': 'libsoundannotator.tests.streamboard_test.test_batch.SampleCounter',
+         'inputs': [{'from': 'reporter', 'senderKey': 'sound'}], 'parameters': {'outfile': None}},
+    ]
+}
+
+def test_read_manifest():
+    directory = tempfile.mkdtemp()
+    filename = os.path.join(directory, 'manifest.txt')
+    with open(filename, 'w') as f:
+        f.write('/data/first.wav\n\n')
+        f.write(json.dumps({'file': '/data/second.wav', 'id': 'two', 'speaker': 'a'}) + '\n')
+    (first, second) = readManifest(filename)
+    assert(first.filehandle == '/data/first.wav' and first.file_id == 'first')
+    assert(second.file_id == 'two' and second.extra_args == {'speaker': 'a'})
+
+def test_corpus_runner():
+    directory = tempfile.mkdtemp()
+    lengths = {'a': 1000, 'b': 2500, 'c': 1800}
+    for (name, length) in lengths.items():
+        writeWav(os.path.join(directory, name + '.wav'), 8000, length)
+    with open(os.path.join(directory, 'manifest.txt'), 'w') as f:
+        f.write('\n'.join([os.path.join(directory, name + '.wav') for name in ['a', 'b', 'missing', 'c']]))
+
+    runner = CorpusRunner(spec, 'wav', readManifest(os.path.join(directory, 'manifest.txt')), workers=2,
+        route=lambda annotation: {'counter': {'outfile': os.path.join(directory, annotation.file_id + '.txt')}},
+        retries=1, timeout=20, resultsFile=os.path.join(directory, 'results.json'),
+        logdir=directory, loglevel=logging.ERROR)
+    assert(runner.sinks == ['reporter'])
+
+    results = runner.run()
+
+    assert([result.annotation.file_id for result in results] == ['a', 'b', 'missing', 'c'])
+    assert([result.status for result in results] == ['done', 'done', 'failed', 'done'])
+    assert(results[2].attempts == 2)
+    for (name, length) in lengths.items():
+        with open(os.path.join(directory, name + '.txt')) as f:
+            assert(sum([int(line) for line in f]) == length)
+    with open(os.path.join(directory, 'results.json')) as f:
+        assert(len(f.readlines()) == 4)
+    assert(runner.summary(results).startswith('3/4 files done, 1 failed'))
+
+def test_sharded_runner():
+    directory = tempfile.mkdtemp()
+    filename = os.path.join(directory, 'long.wav')
+    signal = np.random.randint(-1000, 1000, 20000).astype(np.int16)
+    writer = wave.open(filename, 'wb')
+    writer.setnchannels(1)
+    writer.setsampwidth(2)
+    writer.setframerate(8000)
+    writer.writeframes(signal.tostring())
+    writer.close()
+
+    shardedspec = {
+        'processors': [
+            spec['processors'][0],
+            {'name': 'sum', 'class': 'libsoundannotator.tests.streamboard_test.test_batch.MovingSum',
+             'inputs': [{'from': 'wav', 'senderKey': 'sound'}], 'parameters': {'SampleRate': 8000}},
+        ]
+    }
+    outfile = os.path.join(directory, 'long.npy')
+    runner = ShardedRunner(shardedspec, 'wav', FileAnnotation(filename, 'long'), 'sum', 'sum', outfile,
+        workers=3, timeout=20, logdir=directory, loglevel=logging.ERROR)
+    assert(runner.preroll == 100)
+    assert([segment.segment[1:3] for segment in runner.manifest] == [(0, 6700), (6700, 13300), (13300, 20000)])
+
+    results = runner.run()
+
+    assert([result.status for result in results] == ['done', 'done', 'done'])
+    expected = np.convolve(signal.astype(np.int64), np.ones(8, dtype=np.int64), 'valid')
+    assert(np.array_equal(np.load(outfile), expected))
@@ -0,0 +1,76 @@
+'''
+This file is part of libsoundannotator. The library libsoundannotator is 
+designed for processing sound using time-frequency representations.
+
+Copyright 2011-2014 Sensory Cognition Group, University of Groningen
+Copyright 2014-2017 SoundAppraisal BV
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+'''
+
+from libsoundannotator.streamboard.compositor   import DataChunk, compositeChunk
+from libsoundannotator.streamboard.continuity   import Continuity, chunkAlignment, processorAlignment
+import copy, cPickle
+import numpy as np
+
+
+def test_datachunk_defaults():
+    chunk1 = DataChunk(np.zeros(4), 0., 100, 'p', set(['p']))
+    chunk2 = DataChunk(np.zeros(4), 0., 100, 'p', set(['p']))
+    # No defaults shared between chunks
+    assert(chunk1.metadata is not chunk2.metadata)
+    assert(chunk1.dataGenerationTime is not chunk2.dataGenerationTime)
+    assert(chunk1.alignment is not chunk2.alignment)
+
+    try:
+        DataChunk(np.zeros(4), 0., 100, 'p', set(['p']), metadata=['not', 'a', 'dict'])
+        assert(False)
+    except ValueError:
+        pass
+
+def test_datachunk_pickle():
+    chunk = DataChunk(np.arange(6.).reshape(2,3), 1.5, 100, 'p', set(['p', 'q']), Continuity.discontinuous, 7,
+        alignment=processorAlignment(includedPast=3, fsampling=100), dataGenerationTime={'p': 1.},
+        metadata={'p': 'm'}, identifier='id', initialSampleTime=0.5)
+    # Attributes outside the slots survive as well
+    chunk.chunkcontinuity = Continuity.discontinuous
+
+    for received in [cPickle.loads(cPickle.dumps(chunk, cPickle.HIGHEST_PROTOCOL)), copy.copy(chunk)]:
+        np.testing.assert_equal(received.data, chunk.data)
+        assert((received.startTime, received.fs, received.processorname, received.sources) == (1.5, 100, 'p', set(['p', 'q'])))
+        assert((received.continuity, received.number, received.identifier) == (Continuity.discontinuous, 7, 'id'))
+        assert((received.dataGenerationTime, received.metadata, received.initialSampleTime) == ({'p': 1.}, {'p': 'm'}, 0.5))
+        assert(received.alignment == chunk.alignment and type(received.alignment) is processorAlignment)
+        assert(received.chunkcontinuity == Continuity.discontinuous)
+
+def test_compositechunk():
+    requiredKeys = frozenset(['a', 'b'])
+    composite = compositeChunk(3, requiredKeys)
+    # The required keys are shared, not copied per composite
+    assert(composite.requiredKeys is requiredKeys)
+    assert(composite.openKeys == set(['a', 'b']))
+
+    chunk = DataChunk(np.zeros(4), 0., 100, 'p', set(['p']), number=3)
+    assert(composite.update('a', chunk) == compositeChunk.incomplete)
+    assert(composite.openKeys == set(['b']))
+    for key in ['a', 'c']:
+        try:
+            composite.update(key, chunk)
+            assert(False)
+        except ValueError:
+            pass
+    assert(composite.update('b', chunk) == compositeChunk.complete)
+
+    received = cPickle.loads(cPickle.dumps(composite, cPickle.HIGHEST_PROTOCOL))
+    assert((received.number, received.status, sorted(received.received)) == (3, compositeChunk.complete, ['a', 'b']))
@@ -0,0 +1,97 @@
+'''
+This file is part of libsoundannotator. The library libsoundannotator is 
+designed for processing sound using time-frequency representations.
+
+Copyright 2011-2014 Sensory Cognition Group, University of Groningen
+Copyright 2014-2017 SoundAppraisal BV
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+'''
+
+from libsoundannotator.streamboard.subscription import SubscriptionOrder, Subscription
+from libsoundannotator.streamboard.flowcontrol  import CreditedConnection, CreditReturningConnection, Credit
+import multiprocessing, logging
+
+
+def makePair(**kwargs):
+    (toInput, toProcessor) = multiprocessing.Pipe()
+    order = SubscriptionOrder('sender', 'receiver', 'x', 'x', credits=2, overflowQueueLength=2, **kwargs)
+    subscription = Subscription(toInput, order, connectionReduced=True)
+    sender = CreditedConnection(toInput, order, subscription.counters, logging.getLogger('test_flowcontrol'))
+    receiver = CreditReturningConnection(toProcessor)
+    return sender, receiver, subscription.counters
+
+def receiveAll(receiver):
+    received = []
+    while receiver.poll(0.05):
+        received.append(receiver.recv())
+    return received
+
+def test_credits_limit_chunks_in_transit():
+    sender, receiver, counters = makePair(overflowPolicy='drop-newest')
+    for number in range(6):
+        sender.send(number)
+
+    # two sent, two queued, two dropped
+    assert(receiveAll(receiver) == [0, 1])
+    assert(counters.counts['droppedNewest'] == 2)
+
+    # returned credits release the queue
+    assert(sender.flush(1.0))
+    assert(receiveAll(receiver) == [2, 3])
+    assert(counters.counts['sent'] == 4)
+
+def test_drop_oldest():
+    sender, receiver, counters = makePair(overflowPolicy='drop-oldest')
+    for number in range(6):
+        sender.send_bytes(str(number))
+
+    assert([receiver.connection.recv_bytes() for i in range(2)] == ['0', '1'])
+    receiver.connection.send(Credit(2))
+    assert(sender.flush(1.0))
+    assert([receiver.connection.recv_bytes() for i in range(2)] == ['4', '5'])
+    assert(counters.counts['droppedOldest'] == 2)
+
+def test_coalesce():
+    sender, receiver, counters = makePair(overflowPolicy='coalesce')
+    for number in range(6):
+        sender.send(number)
+
+    assert(receiveAll(receiver) == [0, 1])
+    assert(sender.flush(1.0))
+    assert(receiveAll(receiver) == [5])
+    assert(counters.counts['coalesced'] == 3)
+
+def test_block_times_out():
+    sender, receiver, counters = makePair(overflowPolicy='block', creditTimeout=0.05)
+    for number in range(5):
+        sender.send(number)
+
+    assert(counters.counts['blocked'] == 1)
+    assert(counters.counts['timedOut'] == 1)
+    assert(counters.dropped() == 1)
+
+def test_subscriber_closed():
+    sender, receiver, counters = makePair(overflowPolicy='block', creditTimeout=5.0)
+    for number in range(4):
+        sender.send(number)
+
+    # Credits are pending when the subscriber goes away, nothing waits for them
+    receiver.close()
+    assert(not sender.flush(5.0))
+    sender.send(4)
+    assert(sender.closed)
+    assert(counters.counts['sent'] == 2)
+    assert(counters.counts['droppedClosed'] == 3)
+    assert(counters.counts['timedOut'] == 0)
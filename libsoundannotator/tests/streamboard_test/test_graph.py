@@ -0,0 +1,101 @@
+'''
+This file is part of libsoundannotator. The library libsoundannotator is 
+designed for processing sound using time-frequency representations.
+
+Copyright 2011-2014 Sensory Cognition Group, University of Groningen
+Copyright 2014-2017 SoundAppraisal BV
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+'''
+
+from nose.tools import raises
+from libsoundannotator.streamboard.graph        import PipelineGraph, GraphSpecError, placeProcessors
+from libsoundannotator.streamboard.board        import Board
+import logging, os, tempfile, time
+import psutil
+
+noise = 'libsoundannotator.streamboard.processors.input.noise.NoiseChunkGenerator'
+relay = 'libsoundannotator.tests.streamboard_test.test_inprocess.ProcessReporter'
+
+def makeSpec(senderKey='sound', receiverKey='sound', upstream='noise'):
+    return {
+        'processors': [
+            {'name': 'reporter', 'class': relay,
+             'inputs': [{'from': upstream, 'senderKey': senderKey, 'receiverKey': receiverKey}],
+             'parameters': {'SampleRate': 8000.}, 'cost': 2.0},
+            {'name': 'noise', 'class': noise,
+             'parameters': {'SampleRate': 8000., 'ChunkSize': 80, 'noofchunks': 5}, 'cost': 1.0},
+        ]
+    }
+
+def test_valid_graph():
+    graph = PipelineGraph(makeSpec())
+    graph.validate()
+    assert([node['name'] for node in graph.topologicalOrder()] == ['noise', 'reporter'])
+
+@raises(GraphSpecError)
+def test_unknown_processor():
+    PipelineGraph(makeSpec(upstream='mic')).validate()
+
+@raises(GraphSpecError)
+def test_missing_required_key():
+    PipelineGraph(makeSpec(receiverKey='timeseries')).validate()
+
+@raises(GraphSpecError)
+def test_unknown_sender_key():
+    spec = makeSpec()
+    spec['processors'].append({'name': 'second', 'class': relay,
+        'inputs': [{'from': 'reporter', 'senderKey': 'spectrum', 'receiverKey': 'sound'}],
+        'parameters': {'SampleRate': 8000.}})
+    PipelineGraph(spec).validate()
+
+@raises(GraphSpecError)
+def test_cycle():
+    spec = makeSpec()
+    spec['processors'][1]['inputs'] = [{'from': 'reporter', 'senderKey': 'sound'}]
+    PipelineGraph(spec).topologicalOrder()
+
+def test_placement():
+    placement = placeProcessors({'gcfb': 3.0, 'structure': 2.0, 'wav': 0.5, 'ptn': 1.0, 'out': 0.5}, [0, 1])
+    assert(placement['gcfb'] != placement['structure'])
+    assert(placement == {'gcfb': 0, 'structure': 1, 'ptn': 1, 'out': 0, 'wav': 1})
+
+def test_start_and_place():
+    logdir = tempfile.mkdtemp()
+    board = Board(loglevel=logging.ERROR, logdir=logdir)
+    spec = makeSpec()
+    spec['cores'] = [0]
+    try:
+        graph = PipelineGraph(spec)
+        board.startGraph(graph)
+        assert(set(board.processors.keys()) == set(['noise', 'reporter']))
+        assert(graph.placement == {'noise': 0, 'reporter': 0})
+        if hasattr(psutil.Process, 'cpu_affinity'):
+            assert(psutil.Process(board.processors['reporter'][0].pid).cpu_affinity() == [0])
+    finally:
+        board.stopallprocessors()
+
+def test_fan_out_start():
+    logdir = tempfile.mkdtemp()
+    board = Board(loglevel=logging.ERROR, logdir=logdir, fuseLinearChains=True)
+    spec = makeSpec()
+    second = dict(spec['processors'][0])
+    second['name'] = 'second'
+    spec['processors'].append(second)
+    try:
+        PipelineGraph(spec).start(board, place=False)
+        assert(set(board.processors.keys()) == set(['noise', 'reporter', 'second']))
+        assert(board.fused == set())
+    finally:
+        board.stopallprocessors()
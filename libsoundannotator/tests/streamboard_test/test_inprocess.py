@@ -0,0 +1,201 @@
+'''
+This file is part of libsoundannotator. The library libsoundannotator is 
+designed for processing sound using time-frequency representations.
+
+Copyright 2011-2014 Sensory Cognition Group, University of Groningen
+Copyright 2014-2017 SoundAppraisal BV
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+'''
+
+from libsoundannotator.streamboard              import processor
+from libsoundannotator.streamboard.board        import Board
+from libsoundannotator.streamboard.subscription import SubscriptionOrder
+from libsoundannotator.streamboard.continuity   import Continuity, processorAlignment
+from libsoundannotator.streamboard.compositor   import DataChunk
+from libsoundannotator.streamboard.inprocess    import localConnectionPair, openLocalConnection, \
+    DirectConnection, registerFusedProcessor, unregisterFusedProcessor
+from libsoundannotator.streamboard.processors.input.noise import NoiseChunkGenerator
+import logging, os, tempfile, time
+import numpy as np
+
+
+class InjectRecorder(object):
+    def __init__(self, name):
+        self.name = name
+        self.compositeManager = self
+        self.injected = []
+
+    def inject(self, receiverKey, chunk):
+        self.injected.append((receiverKey, chunk.number))
+
+
+class ProcessReporter(processor.Processor):
+    requiredKeys = ['sound']
+
+    def __init__(self, boardConn, name, *args, **kwargs):
+        super(ProcessReporter, self).__init__(boardConn, name, *args, **kwargs)
+        self.requiredParameters('SampleRate')
+
+    def prerun(self):
+        super(ProcessReporter, self).prerun()
+        self.setProcessorAlignments()
+
+    def setProcessorAlignments(self):
+        self.processorAlignments = {'sound': processorAlignment(fsampling=self.config['SampleRate'])}
+
+    def processData(self, compositeChunk):
+        return {
+            'sound': compositeChunk.received['sound'].data,
+            'pid': os.getpid(),
+        }
+
+
+def test_local_connection_by_reference():
+    (a, b) = localConnectionPair()
+    data = np.arange(10)
+    chunk = DataChunk(data, 0, 8000, 'sender', set(['sender']), number=1)
+
+    assert(not b.poll(0))
+    a.send(chunk)
+    assert(b.poll(0.1))
+    received = b.recv()
+    assert(received is not chunk)
+    assert(received.data is data)
+    assert(not b.poll(0))
+
+    b.send('reply')
+    assert(a.poll(0) and a.recv() == 'reply')
+
+def test_open_local_connection():
+    a = openLocalConnection('test', 0)
+    b = openLocalConnection('test', 1)
+    a.send(1)
+    assert(b.poll(0) and b.recv() == 1)
+    assert(openLocalConnection('test', 0) is not a)
+
+def test_hosted_processor():
+    logdir = tempfile.mkdtemp()
+    board = Board(loglevel=logging.ERROR, logdir=logdir)
+    try:
+        board.startProcessor('noise', NoiseChunkGenerator, SampleRate=8000., ChunkSize=80, noofchunks=20)
+        board.startProcessor('reporter', ProcessReporter,
+            SubscriptionOrder('noise', 'reporter', 'sound', 'sound'),
+            SampleRate=8000., host='noise')
+        subscription = board.getConnectionToProcessor(SubscriptionOrder('reporter', 'main', 'pid', 'pid'))
+        subscription.riseConnection(board.logger)
+
+        (numbers, pids) = ([], [])
+        deadline = time.time() + 10
+        while time.time() < deadline:
+            if subscription.connection.poll(0.1):
+                chunk = subscription.connection.recv()
+                numbers.append(chunk.number)
+                pids.append(chunk.data)
+                if chunk.continuity == Continuity.last:
+                    break
+
+        assert(len(numbers) >= 10 and numbers == range(numbers[0], 21))
+        assert(set(pids) == set([board.processors['noise'][0].pid]))
+        assert(board.isHealthy())
+    finally:
+        board.stopallprocessors()
+
+def test_fused_chain():
+    logdir = tempfile.mkdtemp()
+    board = Board(loglevel=logging.ERROR, logdir=logdir, fuseLinearChains=True)
+    try:
+        board.startProcessor('noise', NoiseChunkGenerator, SampleRate=8000., ChunkSize=80, noofchunks=20)
+        board.startProcessor('first', ProcessReporter,
+            SubscriptionOrder('noise', 'first', 'sound', 'sound'),
+            SampleRate=8000., fuseWith='noise')
+        board.startProcessor('second', ProcessReporter,
+            SubscriptionOrder('first', 'second', 'sound', 'sound'),
+            SampleRate=8000.)
+        assert(board.fused == set(['first', 'second']))
+        assert(board.getHost('second') == 'noise')
+
+        subscription = board.getConnectionToProcessor(SubscriptionOrder('second', 'main', 'pid', 'pid'))
+        subscription.riseConnection(board.logger)
+
+        chunks = []
+        deadline = time.time() + 10
+        while time.time() < deadline:
+            if subscription.connection.poll(0.1):
+                chunk = subscription.connection.recv()
+                chunks.append(chunk)
+                if chunk.continuity == Continuity.last:
+                    break
+
+        # the first chunks may pass before the main process subscribed
+        numbers = [chunk.number for chunk in chunks]
+        assert(len(numbers) >= 10 and numbers == range(numbers[0], 21))
+        assert(set([chunk.data for chunk in chunks]) == set([board.processors['noise'][0].pid]))
+    finally:
+        board.stopallprocessors()
+
+def test_fan_out_not_fused():
+    logdir = tempfile.mkdtemp()
+    board = Board(loglevel=logging.ERROR, logdir=logdir, fuseLinearChains=True)
+    try:
+        board.startProcessor('noise', NoiseChunkGenerator, SampleRate=8000., ChunkSize=80, noofchunks=20)
+        board.startProcessor('left', ProcessReporter,
+            SubscriptionOrder('noise', 'left', 'sound', 'sound'),
+            SampleRate=8000., fuseWith=False)
+        board.startProcessor('right', ProcessReporter,
+            SubscriptionOrder('noise', 'right', 'sound', 'sound'),
+            SampleRate=8000.)
+        # noise already has a subscriber, so right gets a process of its own
+        assert(board.fused == set())
+        assert(board.getHost('right') == 'right')
+    finally:
+        board.stopallprocessors()
+
+def test_fused_then_sibling_refused():
+    logdir = tempfile.mkdtemp()
+    board = Board(loglevel=logging.ERROR, logdir=logdir, fuseLinearChains=True)
+    try:
+        board.startProcessor('noise', NoiseChunkGenerator, SampleRate=8000., ChunkSize=80, noofchunks=20)
+        board.startProcessor('left', ProcessReporter,
+            SubscriptionOrder('noise', 'left', 'sound', 'sound'),
+            SampleRate=8000.)
+        assert(board.fused == set(['left']))
+
+        # a sibling would wait for left to finish every chunk in the publish of noise
+        try:
+            board.startProcessor('right', ProcessReporter,
+                SubscriptionOrder('noise', 'right', 'sound', 'sound'),
+                SampleRate=8000., fuseWith=False)
+            assert(False)
+        except ValueError:
+            pass
+        assert(not 'right' in board.processors)
+        assert(board.getConnectionToProcessor(SubscriptionOrder('noise', 'main', 'sound', 'sound')) is None)
+    finally:
+        board.stopallprocessors()
+
+def test_direct_connection_pending():
+    connection = DirectConnection('pendingSubscriber', 'sound')
+    connection.pendingLength = 3
+    for number in range(1, 6):
+        connection.send(DataChunk(np.arange(4), 0, 8000, 'sender', set(['sender']), number=number))
+    assert(connection.dropped == 2)
+
+    subscriber = InjectRecorder('pendingSubscriber')
+    registerFusedProcessor(subscriber)
+    try:
+        connection.send(DataChunk(np.arange(4), 0, 8000, 'sender', set(['sender']), number=6))
+    finally:
+        unregisterFusedProcessor(subscriber)
+    assert(subscriber.injected == [('sound', number) for number in range(3, 7)])
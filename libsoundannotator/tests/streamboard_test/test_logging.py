@@ -0,0 +1,87 @@
+'''
+This file is part of libsoundannotator. The library libsoundannotator is
+designed for processing sound using time-frequency representations.
+
+Copyright 2011-2014 Sensory Cognition Group, University of Groningen
+Copyright 2014-2017 SoundAppraisal BV
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+from libsoundannotator.streamboard.board        import Board
+from libsoundannotator.streamboard.subscription import SubscriptionOrder
+from libsoundannotator.streamboard.continuity   import Continuity
+from libsoundannotator.streamboard.logger       import QueueHandler, SamplingFilter
+from libsoundannotator.streamboard.processors.input.noise import NoiseChunkGenerator
+from libsoundannotator.tests.streamboard_test.test_inprocess import ProcessReporter
+import logging, os, Queue, tempfile, time
+
+
+def makeRecord(msg, *args):
+    return logging.LogRecord('test.chunks', logging.INFO, __file__, 0, msg, args, None)
+
+def test_sampling_filter():
+    sampling = SamplingFilter(every=3)
+    passed = [sampling.filter(makeRecord('chunk %s', number)) for number in range(7)]
+    assert(passed == [True, False, False, True, False, False, True])
+    # Every message is sampled on its own
+    assert(sampling.filter(makeRecord('other %s', 1)))
+
+    limited = SamplingFilter(rate=2)
+    passed = [limited.filter(makeRecord('chunk %s', number)) for number in range(5)]
+    assert(passed == [True, True, False, False, False])
+    assert(limited.suppressed == 3)
+
+def test_queue_handler_formats_lazily():
+    queue = Queue.Queue(1)
+    handler = QueueHandler(queue, 'test')
+    handler.emit(makeRecord('chunk %s of %s', 1, 'key'))
+    record = queue.get()
+    assert(record.msg == 'chunk %s of %s' and record.args == (1, 'key') and record.logfile == 'test')
+
+    # Arguments which might not pickle are formatted up front
+    handler.emit(makeRecord('chunk %s', object))
+    record = queue.get()
+    assert(record.args is None and record.msg.startswith('chunk <'))
+
+    handler.emit(makeRecord('first'))
+    handler.emit(makeRecord('second'))
+    assert(handler.dropped == 1)
+
+def test_log_writer():
+    logdir = tempfile.mkdtemp()
+    board = Board(loglevel=logging.INFO, logdir=logdir, asyncLogging=True)
+    try:
+        board.startProcessor('noise', NoiseChunkGenerator, SampleRate=8000., ChunkSize=80, noofchunks=20)
+        board.startProcessor('reporter', ProcessReporter,
+            SubscriptionOrder('noise', 'reporter', 'sound', 'sound'),
+            SampleRate=8000., ChunkLogSampling=10)
+        subscription = board.getConnectionToProcessor(SubscriptionOrder('reporter', 'main', 'sound', 'sound'))
+        subscription.riseConnection(board.logger)
+
+        deadline = time.time() + 10
+        while time.time() < deadline:
+            if subscription.connection.poll(0.1) and subscription.connection.recv().continuity == Continuity.last:
+                break
+        # Records still in the feeder threads of the processors
+        time.sleep(0.5)
+    finally:
+        board.stopallprocessors()
+        board.stopLogWriter()
+
+    with open(os.path.join(logdir, 'reporter.log')) as f:
+        lines = f.readlines()
+    assert(any(['Logger was attached to Processor reporter' in line for line in lines]))
+    received = [line for line in lines if 'Received a chunk for key sound' in line]
+    assert(0 < len(received) <= 3)
+    assert(os.path.exists(os.path.join(logdir, 'libsoundannotator.log')))
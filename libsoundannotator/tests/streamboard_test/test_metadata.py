@@ -0,0 +1,147 @@
+'''
+This file is part of libsoundannotator. The library libsoundannotator is 
+designed for processing sound using time-frequency representations.
+
+Copyright 2011-2014 Sensory Cognition Group, University of Groningen
+Copyright 2014-2017 SoundAppraisal BV
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+'''
+
+from libsoundannotator.streamboard.board        import Board
+from libsoundannotator.streamboard.subscription import SubscriptionOrder, Subscription
+from libsoundannotator.streamboard.continuity   import Continuity, chunkAlignment
+from libsoundannotator.streamboard.compositor   import compositeManager, DataChunk
+from libsoundannotator.streamboard.processor    import InputProcessor
+from libsoundannotator.streamboard.metadata     import MetadataCache, MetadataReference
+from libsoundannotator.streamboard.processors.input.noise import NoiseChunkGenerator
+from libsoundannotator.tests.streamboard_test.test_inprocess import ProcessReporter
+import cPickle, logging, multiprocessing, tempfile, time
+import numpy as np
+
+
+def test_references():
+    cache = MetadataCache()
+    description = ('hash', '{"SampleRate": 8000}')
+    references = cache.references({'noise': description})
+    assert(isinstance(references['noise'], MetadataReference))
+    # The same description is not hashed again, an equal one gets the same reference
+    assert(cache.references({'noise': description}) == references)
+    assert(cache.references({'noise': ('hash', '{"SampleRate": 8000}')}) == references)
+    assert(cache.references(references) == references)
+    assert(cache.announcements(references) == {references['noise']: description})
+
+    reference = cPickle.loads(cPickle.dumps(references['noise'], cPickle.HIGHEST_PROTOCOL))
+    assert(isinstance(reference, MetadataReference))
+
+    receiver = MetadataCache()
+    assert(receiver.resolve(references) == references)
+    receiver.learn(cache.announcements(references))
+    assert(receiver.resolve(dict(references, other=('x', 'y'))) == {'noise': description, 'other': ('x', 'y')})
+
+def test_announcements():
+    logdir = tempfile.mkdtemp()
+    board = Board(loglevel=logging.ERROR, logdir=logdir)
+    try:
+        board.startProcessor('noise', NoiseChunkGenerator, SampleRate=8000., ChunkSize=80, noofchunks=20)
+        board.startProcessor('reporter', ProcessReporter,
+            SubscriptionOrder('noise', 'reporter', 'sound', 'sound'),
+            SampleRate=8000., MetadataInterval=5)
+        subscription = board.getConnectionToProcessor(SubscriptionOrder('reporter', 'main', 'sound', 'sound'))
+        subscription.riseConnection(board.logger)
+
+        chunks = []
+        deadline = time.time() + 10
+        while time.time() < deadline:
+            if subscription.connection.poll(0.1):
+                chunk = subscription.connection.recv()
+                chunks.append(chunk)
+                if chunk.continuity == Continuity.last:
+                    break
+
+        assert(chunks[-1].continuity == Continuity.last)
+        assert(all([isinstance(reference, MetadataReference) for reference in chunks[0].metadata.values()]))
+        # Announced on the first chunk to the new subscriber, then every MetadataInterval chunks
+        announced = [index for (index, chunk) in enumerate(chunks) if chunk.announcements is not None]
+        assert(announced[0] == 0)
+        assert(all([later - earlier == 5 for (earlier, later) in zip(announced, announced[1:])]))
+
+        cache = MetadataCache()
+        cache.learn(chunks[0].announcements)
+        metadata = cache.resolve(chunks[-1].metadata)
+        assert(sorted(metadata.keys()) == ['noise', 'reporter'])
+        assert(metadata['reporter'][0] == board.processors['reporter'][0].getMetaData()[0])
+        assert('"noofchunks": 20' in metadata['noise'][1])
+    finally:
+        board.stopallprocessors()
+
+def test_resubscribe():
+    sender = InputProcessor(None, 'sender', logdir=tempfile.mkdtemp(), loglevel=logging.WARNING, SampleRate=8000.)
+    sender.prerun()
+    sender.processorAlignments = dict()
+
+    def subscribe():
+        (toSubscriber, fromSender) = multiprocessing.Pipe()
+        sender._subscribe(Subscription(toSubscriber, SubscriptionOrder('sender', 'receiver', 'sound', 'sound')))
+        return fromSender
+
+    def publish(number):
+        sender.publish({'sound': np.zeros(80)}, Continuity.withprevious, 0.01*number, number, {'sender': time.time()},
+            metadata={'sender': ('hash', '{}')})
+
+    receiver = subscribe()
+    publish(1)
+    publish(2)
+    assert([receiver.recv().announcements is not None for number in range(2)] == [True, False])
+
+    # A subscriber restarted with the same subscription knows nothing yet
+    receiver = subscribe()
+    publish(3)
+    assert(receiver.recv().announcements is not None)
+
+
+class ResolvingProcessor(object):
+    name = 'resolver'
+    logger = logging.getLogger('test_metadata')
+
+    def __init__(self):
+        self.config = dict()
+        self.metadataCache = MetadataCache()
+        self.processorAlignments = dict()
+        self.received = []
+
+    def getCachedMetaData(self):
+        return ('resolverhash', '{}')
+
+    def processData(self, composite):
+        self.received.append(composite)
+
+    def publish(self, *args, **kwargs):
+        pass
+
+def test_unknown_reference():
+    processor = ResolvingProcessor()
+    manager = compositeManager(['sound'], processor)
+    sender = MetadataCache()
+    references = sender.references({'noise': ('hash', '{}')})
+    for number in range(1, 4):
+        announcements = sender.announcements(references) if number == 3 else None
+        manager.inject('sound', DataChunk(np.zeros(80), 0.01*number, 8000., 'noise', set(['noise']),
+            number=number, alignment=chunkAlignment(fsampling=8000.), metadata=references, announcements=announcements))
+
+    # Unresolved references are left out and break continuity, once known they are resolved
+    resolved = {'noise': ('hash', '{}'), 'resolver': ('resolverhash', '{}')}
+    unresolved = {'resolver': ('resolverhash', '{}')}
+    assert([composite.metadata for composite in processor.received] == [unresolved, unresolved, resolved])
+    assert([composite.continuity for composite in processor.received] == [Continuity.discontinuous, Continuity.discontinuous, Continuity.withprevious])
@@ -0,0 +1,103 @@
+'''
+This file is part of libsoundannotator. The library libsoundannotator is
+designed for processing sound using time-frequency representations.
+
+Copyright 2011-2014 Sensory Cognition Group, University of Groningen
+Copyright 2014-2017 SoundAppraisal BV
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+from libsoundannotator.streamboard.board        import Board
+from libsoundannotator.streamboard.subscription import SubscriptionOrder
+from libsoundannotator.streamboard.continuity   import Continuity
+from libsoundannotator.streamboard.metrics      import MetricsRegistry, render
+from libsoundannotator.streamboard.processor    import InputProcessor
+from libsoundannotator.streamboard.processors.input.noise import NoiseChunkGenerator
+from libsoundannotator.tests.streamboard_test.test_inprocess import ProcessReporter
+import logging, os, socket, tempfile, time, urllib2
+import numpy as np
+
+
+def test_render():
+    registry = MetricsRegistry()
+    registry.count('chunks_in_total', key='sound')
+    registry.count('chunks_in_total', 2, key='sound')
+    registry.gauge('subscription_queue_depth', 3, subscriber='b', key='sound')
+    registry.observe('processdata_seconds', 0.003)
+    registry.observe('processdata_seconds', 10.0)
+
+    lines = render([registry.snapshot(processor='a')]).splitlines()
+    assert('# TYPE libsoundannotator_chunks_in_total counter' in lines)
+    assert('libsoundannotator_chunks_in_total{key="sound",processor="a"} 3.0' in lines)
+    assert('libsoundannotator_subscription_queue_depth{key="sound",processor="a",subscriber="b"} 3.0' in lines)
+    assert('libsoundannotator_processdata_seconds_bucket{le="0.0025",processor="a"} 0' in lines)
+    assert('libsoundannotator_processdata_seconds_bucket{le="0.005",processor="a"} 1' in lines)
+    assert('libsoundannotator_processdata_seconds_bucket{le="+Inf",processor="a"} 2' in lines)
+    assert('libsoundannotator_processdata_seconds_count{processor="a"} 2' in lines)
+
+def test_metrics_endpoint():
+    board = Board(loglevel=logging.INFO, logdir=tempfile.mkdtemp(), metricsPort=0)
+    try:
+        board.startProcessor('noise', NoiseChunkGenerator, SampleRate=8000., ChunkSize=80, noofchunks=20)
+        board.startProcessor('reporter', ProcessReporter,
+            SubscriptionOrder('noise', 'reporter', 'sound', 'sound'),
+            SampleRate=8000.)
+        subscription = board.getConnectionToProcessor(SubscriptionOrder('reporter', 'main', 'sound', 'sound'))
+        subscription.riseConnection(board.logger)
+
+        deadline = time.time() + 10
+        while time.time() < deadline:
+            if subscription.connection.poll(0.1) and subscription.connection.recv().continuity == Continuity.last:
+                break
+        # Processors write their last snapshot when they stop
+        board.stopallprocessors()
+        for (instance, connection) in board.processors.values():
+            instance.join(10)
+
+        lines = urllib2.urlopen('http://127.0.0.1:{0}/metrics'.format(board.metricsServer.server_port)).read().splitlines()
+        assert('libsoundannotator_chunks_in_total{key="sound",processor="reporter"} 20.0' in lines)
+        assert('libsoundannotator_chunks_out_total{key="sound",processor="noise"} 20.0' in lines)
+        assert('libsoundannotator_processdata_seconds_count{processor="reporter"} 20' in lines)
+
+        filename = os.path.join(board.metricsDir, 'metrics.prom')
+        board.writeMetrics(filename)
+        with open(filename) as f:
+            assert(f.read() == board.renderMetrics())
+    finally:
+        board.stop()
+
+def test_network_bytes():
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(1)
+    sender = InputProcessor(None, 'sender', logdir=tempfile.mkdtemp(), loglevel=logging.WARNING, SampleRate=8000.)
+    sender.prerun()
+    sender.processorAlignments = dict()
+    sender._subscribeNetwork({'senderKey': 'sound', 'interface': '127.0.0.1', 'port': listener.getsockname()[1], 'type': 'client'})
+    (receiver, address) = listener.accept()
+    try:
+        for number in range(1, 4):
+            sender.publish({'sound': np.zeros(800)}, Continuity.withprevious, 0.1*number, number, {'sender': time.time()})
+
+        # A network subscriber is named after its address, a frame counts all its buffers
+        counted = sender.metrics.counters[('bytes_sent_total', (('key', 'sound'), ('subscriber', '127.0.0.1:{0}'.format(listener.getsockname()[1]))))]
+        assert(counted > 3*800*8)
+        received = 0
+        receiver.settimeout(2)
+        while received < counted:
+            received += len(receiver.recv(65536))
+        assert(received == counted)
+    finally:
+        receiver.close()
+        listener.close()
@@ -0,0 +1,69 @@
+'''
+This file is part of libsoundannotator. The library libsoundannotator is
+designed for processing sound using time-frequency representations.
+
+Copyright 2011-2014 Sensory Cognition Group, University of Groningen
+Copyright 2014-2017 SoundAppraisal BV
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+from libsoundannotator.streamboard.board        import Board
+from libsoundannotator.streamboard.subscription import SubscriptionOrder
+from libsoundannotator.streamboard.continuity   import Continuity
+from libsoundannotator.streamboard.processors.input.wav import WavProcessor
+from libsoundannotator.io.annotations           import FileAnnotation
+import numpy as np
+import logging, os, tempfile, time, wave
+
+
+def writeWav(filename, samplerate, nframes):
+    writer = wave.open(filename, 'wb')
+    writer.setnchannels(1)
+    writer.setsampwidth(2)
+    writer.setframerate(samplerate)
+    writer.writeframes(np.arange(nframes, dtype=np.int16).tostring())
+    writer.close()
+
+def test_offline_wav():
+    logdir = tempfile.mkdtemp()
+    filename = os.path.join(logdir, 'offline.wav')
+    writeWav(filename, 8000, 16000)
+
+    board = Board(loglevel=logging.ERROR, logdir=logdir)
+    try:
+        # A timestep of a second would take minutes in real time
+        board.startProcessor('wav', WavProcessor, SampleRate=8000, ChunkSize=80, timestep=1.0,
+            SoundFiles=[FileAnnotation(filename, 'offline')], offline=True, offlineCredits=2)
+        subscription = board.getConnectionToProcessor(SubscriptionOrder('wav', 'main', 'sound', 'sound'))
+        subscription.riseConnection(board.logger)
+        assert(subscription.subscriptionorder.credits == 2)
+        board.startStreaming('wav')
+
+        # A slow start of the consumer holds up the reader instead of losing chunks
+        time.sleep(0.5)
+
+        chunks = []
+        deadline = time.time() + 20
+        while time.time() < deadline:
+            if subscription.connection.poll(0.1):
+                chunk = subscription.connection.recv()
+                chunks.append(chunk)
+                if chunk.continuity == Continuity.last:
+                    break
+
+        assert([chunk.number for chunk in chunks] == range(1, 202))
+        sound = np.concatenate([chunk.data for chunk in chunks[:-1]])
+        assert(np.array_equal(sound, np.arange(16000, dtype=np.int16)))
+    finally:
+        board.stopallprocessors()
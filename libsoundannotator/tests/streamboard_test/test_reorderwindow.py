@@ -0,0 +1,81 @@
+'''
+This file is part of libsoundannotator. The library libsoundannotator is 
+designed for processing sound using time-frequency representations.
+
+Copyright 2011-2014 Sensory Cognition Group, University of Groningen
+Copyright 2014-2017 SoundAppraisal BV
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+'''
+
+from libsoundannotator.streamboard.compositor   import compositeManager, DataChunk
+import logging
+
+
+class RecordingProcessor(object):
+    name = 'recorder'
+    logger = logging.getLogger('test_reorderwindow')
+
+    def __init__(self, **config):
+        self.config = config
+
+def makeManager(**config):
+    manager = compositeManager(['x', 'y'], RecordingProcessor(**config))
+    manager.processed = []
+    manager.processCompositeChunk = lambda index: manager.processed.append(manager.compositeChunkRing[index].number)
+    return manager
+
+def inject(manager, key, number):
+    manager.inject(key, DataChunk(None, 0, 1, 'sender', set(['sender']), number=number))
+
+def test_later_composite_evicts_earlier():
+    manager = makeManager()
+    for (key, number) in [('x', 1), ('x', 2), ('y', 2), ('y', 3), ('x', 3)]:
+        inject(manager, key, number)
+    assert(manager.processed == [2, 3])
+    assert(list(manager.evictions) == [(1, ['y'])])
+    assert(len(manager.compositeChunkRing) == 0)
+
+def test_capacity():
+    manager = makeManager(ReorderCapacity=4)
+    for number in range(1, 7):
+        inject(manager, 'x', number)
+    assert(manager.processed == [])
+    assert(len(manager.compositeChunkRing) == 4)
+    assert(list(manager.evictions) == [(1, ['y']), (2, ['y'])])
+    # the remaining composites can still complete
+    inject(manager, 'y', 4)
+    assert(manager.processed == [4])
+    assert(list(manager.evictions) == [(1, ['y']), (2, ['y']), (3, ['y'])])
+
+def test_jump_ahead():
+    manager = makeManager()
+    inject(manager, 'x', 1)
+    inject(manager, 'x', 1000000)
+    inject(manager, 'y', 1000000)
+    assert(manager.processed == [1000000])
+    assert(list(manager.evictions) == [(1, ['y'])])
+    # no composites were created for the numbers in between
+    assert(len(manager.compositeChunkRing.slots) == compositeManager.defaultCapacity)
+    assert(all([composite is None for composite in manager.compositeChunkRing.slots]))
+
+def test_strict_order_capacity():
+    manager = makeManager(ReorderCapacity=4)
+    manager.setStrictOrder(2)
+    assert(manager.compositeChunkRing.capacity == 9)
+    for (key, number) in [('x', 2), ('x', 1), ('y', 2)]:
+        inject(manager, key, number)
+    assert(manager.processed == [])
+    inject(manager, 'y', 1)
+    assert(manager.processed == [1, 2])
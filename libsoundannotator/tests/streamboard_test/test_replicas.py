@@ -0,0 +1,112 @@
+'''
+This file is part of libsoundannotator. The library libsoundannotator is 
+designed for processing sound using time-frequency representations.
+
+Copyright 2011-2014 Sensory Cognition Group, University of Groningen
+Copyright 2014-2017 SoundAppraisal BV
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+'''
+
+from libsoundannotator.streamboard.board        import Board
+from libsoundannotator.streamboard.subscription import SubscriptionOrder
+from libsoundannotator.streamboard.continuity   import Continuity, chunkAlignment, processorAlignment
+from libsoundannotator.streamboard.compositor   import compositeManager, DataChunk
+from libsoundannotator.streamboard.processors.input.noise import NoiseChunkGenerator
+from libsoundannotator.tests.streamboard_test.test_inprocess import ProcessReporter
+import logging, tempfile, time
+import numpy as np
+
+
+class RecordingProcessor(object):
+    name = 'recorder'
+    config = dict()
+    logger = logging.getLogger('test_replicas')
+
+def makeManager():
+    manager = compositeManager(['x'], RecordingProcessor())
+    manager.processed = []
+    manager.processCompositeChunk = lambda index: manager.processed.append(manager.compositeChunkRing[index].number)
+    return manager
+
+def inject(manager, number):
+    manager.inject('x', DataChunk(None, 0, 1, 'sender', set(['sender']), number=number))
+
+def test_strict_order():
+    manager = makeManager()
+    manager.setStrictOrder(2)
+    for number in [1, 3, 2, 5, 4, 6]:
+        inject(manager, number)
+    assert(manager.processed == [1, 2, 3, 4, 5, 6])
+
+def test_reorder_window():
+    manager = makeManager()
+    manager.setStrictOrder(1)
+    for number in [1, 3, 4, 5]:
+        inject(manager, number)
+    assert(manager.processed == [1])
+    # chunk 2 never arrives and is given up when the window of 4 overflows
+    inject(manager, 6)
+    assert(manager.processed == [1, 3, 4, 5, 6])
+
+class LookBackProcessor(object):
+    name = 'lookback'
+    logger = logging.getLogger('test_replicas')
+
+    def __init__(self, **alignment):
+        self.config = {'numberStride': 2}
+        self.processorAlignments = {'y': processorAlignment(fsampling=100, **alignment)}
+
+def test_lookback_refused():
+    for (alignments, processoralignment) in [((0, 0), {'includedPast': 3}), ((0, 0), {'droppedAfterDiscontinuity': 3}), ((2, 0), {})]:
+        manager = compositeManager(['x', 'z'], LookBackProcessor(**processoralignment))
+        manager.inject('x', DataChunk(np.zeros(10), 0, 100, 'sender', set(['sender']), number=1, alignment=chunkAlignment(includedPast=alignments[0], fsampling=100)))
+        try:
+            manager.inject('z', DataChunk(np.zeros(10), 0, 100, 'sender', set(['sender']), number=1, alignment=chunkAlignment(includedPast=alignments[1], fsampling=100)))
+            assert(False)
+        except ValueError as e:
+            assert('Only stateless processors can be replicated' in str(e))
+
+def test_replicated_processor():
+    logdir = tempfile.mkdtemp()
+    board = Board(loglevel=logging.ERROR, logdir=logdir)
+    try:
+        board.startProcessor('noise', NoiseChunkGenerator, SampleRate=8000., ChunkSize=80, noofchunks=20)
+        board.startProcessor('reporter', ProcessReporter,
+            SubscriptionOrder('noise', 'reporter', 'sound', 'sound'),
+            SampleRate=8000., replicas=2)
+        board.startProcessor('collector', ProcessReporter,
+            SubscriptionOrder('reporter', 'collector', 'sound', 'sound'),
+            SampleRate=8000.)
+        assert(board.replicas['reporter'] == ['reporter#0', 'reporter#1'])
+
+        subscription = board.getConnectionToProcessor(SubscriptionOrder('collector', 'main', 'sound', 'sound'))
+        subscription.riseConnection(board.logger)
+
+        chunks = []
+        deadline = time.time() + 10
+        while time.time() < deadline:
+            if subscription.connection.poll(0.1):
+                chunk = subscription.connection.recv()
+                chunks.append(chunk)
+                if chunk.continuity == Continuity.last:
+                    break
+
+        # the first chunks may pass before the main process subscribed
+        numbers = [chunk.number for chunk in chunks]
+        assert(len(numbers) >= 10 and numbers == range(numbers[0], 21))
+        # every replica starts its own stream discontinuously
+        assert(all([chunk.continuity == Continuity.withprevious for chunk in chunks[:-1] if chunk.number > 2]))
+    finally:
+        board.stopallprocessors()
@@ -0,0 +1,106 @@
+'''
+This file is part of libsoundannotator. The library libsoundannotator is 
+designed for processing sound using time-frequency representations.
+
+Copyright 2011-2014 Sensory Cognition Group, University of Groningen
+Copyright 2014-2017 SoundAppraisal BV
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+'''
+
+from libsoundannotator.streamboard.compositor   import rollingBuffer, compositeManager, DataChunk
+from libsoundannotator.streamboard.continuity   import Continuity, chunkAlignment, processorAlignment
+import logging
+import numpy as np
+
+
+def chunks(noofchunks, length, rows=3):
+    stream = np.arange(noofchunks*length*rows, dtype=np.float32).reshape((rows, noofchunks*length), order='F')
+    return [stream[:, number*length:(number+1)*length] for number in range(noofchunks)]
+
+def test_lookback():
+    history = rollingBuffer()
+    lookback = 4
+    previous = None
+    views = []
+    for chunk in chunks(20, 10):
+        start = history.append(chunk, lookback)
+        if previous is not None:
+            view = history.view(start-lookback, start+10-lookback)
+            expected = np.concatenate((previous[:, 10-lookback:], chunk[:, :10-lookback]), axis=1)
+            assert(np.array_equal(view, expected))
+            views.append((view, expected.copy()))
+        previous = chunk
+    # Views handed out are not overwritten by later chunks
+    assert(all([np.array_equal(view, expected) for (view, expected) in views]))
+
+def test_reuse():
+    history = rollingBuffer()
+    buffers = set()
+    for chunk in chunks(20, 10):
+        start = history.append(chunk, 4)
+        assert(np.array_equal(history.view(start, start+10), chunk))
+        buffers.add(id(history.buffer))
+    # Without views left the buffer is reused
+    assert(len(buffers) == 1)
+
+def test_shape_change():
+    history = rollingBuffer()
+    history.append(np.zeros((3, 10)), 4)
+    start = history.append(np.ones((5, 10)), 4)
+    assert(start == 0 and history.buffer.shape[0] == 5)
+
+class ModifyingProcessor(object):
+    """ Tries to change its input in place
+    """
+    name = 'modifier'
+    logger = logging.getLogger('test_rollingbuffer')
+
+    def __init__(self):
+        self.config = dict()
+        self.metadataCache = None
+        self.processorAlignments = {'sound': processorAlignment(fsampling=8000.)}
+        self.received = []
+        self.refused = 0
+
+    def getCachedMetaData(self):
+        return None
+
+    def processData(self, composite):
+        data = composite.received['late'].data
+        self.received.append(data.copy())
+        try:
+            data[...] = -1
+        except ValueError:
+            self.refused += 1
+
+    def publish(self, *args, **kwargs):
+        pass
+
+def test_readonly_views():
+    processor = ModifyingProcessor()
+    manager = compositeManager(['early', 'late'], processor)
+    stream = np.arange(400, dtype=np.float32)
+    for number in range(1, 5):
+        chunk = stream[(number-1)*100:number*100]
+        # early includes 10 frames of the past, late is aligned by looking back 10 frames in its history
+        for (key, includedPast) in (('early', 10), ('late', 0)):
+            manager.inject(key, DataChunk(chunk, 0.0125*number, 8000., 'noise', set(['noise']),
+                continuity=Continuity.withprevious, number=number,
+                alignment=chunkAlignment(includedPast=includedPast, fsampling=8000.)))
+
+    # Writing to the input fails, the look-back of the next composite is intact
+    assert(len(processor.received) >= 3 and processor.refused == len(processor.received))
+    assert(np.array_equal(processor.received[-1], stream[290:390]))
+    assert(np.array_equal(processor.received[-2], stream[190:290]))
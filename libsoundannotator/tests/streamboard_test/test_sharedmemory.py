@@ -0,0 +1,112 @@
+'''
+This file is part of libsoundannotator. The library libsoundannotator is 
+designed for processing sound using time-frequency representations.
+
+Copyright 2011-2014 Sensory Cognition Group, University of Groningen
+Copyright 2014-2017 SoundAppraisal BV
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+'''
+
+from nose import with_setup
+from nose.tools import raises
+from libsoundannotator.streamboard.sharedmemory import SharedMemoryRing, SharedMemoryConnection
+from libsoundannotator.streamboard.subscription import SubscriptionOrder
+from libsoundannotator.streamboard.flowcontrol  import CreditedConnection, CreditReturningConnection, FlowCounters
+from libsoundannotator.streamboard.compositor   import DataChunk
+from libsoundannotator.streamboard.continuity   import Continuity
+import multiprocessing, logging, threading, time
+import numpy as np
+
+
+def my_setup_function():
+    global ring, sender, receiver
+    ring = SharedMemoryRing.create('test', 4, 4096)
+    (toInput, toProcessor) = multiprocessing.Pipe()
+    sender = SharedMemoryConnection(toInput, SharedMemoryRing(ring.filename, ring.slots, ring.slotsize))
+    receiver = SharedMemoryConnection(toProcessor, SharedMemoryRing(ring.filename, ring.slots, ring.slotsize), logging.getLogger('test_sharedmemory'))
+
+def my_teardown_function():
+    global ring, sender, receiver
+    sender.close()
+    receiver.close()
+    ring.unlink()
+
+def makeChunk(data, number):
+    return DataChunk(data, 0.0, 8000, 'sender', set(['sender']), continuity=Continuity.withprevious, number=number)
+
+@with_setup(my_setup_function, my_teardown_function)
+def test_array_roundtrip():
+    data = (np.arange(200, dtype=np.float32).reshape(10,20)+1j).astype(np.complex64)
+    chunk = makeChunk(data[:, ::2], 3)
+    sender.send(chunk)
+
+    assert(receiver.poll(1))
+    received = receiver.recv()
+    assert(received.number == 3)
+    assert(received.continuity == Continuity.withprevious)
+    assert(received.data.dtype == np.complex64)
+    assert(np.array_equal(received.data, data[:, ::2]))
+    # the chunk handed to send is left untouched
+    assert(chunk.data is not None and chunk.data.shape == (10,10))
+
+@with_setup(my_setup_function, my_teardown_function)
+def test_fallback_to_pipe():
+    large = np.zeros(4096, dtype=np.float64)
+    sender.send(makeChunk(large, 1))
+    sender.send(makeChunk({'patches': [1, 2, 3]}, 2))
+
+    assert(np.array_equal(receiver.recv().data, large))
+    assert(receiver.recv().data == {'patches': [1, 2, 3]})
+
+@with_setup(my_setup_function, my_teardown_function)
+def test_lapped_slot_is_dropped():
+    for number in range(1, 6):
+        sender.send(makeChunk(np.ones(16)*number, number))
+
+    # Chunk 1 shares its slot with chunk 5 and has been overwritten
+    assert(receiver.recv() is None)
+    for number in range(2, 6):
+        assert(np.array_equal(receiver.recv().data, np.ones(16)*number))
+
+@with_setup(my_setup_function, my_teardown_function)
+def test_slow_reader_gets_every_chunk():
+    order = SubscriptionOrder('sender', 'receiver', 'x', 'x', transport='sharedmemory', sharedMemorySlots=ring.slots)
+    assert(order.credits == ring.slots and order.creditTimeout is None)
+    counters = FlowCounters()
+    credited = CreditedConnection(sender, order, counters)
+
+    def publish():
+        for number in range(1, 13):
+            credited.send(makeChunk(np.ones(16)*number, number))
+        # as publish does for the last chunk
+        credited.flush(order.creditTimeout)
+    publisher = threading.Thread(target=publish)
+    publisher.start()
+
+    reader = CreditReturningConnection(receiver)
+    received = []
+    for number in range(1, 13):
+        time.sleep(0.02)
+        received.append(reader.recv())
+    publisher.join(5)
+
+    assert(not publisher.is_alive())
+    assert([chunk.number for chunk in received] == range(1, 13))
+    assert(all([np.array_equal(chunk.data, np.ones(16)*chunk.number) for chunk in received]))
+    assert(counters.dropped() == 0)
+
+@raises(ValueError)
+def test_credits_exceed_slots():
+    SubscriptionOrder('sender', 'receiver', 'x', 'x', transport='sharedmemory', sharedMemorySlots=4, credits=5)
@@ -0,0 +1,69 @@
+'''
+This file is part of libsoundannotator. The library libsoundannotator is
+designed for processing sound using time-frequency representations.
+
+Copyright 2011-2014 Sensory Cognition Group, University of Groningen
+Copyright 2014-2017 SoundAppraisal BV
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+from libsoundannotator.streamboard.board        import Board
+from libsoundannotator.streamboard.subscription import SubscriptionOrder
+from libsoundannotator.streamboard.continuity   import Continuity
+from libsoundannotator.streamboard.processors.input.noise import NoiseChunkGenerator
+from libsoundannotator.tests.streamboard_test.test_inprocess import ProcessReporter
+import json, logging, os, tempfile, time
+
+
+def test_chunk_trace():
+    tracedir = tempfile.mkdtemp()
+    board = Board(loglevel=logging.INFO, logdir=tempfile.mkdtemp(), traceDir=tracedir)
+    try:
+        board.startProcessor('noise', NoiseChunkGenerator, SampleRate=8000., ChunkSize=80, noofchunks=20, TraceSampling=5)
+        board.startProcessor('reporter', ProcessReporter,
+            SubscriptionOrder('noise', 'reporter', 'sound', 'sound'),
+            SampleRate=8000., TraceSampling=5)
+        subscription = board.getConnectionToProcessor(SubscriptionOrder('reporter', 'main', 'sound', 'sound'))
+        subscription.riseConnection(board.logger)
+
+        deadline = time.time() + 10
+        while time.time() < deadline:
+            if subscription.connection.poll(0.1) and subscription.connection.recv().continuity == Continuity.last:
+                break
+    finally:
+        board.stopallprocessors()
+        # Processors write their last events when they stop
+        for (instance, connection) in board.processors.values():
+            instance.join(10)
+
+    filename = os.path.join(tracedir, 'pipeline.json')
+    board.writeTrace(filename)
+    with open(filename) as f:
+        events = json.load(f)['traceEvents']
+
+    tracks = dict([(event['tid'], event['args']['name']) for event in events if event['ph'] == 'M'])
+    assert(sorted(tracks.values()) == ['noise', 'reporter'])
+
+    def chunks(processor, name):
+        return sorted([event['args']['chunk'] for event in events
+            if tracks.get(event['tid']) == processor and event['name'] == name])
+
+    # Every processor samples the same chunk numbers
+    assert(chunks('noise', 'generate') == [5, 10, 15, 20])
+    assert(chunks('noise', 'publish') == [5, 10, 15, 20])
+    assert(chunks('reporter', 'receive sound') == [5, 10, 15, 20])
+    assert(chunks('reporter', 'process') == [5, 10, 15, 20])
+    assert(chunks('reporter', 'publish') == [5, 10, 15, 20])
+    assert(all([event['dur'] >= 0 for event in events if event['ph'] == 'X']))
+    assert(all([event['args']['sinceInput'] >= 0 for event in events if event['name'] == 'publish']))
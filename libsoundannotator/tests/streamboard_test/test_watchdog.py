@@ -0,0 +1,118 @@
+'''
+This file is part of libsoundannotator. The library libsoundannotator is
+designed for processing sound using time-frequency representations.
+
+Copyright 2011-2014 Sensory Cognition Group, University of Groningen
+Copyright 2014-2017 SoundAppraisal BV
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+from libsoundannotator.streamboard.board        import Board
+from libsoundannotator.streamboard.subscription import SubscriptionOrder
+from libsoundannotator.streamboard.continuity   import Continuity
+from libsoundannotator.streamboard.processors.input.noise import NoiseChunkGenerator
+from libsoundannotator.tests.streamboard_test.test_inprocess import ProcessReporter
+import logging, os, tempfile, time
+
+
+def failOnce(marker, failure):
+    """ Leave a marker and crash or hang, unless the marker is already there
+    """
+    if os.path.exists(marker):
+        return
+    open(marker, 'w').close()
+    if failure == 'hang':
+        time.sleep(3600)
+    os._exit(1)
+
+class FailingReporter(ProcessReporter):
+
+    def processData(self, compositeChunk):
+        if compositeChunk.number >= self.config['failAt']:
+            failOnce(self.config['marker'], self.config['failure'])
+        return super(FailingReporter, self).processData(compositeChunk)
+
+class FailingNoise(NoiseChunkGenerator):
+
+    def generateData(self):
+        if self.getchunknumber() >= self.config['failAt']:
+            failOnce(self.config['marker'], 'crash')
+        return super(FailingNoise, self).generateData()
+
+
+def collect(subscription, timeout=15):
+    chunks = []
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if subscription.connection.poll(0.1):
+            chunk = subscription.connection.recv()
+            chunks.append(chunk)
+            if chunk.continuity == Continuity.last:
+                break
+    return chunks
+
+def restartReporter(failure):
+    logdir = tempfile.mkdtemp()
+    board = Board(loglevel=logging.INFO, logdir=logdir, heartbeatInterval=0.1, heartbeatTimeout=1.0)
+    try:
+        board.startProcessor('noise', NoiseChunkGenerator, SampleRate=8000., ChunkSize=80, noofchunks=60)
+        board.startProcessor('reporter', FailingReporter,
+            SubscriptionOrder('noise', 'reporter', 'sound', 'sound'),
+            SampleRate=8000., failAt=20, failure=failure, marker=os.path.join(logdir, 'failed'))
+        subscription = board.getConnectionToProcessor(SubscriptionOrder('reporter', 'main', 'pid', 'pid'))
+        subscription.riseConnection(board.logger)
+        firstPid = board.processors['reporter'][0].pid
+
+        chunks = collect(subscription)
+
+        assert(board.restarts == {'reporter': 1})
+        assert(chunks[-1].continuity == Continuity.last)
+        before = [chunk for chunk in chunks if chunk.data == firstPid]
+        after = [chunk for chunk in chunks if chunk.data != firstPid]
+        assert(before[-1].number < 20 and after[0].number > 20)
+        assert(after[0].continuity == Continuity.discontinuous)
+        assert(set([chunk.data for chunk in after]) == set([board.processors['reporter'][0].pid]))
+        assert(board.isHealthy())
+    finally:
+        board.stopallprocessors()
+
+def test_restart_crashed_processor():
+    restartReporter('crash')
+
+def test_restart_hung_processor():
+    restartReporter('hang')
+
+def test_restart_input_processor():
+    logdir = tempfile.mkdtemp()
+    board = Board(loglevel=logging.INFO, logdir=logdir, heartbeatInterval=0.1, heartbeatTimeout=1.0)
+    try:
+        board.startProcessor('noise', FailingNoise, SampleRate=8000., ChunkSize=80, noofchunks=100,
+            failAt=30, marker=os.path.join(logdir, 'failed'))
+        board.startProcessor('reporter', ProcessReporter,
+            SubscriptionOrder('noise', 'reporter', 'sound', 'sound'),
+            SampleRate=8000.)
+        subscription = board.getConnectionToProcessor(SubscriptionOrder('reporter', 'main', 'sound', 'sound'))
+        subscription.riseConnection(board.logger)
+
+        chunks = collect(subscription)
+
+        assert(board.restarts == {'noise': 1})
+        numbers = [chunk.number for chunk in chunks]
+        assert(numbers == sorted(numbers))
+        # Numbering goes on after the failure, skipping at least one number
+        restart = [index for index in range(1, len(numbers)) if numbers[index] != numbers[index-1] + 1]
+        assert(len(restart) == 1 and numbers[restart[0]-1] == 29)
+        assert(chunks[restart[0]].continuity == Continuity.discontinuous)
+    finally:
+        board.stopallprocessors()
@@ -0,0 +1,106 @@
+'''
+This file is part of libsoundannotator. The library libsoundannotator is 
+designed for processing sound using time-frequency representations.
+
+Copyright 2011-2014 Sensory Cognition Group, University of Groningen
+Copyright 2014-2017 SoundAppraisal BV
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+'''
+
+from nose import with_setup
+from libsoundannotator.streamboard.network      import NetworkMixin, SocketState, encodeFrame
+from libsoundannotator.streamboard.compositor   import DataChunk
+from libsoundannotator.streamboard.continuity   import Continuity, chunkAlignment
+import socket, logging
+import numpy as np
+
+
+def my_setup_function():
+    global sender, receiver, sendsock, recvsock
+    (sendsock, recvsock) = socket.socketpair()
+    recvsock.setblocking(False)
+    sender = NetworkMixin()
+    sender.logger = logging.getLogger('test_wireformat')
+    sender._sockets = {sendsock.fileno(): sendsock}
+    receiver = NetworkMixin()
+    receiver.logger = logging.getLogger('test_wireformat')
+    receiver._sockets = {recvsock.fileno(): recvsock}
+
+def my_teardown_function():
+    global sender, receiver, sendsock, recvsock
+    for sock in [sendsock, recvsock]:
+        for table in [NetworkMixin._socketstates, NetworkMixin._socketdata, NetworkMixin._socketmsglengths, NetworkMixin._socketframes,
+                NetworkMixin._socketrecvbuffers, NetworkMixin._socketrecvfilled]:
+            table.pop(sock, None)
+        sock.close()
+
+def makeChunk(data, number):
+    return DataChunk(data, 12.5, 8000, 'sender', set(['sender']),
+        continuity=Continuity.withprevious,
+        number=number,
+        alignment=chunkAlignment(includedPast=3, fsampling=8000),
+        metadata={'sender': ('hash', '{}')})
+
+@with_setup(my_setup_function, my_teardown_function)
+def test_frame_roundtrip():
+    data = np.random.randn(100, 64).astype(np.complex64)
+    chunk = makeChunk(data[:, 1::2], 7)
+
+    sender.prepareSend(None, chunk)
+    assert(sender._sendall(sendsock) == SocketState.END)
+
+    received = receiver._receiveFrame(recvsock)
+    assert(received.number == 7)
+    assert(received.startTime == 12.5)
+    assert(received.alignment.includedPast == 3)
+    assert(received.metadata == {'sender': ('hash', '{}')})
+    assert(received.data.dtype == np.complex64)
+    assert(np.array_equal(received.data, data[:, 1::2]))
+    assert(chunk.data.shape == (100, 32))
+
+@with_setup(my_setup_function, my_teardown_function)
+def test_partial_reads():
+    data = np.arange(1000, dtype=np.float64)
+    payload = ''.join([memoryview(b).tobytes() for b in encodeFrame(makeChunk(data, 1))]) + \
+        ''.join([memoryview(b).tobytes() for b in encodeFrame(makeChunk({'patches': [1, 2]}, 2))])
+
+    received = []
+    for start in range(0, len(payload), 7):
+        sendsock.sendall(payload[start:start+7])
+        message = receiver._receiveFrame(recvsock)
+        if message is not None:
+            received.append(message)
+
+    # a frame completed halfway a read leaves the next one waiting in the socket
+    message = receiver._receiveFrame(recvsock)
+    while message is not None:
+        received.append(message)
+        message = receiver._receiveFrame(recvsock)
+
+    assert(len(received) == 2)
+    assert(np.array_equal(received[0].data, data))
+    assert(received[1].data == {'patches': [1, 2]})
+    assert(receiver._socketrecvfilled.get(recvsock, 0) == 0)
+
+@with_setup(my_setup_function, my_teardown_function)
+def test_receive_buffer_reused():
+    for number in range(3):
+        sender.prepareSend(None, makeChunk(np.zeros(10), number))
+        sender._sendall(sendsock)
+        received = receiver._receiveFrame(recvsock)
+        assert(received.number == number)
+        if number == 0:
+            buf = receiver._socketrecvbuffers[recvsock]
+        assert(receiver._socketrecvbuffers[recvsock] is buf)